@@ -0,0 +1,25 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Benchmarks of pbr against synthetic git repositories.
+
+pbr.benchmarks.repo generates repositories of a given size, and
+pbr.benchmarks.suite times pbr's expensive operations against them and
+writes the results as JSON so that runs of different pbr releases can be
+compared::
+
+    python -m pbr.benchmarks.suite --commits 1000,10000 -o new.json
+    python -m pbr.benchmarks.suite compare old.json new.json
+"""
@@ -0,0 +1,260 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Generation of synthetic pbr-using git repositories.
+
+The history is written with git fast-import, so even repositories with
+hundreds of thousands of commits take seconds rather than hours to make.
+Everything about the repository is a function of its parameters, so the
+same parameters always give the same history, with the same shas.
+"""
+
+import json
+import os
+import subprocess
+
+# Bump whenever the generated history changes, so cached repositories made
+# by an older generator are not reused.
+GENERATOR_VERSION = 1
+
+PACKAGE = 'benchpkg'
+_EPOCH = 1400000000
+_AUTHORS = 40
+# One commit in this many has a Co-authored-by trailer, and so on.
+_CO_AUTHOR_EVERY = 7
+_FEATURE_EVERY = 13
+_BUGFIX_EVERY = 11
+_JUNK_TAG_EVERY = 4
+_PRERELEASE_TAG_EVERY = 5
+
+_SETUP_PY = """import setuptools
+
+setuptools.setup(
+    setup_requires=['pbr'],
+    pbr=True)
+"""
+
+_SETUP_CFG = """[metadata]
+name = %(name)s
+summary = A synthetic project for benchmarking pbr
+description-file =
+    README.rst
+author = Bench Marker
+author-email = bench@example.com
+home-page = http://example.com/%(name)s
+classifier =
+    Programming Language :: Python
+
+[files]
+packages =
+    %(name)s
+
+[entry_points]
+console_scripts =
+    %(name)s = %(name)s:main
+"""
+
+
+class RepoSpec(object):
+    """The parameters of a synthetic repository.
+
+    :param commits: The number of commits on the single branch.
+    :param tags: The number of tags, spread evenly along the history. Most
+        are increasing semantic versions, a few pre-release versions, and
+        some junk that is not a version at all. Alternate tags are annotated.
+    :param files: The number of modules in the package besides __init__.
+    :param requirements: The number of lines in requirements.txt.
+    :param tag_head: Whether HEAD is tagged with the next release.
+    """
+
+    def __init__(self, commits=1000, tags=20, files=100, requirements=30,
+                 tag_head=False):
+        self.commits = commits
+        self.tags = min(tags, commits)
+        self.files = max(files, 1)
+        self.requirements = requirements
+        self.tag_head = tag_head
+
+    def as_dict(self):
+        return dict(commits=self.commits, tags=self.tags, files=self.files,
+                    requirements=self.requirements, tag_head=self.tag_head)
+
+    def name(self):
+        return 'repo-c%d-t%d-f%d-r%d%s-g%d' % (
+            self.commits, self.tags, self.files, self.requirements,
+            '-head' if self.tag_head else '', GENERATOR_VERSION)
+
+
+def _author(number):
+    if number % 10 == 9:
+        # Some of the history is by CI, whose address pbr leaves out.
+        return 'Jenkins', 'jenkins@review.openstack.org'
+    return 'Developer %d' % number, 'dev%d@example.com' % number
+
+
+def _data(content):
+    content = content.encode('utf-8')
+    return b'data ' + str(len(content)).encode('ascii') + b'\n' + content
+
+
+def release_version(number):
+    """Return the number-th release, counting from 0.1.0."""
+    number += 10
+    return '%d.%d.%d' % (number // 100, number // 10 % 10, number % 10)
+
+
+def tag_names(spec):
+    """Return {commit number: tag name} for the tags of spec."""
+    if not spec.tags:
+        return {}
+    step = max(spec.commits // spec.tags, 1)
+    names = {}
+    release = 0
+    for index in range(spec.tags):
+        commit = min((index + 1) * step - 1, spec.commits - 1)
+        if index % _JUNK_TAG_EVERY == _JUNK_TAG_EVERY - 1:
+            names[commit] = 'junk-build-%d' % index
+        elif index % _PRERELEASE_TAG_EVERY == _PRERELEASE_TAG_EVERY - 1:
+            names[commit] = release_version(release) + '.0b1'
+        else:
+            names[commit] = release_version(release)
+            release += 1
+    if spec.tag_head:
+        names[spec.commits - 1] = release_version(release)
+    elif names.get(spec.commits - 1) and spec.commits > 1:
+        # Leave HEAD untagged so versions are computed from history.
+        names[spec.commits - 2] = names.pop(spec.commits - 1)
+    return names
+
+
+def _message(number):
+    lines = ['Change number %d' % number, '',
+             'Synthetic change %d for benchmarking pbr.' % number]
+    trailers = []
+    if number % _FEATURE_EVERY == _FEATURE_EVERY - 1:
+        trailers.append('Sem-Ver: feature')
+    elif number % _BUGFIX_EVERY == _BUGFIX_EVERY - 1:
+        trailers.append('Sem-Ver: bugfix')
+    if number % _CO_AUTHOR_EVERY == _CO_AUTHOR_EVERY - 1:
+        name, email = _author(number * 3 % _AUTHORS)
+        trailers.append('Co-authored-by: %s <%s>' % (name, email))
+    if trailers:
+        lines.append('')
+        lines.extend(trailers)
+    return '\n'.join(lines) + '\n'
+
+
+def _initial_files(spec):
+    files = {
+        'setup.py': _SETUP_PY,
+        'setup.cfg': _SETUP_CFG % dict(name=PACKAGE),
+        'README.rst': '%s\n%s\n' % (PACKAGE, '=' * len(PACKAGE)),
+        'requirements.txt': ''.join(
+            'dependency%d>=%d.0\n' % (number, number % 5)
+            for number in range(spec.requirements)),
+        '%s/__init__.py' % PACKAGE: 'def main():\n    pass\n',
+    }
+    for number in range(spec.files):
+        files['%s/module%d.py' % (PACKAGE, number)] = 'VALUE = 0\n'
+    return files
+
+
+def _stream(spec):
+    """Yield the fast-import stream for the history of spec."""
+    tags = tag_names(spec)
+    for number in range(spec.commits):
+        name, email = _author(number % _AUTHORS)
+        when = _EPOCH + number * 60
+        ident = '%s <%s> %d +0000' % (name, email, when)
+        chunks = [b'commit refs/heads/master',
+                  b'mark :' + str(number + 1).encode('ascii'),
+                  ('author %s' % ident).encode('utf-8'),
+                  ('committer %s' % ident).encode('utf-8'),
+                  _data(_message(number))]
+        if number:
+            chunks.append(b'from :' + str(number).encode('ascii'))
+            changes = {'%s/module%d.py' % (PACKAGE, number % spec.files):
+                       'VALUE = %d\n' % number}
+        else:
+            changes = _initial_files(spec)
+        for path in sorted(changes):
+            chunks.append(('M 100644 inline %s' % path).encode('utf-8'))
+            chunks.append(_data(changes[path]))
+        tag = tags.get(number)
+        if tag and number % 2:
+            chunks.extend([('tag %s' % tag).encode('utf-8'),
+                           b'from :' + str(number + 1).encode('ascii'),
+                           ('tagger %s' % ident).encode('utf-8'),
+                           _data('Release %s\n' % tag)])
+        elif tag:
+            chunks.extend([('reset refs/tags/%s' % tag).encode('utf-8'),
+                           b'from :' + str(number + 1).encode('ascii')])
+        yield b'\n'.join(chunks) + b'\n'
+
+
+def _git(path, *args, **kwargs):
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen(
+            ['git'] + list(args), cwd=path, stdout=devnull,
+            stderr=subprocess.PIPE, stdin=kwargs.get('stdin'))
+        return process
+
+
+def _check(process, what):
+    err = process.stderr.read()
+    if process.wait():
+        raise RuntimeError('%s failed: %s' % (what, err.decode('utf-8',
+                                                               'replace')))
+
+
+def make_repo(path, spec):
+    """Create the repository described by spec at path.
+
+    :return: path.
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    _check(_git(path, 'init', '-q', '.'), 'git init')
+    _check(_git(path, 'symbolic-ref', 'HEAD', 'refs/heads/master'),
+           'git symbolic-ref')
+    importer = _git(path, 'fast-import', '--quiet', stdin=subprocess.PIPE)
+    try:
+        for chunk in _stream(spec):
+            importer.stdin.write(chunk)
+    finally:
+        importer.stdin.close()
+    _check(importer, 'git fast-import')
+    if spec.commits:
+        _check(_git(path, 'reset', '-q', '--hard'), 'git reset')
+    return path
+
+
+def get_repo(workdir, spec):
+    """Return a repository for spec in workdir, making it if needed.
+
+    Repositories are kept between runs: making the larger ones is the
+    slowest part of a benchmark run.
+    """
+    path = os.path.join(workdir, spec.name())
+    marker = os.path.join(path, '.git', 'bench-spec.json')
+    if os.path.exists(marker):
+        return path
+    if os.path.exists(path):
+        raise RuntimeError('%s exists but is not a finished repository' %
+                           path)
+    make_repo(path, spec)
+    with open(marker, 'w') as marker_file:
+        json.dump(spec.as_dict(), marker_file)
+    return path
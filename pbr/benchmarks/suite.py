@@ -0,0 +1,405 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Timing of pbr's expensive operations against synthetic repositories.
+
+Each benchmark is run cold, with pbr's in-memory and on-disk caches
+cleared before every repetition, and warm, after an untimed run has filled
+them. The results are written as a JSON document::
+
+    {"format": 1, "pbr": ..., "python": ..., "git": ..., "results": [
+        {"benchmark": "get_version", "mode": "cold", "commits": 1000,
+         "tags": 20, "files": 100, "times": [...], "min": ...,
+         "median": ..., "max": ...}, ...]}
+
+Running with 'compare OLD NEW' prints how each median changed between two
+such documents, and exits non-zero if any got slower than the threshold.
+"""
+
+import contextlib
+import glob
+import json
+import optparse
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from pbr.benchmarks import repo
+from pbr import packaging
+from pbr import util
+from pbr import version
+
+FORMAT = 1
+_DEFAULT_THRESHOLD = 1.25
+# Environment variables that would short-circuit what is being timed.
+_SKIP_ENV = ('PBR_VERSION', 'OSLO_PACKAGE_VERSION', 'SKIP_VERSION_CACHE',
+             'SKIP_WRITE_GIT_CHANGELOG', 'SKIP_GENERATE_AUTHORS',
+             'SKIP_GIT_SDIST', 'PBR_TRACE', 'PBR_TIMING')
+
+
+def _reset_caches(git_dir):
+    """Forget everything pbr remembers about git_dir, in memory and on disk.
+
+    Attributes are looked up defensively so that older pbr releases, with
+    fewer caches, can be benchmarked too.
+    """
+    git = getattr(packaging, 'git', None)
+    for name in ('close_backends', 'reset_contexts'):
+        reset = getattr(git, name, None)
+        if reset is not None:
+            reset()
+    for name in ('_tag_indexes', '_ignore_emails_res'):
+        cache = getattr(packaging, name, None)
+        if cache is not None:
+            cache.clear()
+    for path in glob.glob(os.path.join(git_dir, 'pbr-*.json')):
+        os.remove(path)
+
+
+def _history_snapshot(git_dir):
+    get_snapshot = getattr(packaging, '_get_history_snapshot', None)
+    if get_snapshot is None:
+        return {}
+    return dict(snapshot=get_snapshot(git_dir))
+
+
+class Benchmark(object):
+    """Something to time, run with the repository as working directory.
+
+    :param name: The name results are reported under.
+    :param func: Called with a Workspace.
+    :param modes: The modes to run in, of 'cold' and 'warm'.
+    """
+
+    def __init__(self, name, func, modes=('cold', 'warm')):
+        self.name = name
+        self.func = func
+        self.modes = modes
+
+
+class Workspace(object):
+    """What a benchmark runs against.
+
+    :param path: The repository.
+    :param spec: The repo.RepoSpec it was made from.
+    :param scratch: A directory for output files.
+    """
+
+    def __init__(self, path, spec, scratch):
+        self.path = path
+        self.spec = spec
+        self.scratch = scratch
+        self.git_dir = os.path.join(path, '.git')
+        self.version_strings = version_strings(spec.commits)
+        self.versions = [version.SemanticVersion.from_pip_string(string)
+                         for string in reversed(self.version_strings)]
+
+
+def version_strings(count):
+    """Return count version strings like those pbr parses and sorts.
+
+    Releases alternate between having pre-releases and having dev versions
+    before them: pbr does not order the two for the same release.
+    """
+    strings = []
+    for number in range(count):
+        release = repo.release_version(number // 10)
+        kind = number % 10
+        if kind == 0:
+            strings.append(release)
+        elif number // 10 % 2:
+            strings.append('%s.dev%d' % (release, kind))
+        else:
+            strings.append('%s.0%s%d' % (release, 'abc'[kind % 3], kind))
+    return strings
+
+
+def _get_version(workspace):
+    packaging.get_version(repo.PACKAGE)
+
+
+def _write_git_changelog(workspace):
+    packaging.write_git_changelog(git_dir='.git', dest_dir=workspace.scratch,
+                                  option_dict={},
+                                  **_history_snapshot('.git'))
+
+
+def _generate_authors(workspace):
+    packaging.generate_authors(git_dir='.git', dest_dir=workspace.scratch,
+                               option_dict={}, **_history_snapshot('.git'))
+
+
+def _find_git_files(workspace):
+    packaging._find_git_files(git_dir='.git')
+
+
+def _cfg_to_args(workspace):
+    util.cfg_to_args('setup.cfg')
+
+
+def _parse_requirements(workspace):
+    packaging.parse_requirements(['requirements.txt'])
+
+
+def _parse_versions(workspace):
+    for string in workspace.version_strings:
+        version.SemanticVersion.from_pip_string(string)
+
+
+def _sort_versions(workspace):
+    sorted(workspace.versions)
+
+
+BENCHMARKS = [
+    Benchmark('get_version', _get_version),
+    Benchmark('write_git_changelog', _write_git_changelog),
+    Benchmark('generate_authors', _generate_authors),
+    Benchmark('_find_git_files', _find_git_files),
+    Benchmark('cfg_to_args', _cfg_to_args),
+    Benchmark('parse_requirements', _parse_requirements, modes=('warm',)),
+    Benchmark('SemanticVersion.from_pip_string', _parse_versions,
+              modes=('warm',)),
+    Benchmark('SemanticVersion sort', _sort_versions, modes=('warm',)),
+]
+
+
+@contextlib.contextmanager
+def _environment(path):
+    saved_env = dict((name, os.environ.pop(name)) for name in _SKIP_ENV
+                     if name in os.environ)
+    saved_cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(saved_cwd)
+        os.environ.update(saved_env)
+
+
+def _median(times):
+    times = sorted(times)
+    middle = len(times) // 2
+    if len(times) % 2:
+        return times[middle]
+    return (times[middle - 1] + times[middle]) / 2.0
+
+
+def _time(benchmark, workspace, mode, repeat):
+    times = []
+    try:
+        with _environment(workspace.path):
+            if mode == 'warm':
+                benchmark.func(workspace)
+            for run in range(repeat):
+                if mode == 'cold':
+                    _reset_caches(workspace.git_dir)
+                start = timeit.default_timer()
+                benchmark.func(workspace)
+                times.append(timeit.default_timer() - start)
+    finally:
+        _reset_caches(workspace.git_dir)
+    return times
+
+
+def run(specs, workdir, repeat=3, names=None, progress=None):
+    """Run the benchmarks against a repository for each spec.
+
+    :param specs: A list of repo.RepoSpec.
+    :param workdir: Where to keep the generated repositories.
+    :param names: Only run the benchmarks with these names.
+    :param progress: Called with a message before each benchmark.
+    :return: A list of result dicts.
+    """
+    results = []
+    for spec in specs:
+        if progress:
+            progress('making %s' % spec.name())
+        workspace = Workspace(repo.get_repo(workdir, spec), spec,
+                              tempfile.mkdtemp())
+        try:
+            _run_spec(workspace, repeat, names, progress, results)
+        finally:
+            shutil.rmtree(workspace.scratch, ignore_errors=True)
+    return results
+
+
+def _run_spec(workspace, repeat, names, progress, results):
+    spec = workspace.spec
+    for benchmark in BENCHMARKS:
+        if names and benchmark.name not in names:
+            continue
+        for mode in benchmark.modes:
+            if progress:
+                progress('%s %s on %s' % (benchmark.name, mode, spec.name()))
+            result = dict(benchmark=benchmark.name, mode=mode, repeat=repeat)
+            result.update(spec.as_dict())
+            try:
+                times = _time(benchmark, workspace, mode, repeat)
+            except Exception as e:
+                # Older releases lack some of what is benchmarked.
+                result['error'] = '%s: %s' % (e.__class__.__name__, e)
+            else:
+                result.update(times=times, min=min(times),
+                              median=_median(times), max=max(times))
+            results.append(result)
+
+
+def _run(argv, cwd=None):
+    try:
+        output = subprocess.Popen(argv, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE,
+                                  cwd=cwd).communicate()[0]
+    except OSError:
+        return None
+    return output.decode('utf-8', 'replace').strip() or None
+
+
+def _pbr_path():
+    return os.path.dirname(os.path.abspath(packaging.__file__))
+
+
+def _pbr_version():
+    try:
+        return version.VersionInfo('pbr').version_string()
+    except Exception:
+        # A source checkout that was never installed.
+        return _run(['git', 'describe', '--always', '--tags'], _pbr_path())
+
+
+def report(results):
+    """Return the JSON document for results."""
+    return dict(format=FORMAT, pbr=_pbr_version(),
+                pbr_path=_pbr_path(), python=platform.python_version(),
+                git=_run(['git', '--version']),
+                platform=platform.platform(), results=results)
+
+
+def _key(result):
+    return (result['benchmark'], result['mode'], result['commits'],
+            result['tags'], result['files'], result['requirements'],
+            result['tag_head'])
+
+
+def compare(old, new, threshold=_DEFAULT_THRESHOLD):
+    """Compare two reports.
+
+    :return: A list of (key, old median, new median, ratio) for the results
+        in both, and a list of the keys whose ratio exceeds threshold.
+    """
+    old_results = dict((_key(result), result) for result in old['results']
+                       if 'median' in result)
+    rows = []
+    regressions = []
+    for result in new['results']:
+        key = _key(result)
+        if key not in old_results or 'median' not in result:
+            continue
+        before = old_results[key]['median']
+        after = result['median']
+        ratio = after / before if before else float('inf')
+        rows.append((key, before, after, ratio))
+        if ratio > threshold:
+            regressions.append(key)
+    return rows, regressions
+
+
+def _spec_list(option):
+    return [int(value) for value in option.split(',') if value]
+
+
+def _parser():
+    parser = optparse.OptionParser(
+        usage='%prog [options]\n       %prog compare OLD.json NEW.json')
+    parser.add_option('--commits', default='100,1000',
+                      help='Comma separated numbers of commits to benchmark '
+                      'against [%default]')
+    parser.add_option('--tags', type='int', default=20,
+                      help='Tags in each repository [%default]')
+    parser.add_option('--files', type='int', default=100,
+                      help='Modules in each repository [%default]')
+    parser.add_option('--requirements', type='int', default=30,
+                      help='Lines in requirements.txt [%default]')
+    parser.add_option('--tag-head', action='store_true', default=False,
+                      help='Tag HEAD, as for a release')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='Timed runs of each benchmark [%default]')
+    parser.add_option('--benchmark', action='append', dest='names',
+                      help='Only run this benchmark; may be repeated')
+    parser.add_option('--workdir',
+                      help='Keep generated repositories here for reuse '
+                      '[a temporary directory]')
+    parser.add_option('-o', '--output',
+                      help='Write the JSON report here [stdout]')
+    parser.add_option('--threshold', type='float',
+                      default=_DEFAULT_THRESHOLD,
+                      help='With compare, the slowdown that fails [%default]')
+    return parser
+
+
+def _progress(message):
+    sys.stderr.write('[pbr] %s\n' % message)
+
+
+def _main_compare(args, options):
+    with open(args[0]) as old_file:
+        old = json.load(old_file)
+    with open(args[1]) as new_file:
+        new = json.load(new_file)
+    rows, regressions = compare(old, new, options.threshold)
+    print('%-32s %-5s %8s %10s %10s %7s' % (
+        'benchmark', 'mode', 'commits', 'old', 'new', 'ratio'))
+    for key, before, after, ratio in rows:
+        print('%-32s %-5s %8d %10.4f %10.4f %6.2fx%s' % (
+            key[0], key[1], key[2], before, after, ratio,
+            ' *' if key in regressions else ''))
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = _parser()
+    options, args = parser.parse_args(argv)
+    if args[:1] == ['compare']:
+        if len(args) != 3:
+            parser.error('compare needs two reports')
+        return _main_compare(args[1:], options)
+    if args:
+        parser.error('unexpected arguments: %s' % ' '.join(args))
+    specs = [repo.RepoSpec(commits=commits, tags=options.tags,
+                           files=options.files,
+                           requirements=options.requirements,
+                           tag_head=options.tag_head)
+             for commits in _spec_list(options.commits)]
+    workdir = options.workdir or tempfile.mkdtemp()
+    try:
+        results = run(specs, workdir, repeat=options.repeat,
+                      names=options.names, progress=_progress)
+    finally:
+        if not options.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    document = json.dumps(report(results), indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as output:
+            output.write(document + '\n')
+    else:
+        print(document)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
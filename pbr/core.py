@@ -47,6 +47,7 @@ import warnings
 
 from setuptools import dist
 
+from pbr import trace
 from pbr import util
 
 
@@ -101,7 +102,8 @@ def pbr(dist, attr, value):
 
         # Converts the setup.cfg file to setup() arguments
         try:
-            attrs = util.cfg_to_args(path)
+            with trace.phase('cfg_to_args'):
+                attrs = util.cfg_to_args(path)
         except Exception:
             e = sys.exc_info()[1]
             # NB: This will output to the console if no explicit logging has
@@ -0,0 +1,624 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Backends for answering the git queries pbr makes while packaging.
+"""
+
+import atexit
+import codecs
+import collections
+from distutils import log
+import itertools
+import json
+import os
+import re
+import subprocess
+
+from pbr import refs
+from pbr import trace
+
+_backends = {}
+_contexts = {}
+
+# One record per commit; records start with RS and fields are split by US.
+# %B is the raw message, which we need whole because Sem-Ver headers are
+# honoured on any line of it, including the subject.
+_HISTORY_FORMAT = '%x1e%H%x1f%h%x1f%P%x1f%d%x1f%s%x1f%aN <%aE>%x1f%B'
+_TAG_RE = re.compile(r'tag: ([^,)]+)')
+_CO_AUTHOR_RE = re.compile(r'Co-authored-by:(.+)')
+_SEMVER_HEADER = 'sem-ver:'
+_STREAM_CHUNK = 64 * 1024
+_VERSION_CACHE = 'version-cache'
+# Bump this whenever version calculation changes, to invalidate old entries.
+_VERSION_CACHE_FORMAT = 1
+_VERSION_CACHE_SIZE = 32
+
+Commit = collections.namedtuple(
+    'Commit', ['sha', 'short_sha', 'parents', 'tags', 'subject', 'author',
+               'semver', 'co_authors'])
+
+
+def _parse_commit(record):
+    """Parse one git log --format=_HISTORY_FORMAT record into a Commit."""
+    fields = record.split('\x1f', 6)
+    if len(fields) != 7:
+        return None
+    sha, short_sha, parents, refs, subject, author, message = fields
+    return Commit(
+        sha=sha.strip(),
+        short_sha=short_sha,
+        parents=tuple(parents.split()),
+        tags=frozenset(_TAG_RE.findall(refs)),
+        subject=subject,
+        author=author,
+        semver=tuple(
+            line[len(_SEMVER_HEADER):].strip()
+            for line in message.split('\n')
+            if line.lower().startswith(_SEMVER_HEADER)),
+        co_authors=tuple(
+            co_author.strip()
+            for co_author in _CO_AUTHOR_RE.findall(message)))
+
+
+def _iter_history(records):
+    try:
+        for record in records:
+            commit = _parse_commit(record)
+            if commit is not None:
+                yield commit
+    finally:
+        records.close()
+
+
+class HistorySnapshot(object):
+    """The history reachable from HEAD, as read by a single git log pass.
+
+    Only the parts of each commit that pbr uses are kept - the full commit
+    messages are discarded once the Sem-Ver and Co-authored-by lines have
+    been picked out of them.
+
+    The history is read lazily: consumers that walk it in order with
+    iter_commits only cause as much of it to be read as they look at, and
+    can do their work while git is still producing the rest. Reading can be
+    paused, which stops git; it carries on from the same place the next time
+    more history is needed.
+
+    The commits read are kept for later consumers, except those walked with
+    stream, which reads the whole history in constant memory.
+    """
+
+    def __init__(self, reader, head='HEAD'):
+        """Create a HistorySnapshot.
+
+        :param reader: A callable that takes a list of git log revision
+            arguments and returns an iterator of the Commit tuples git log
+            would show for them, in git log order.
+        :param head: The revision whose history this is. Pass a sha rather
+            than a ref to make sure a paused read resumes at the same place.
+        """
+        self._reader = reader
+        self._head = head
+        self._commits = []
+        self._pending = None
+        self._exhausted = False
+        self._by_sha = None
+        self._length = None
+
+    def _read_one(self):
+        """Read one more commit, returning False at the end of history."""
+        if self._exhausted:
+            return False
+        if self._pending is None:
+            self._pending = iter(self._reader([self._head]))
+            # A resumed read starts from HEAD again.
+            collections.deque(
+                itertools.islice(self._pending, len(self._commits)),
+                maxlen=0)
+        try:
+            self._commits.append(next(self._pending))
+        except StopIteration:
+            self._exhausted = True
+            self._pending = None
+            return False
+        return True
+
+    @property
+    def commits(self):
+        """A list of all the Commit tuples, in git log order."""
+        while self._read_one():
+            pass
+        return self._commits
+
+    def iter_commits(self):
+        """Iterate over the commits, reading no more history than needed."""
+        index = 0
+        while index < len(self._commits) or self._read_one():
+            yield self._commits[index]
+            index += 1
+
+    def stream(self):
+        """Iterate over all the commits, keeping none that are not kept yet.
+
+        The commits already read come from memory; the rest from a git log
+        of their own, so walking the whole history this way takes memory
+        independent of its length.
+        """
+        index = 0
+        while index < len(self._commits):
+            yield self._commits[index]
+            index += 1
+        if self._exhausted:
+            return
+        commits = self._reader([self._head])
+        try:
+            for commit in itertools.islice(commits, index, None):
+                yield commit
+                index += 1
+        finally:
+            close = getattr(commits, 'close', None)
+            if close is not None:
+                close()
+        self._length = index
+
+    def length(self):
+        """Return the number of commits, streaming them if not yet known."""
+        if self._exhausted:
+            return len(self._commits)
+        if self._length is None:
+            collections.deque(self.stream(), maxlen=0)
+        return self._length
+
+    def pause(self):
+        """Stop reading history until more of it is needed."""
+        close = getattr(self._pending, 'close', None)
+        if close is not None:
+            close()
+        self._pending = None
+
+    def head(self):
+        """Return the Commit at HEAD, or None for an empty history."""
+        for commit in self.iter_commits():
+            return commit
+        return None
+
+    def iter_oneline(self):
+        """Iterate over (short_sha, tags_set, subject) tuples.
+
+        This is the same data _iter_log_oneline provides, without running git
+        log again. Like stream, it keeps no more commits than were kept.
+        """
+        for commit in self.stream():
+            yield commit.short_sha, set(commit.tags), commit.subject
+
+    def since(self, tag):
+        """Return the commits reachable from HEAD but not from tag.
+
+        This is what git log tag..HEAD would show. If no commit carries tag
+        there is no such revision, and like git we show nothing.
+
+        Unless the whole history has been read already, git is asked for just
+        these commits, so the cost depends on the distance to tag rather than
+        on the size of the history.
+        """
+        if not tag:
+            return list(self.commits)
+        if not self._exhausted:
+            return list(self._reader(['%s..%s' % (tag, self._head)]))
+        if self._by_sha is None:
+            self._by_sha = dict((c.sha, c) for c in self._commits)
+        tagged = [c.sha for c in self._commits if tag in c.tags]
+        if not tagged:
+            return []
+        excluded = set()
+        pending = tagged
+        while pending:
+            sha = pending.pop()
+            if sha in excluded or sha not in self._by_sha:
+                continue
+            excluded.add(sha)
+            pending.extend(self._by_sha[sha].parents)
+        return [c for c in self._commits if c.sha not in excluded]
+
+
+class SubprocessBackend(object):
+    """Answer every git query by running a new git process.
+
+    This is how pbr has always talked to git, and is what the batch backend
+    falls back to whenever its helper processes are unavailable.
+    """
+
+    def __init__(self, git_dir, runner):
+        """Create a backend.
+
+        :param git_dir: The git directory to run queries against.
+        :param runner: A callable used to execute git, with the signature of
+            pbr.packaging._run_shell_command.
+        """
+        self.git_dir = git_dir
+        self._runner = runner
+        self.forks_saved = 0
+
+    def _command(self, cmd):
+        return ['git', '--git-dir=%s' % self.git_dir] + list(cmd)
+
+    def run(self, cmd, **kwargs):
+        """Run git with the argument list cmd and return its output."""
+        return self._runner(self._command(cmd), **kwargs)
+
+    def resolve(self, rev):
+        """Return the full sha1 that rev names, or None if it names nothing.
+        """
+        return self.run(['rev-parse', '--verify', '--quiet', rev]) or None
+
+    def stream(self, cmd, separator='\n'):
+        """Iterate over the output of git cmd as git produces it.
+
+        The output is split on separator, and each piece is yielded as soon
+        as it is complete, so memory use does not depend on the size of the
+        output. If the iterator is closed before the output is exhausted,
+        git is killed.
+        """
+        argv = self._command(cmd)
+        traced = trace.begin(argv)
+        devnull = open(os.devnull, 'wb')
+        try:
+            process = subprocess.Popen(
+                argv, stdout=subprocess.PIPE, stderr=devnull)
+        except OSError:
+            trace.end(traced, None)
+            raise
+        finally:
+            devnull.close()
+        # read1 returns whatever is available instead of waiting for a full
+        # chunk; Python 2 file objects don't have it.
+        read = getattr(process.stdout, 'read1', process.stdout.read)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        pending = ''
+        size = 0
+        try:
+            while True:
+                chunk = read(_STREAM_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                pieces = (pending + decoder.decode(chunk)).split(separator)
+                pending = pieces.pop()
+                for piece in pieces:
+                    yield piece
+            pending += decoder.decode(b'', True)
+            if pending:
+                yield pending
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            process.stdout.close()
+            trace.end(traced, process.returncode, size)
+
+    def _log(self, revs):
+        return _iter_history(self.stream(
+            ['log', '--format=%s' % _HISTORY_FORMAT] + list(revs),
+            separator='\x1e'))
+
+    def history(self):
+        """Return a HistorySnapshot of the history reachable from HEAD."""
+        return HistorySnapshot(self._log)
+
+    def close(self):
+        pass
+
+
+class BatchBackend(SubprocessBackend):
+    """Answer git queries using long-lived helper processes where possible.
+
+    HEAD and full ref names are resolved by reading the git directory;
+    other revisions by a single ``git cat-file --batch-check`` process that
+    lives for the rest of the setup.py invocation. Because resolving HEAD is
+    then free, the output of read-only queries can be remembered
+    against the current HEAD, refs and index so that repeated queries - pbr
+    asks for the same log several times during an sdist - don't fork git
+    again.
+    """
+
+    def __init__(self, git_dir, runner):
+        super(BatchBackend, self).__init__(git_dir, runner)
+        self._check = None
+        self._traced = None
+        self._broken = False
+        self._results = {}
+        self._history = (None, None)
+        self.processes_started = 0
+
+    def _helper(self):
+        if self._check is None:
+            argv = self._command(['cat-file', '--batch-check'])
+            self._traced = trace.begin(argv)
+            self._check = subprocess.Popen(
+                argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.processes_started += 1
+        return self._check
+
+    def resolve(self, rev):
+        if rev == 'HEAD' or rev.startswith('refs/'):
+            sha = refs.read_ref(self.git_dir, rev)
+            if sha is not None:
+                return sha
+        if self._broken or '\n' in rev:
+            return super(BatchBackend, self).resolve(rev)
+        try:
+            helper = self._helper()
+            helper.stdin.write(rev.encode('utf-8') + b'\n')
+            helper.stdin.flush()
+            answer = helper.stdout.readline().decode('utf-8').split()
+        except (IOError, OSError, ValueError):
+            log.info('[pbr] git cat-file helper failed, falling back to '
+                     'running git for each query')
+            self._broken = True
+            self.close()
+            return super(BatchBackend, self).resolve(rev)
+        if not answer:
+            # The helper exited underneath us.
+            self._broken = True
+            self.close()
+            return super(BatchBackend, self).resolve(rev)
+        if len(answer) != 3:
+            # '<rev> missing' or '<rev> ambiguous'
+            return None
+        return answer[0]
+
+    def _state(self):
+        """Return a token that changes whenever query results may change."""
+        stamp = [self.resolve('HEAD')]
+        common_dir = refs.common_dir(self.git_dir)
+        paths = [os.path.join(common_dir, 'packed-refs'),
+                 os.path.join(self.git_dir, 'index')]
+        for dirpath, dirnames, filenames in os.walk(
+                os.path.join(common_dir, 'refs', 'tags')):
+            paths.extend(os.path.join(dirpath, name) for name in filenames)
+        for path in paths:
+            try:
+                st = os.stat(path)
+                stamp.append((path, st.st_mtime, st.st_size))
+            except OSError:
+                stamp.append((path, None))
+        return tuple(stamp)
+
+    def run(self, cmd, **kwargs):
+        if kwargs.get('buffer', True) is False or kwargs.get('env'):
+            return super(BatchBackend, self).run(cmd, **kwargs)
+        key = (tuple(cmd), kwargs.get('throw_on_error', False))
+        state = self._state()
+        if key in self._results and self._results[key][0] == state:
+            self.forks_saved += 1
+            output, error = self._results[key][1:]
+            if error is not None:
+                raise error
+            return output
+        try:
+            output = super(BatchBackend, self).run(cmd, **kwargs)
+        except Exception as e:
+            self._results[key] = (state, None, e)
+            raise
+        self._results[key] = (state, output, None)
+        return output
+
+    def history(self):
+        state = self._state()
+        if self._history[0] != state:
+            if self._history[1] is not None:
+                self._history[1].pause()
+            # state[0] is the sha of HEAD, or None before the first commit.
+            if state[0] is None:
+                snapshot = HistorySnapshot(lambda revs: iter([]))
+            else:
+                snapshot = HistorySnapshot(self._log, head=state[0])
+            self._history = (state, snapshot)
+        return self._history[1]
+
+    def close(self):
+        if self._history[1] is not None:
+            self._history[1].pause()
+            self._history = (None, None)
+        if self._check is not None:
+            try:
+                self._check.stdin.close()
+                self._check.wait()
+            except (IOError, OSError):
+                pass
+            trace.end(self._traced, self._check.returncode)
+            self._check = None
+
+
+def state_path(git_dir, name):
+    """Return the path of the pbr state file called name in git_dir."""
+    return os.path.join(git_dir, 'pbr-%s.json' % name)
+
+
+def read_state(git_dir, name, default=None):
+    """Return the JSON content of a pbr state file, or default if absent."""
+    try:
+        with open(state_path(git_dir, name), 'r') as state:
+            return json.load(state)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def write_state(git_dir, name, content):
+    """Replace the content of a pbr state file.
+
+    pbr's state files are caches: failing to write one is not an error.
+    """
+    path = state_path(git_dir, name)
+    try:
+        with open(path + '.tmp', 'w') as state:
+            json.dump(content, state)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(path + '.tmp', path)
+    except (IOError, OSError):
+        log.debug('[pbr] Could not write %s' % path)
+
+
+def get_cached_version(git_dir, key):
+    """Return the version cached in git_dir for key, or None."""
+    for entry in read_state(git_dir, _VERSION_CACHE, []):
+        if entry[:-1] == key:
+            return entry[-1]
+    return None
+
+
+def set_cached_version(git_dir, key, version):
+    """Cache version in git_dir under key.
+
+    The most recently used keys are kept, so that switching between a few
+    branches does not keep recomputing versions.
+    """
+    entries = [entry for entry in read_state(git_dir, _VERSION_CACHE, [])
+               if entry[:-1] != key]
+    entries.insert(0, key + [version])
+    write_state(git_dir, _VERSION_CACHE, entries[:_VERSION_CACHE_SIZE])
+
+
+def version_cache_key(git_dir, head, pre_version):
+    """Return the version cache key for pre_version at head in git_dir."""
+    return [_VERSION_CACHE_FORMAT, head, refs.refs_digest(git_dir),
+            pre_version or '']
+
+
+def get_backend(git_dir, runner):
+    """Return the backend to use for queries against git_dir.
+
+    Backends are shared for the lifetime of the process. Setting
+    PBR_GIT_BACKEND=subprocess forces a new git process per query.
+    """
+    if (os.environ.get('PBR_GIT_BACKEND') == 'subprocess'
+            or not os.path.isdir(git_dir)):
+        return SubprocessBackend(git_dir, runner)
+    git_dir = os.path.abspath(git_dir)
+    backend = _backends.get(git_dir)
+    if backend is None:
+        backend = BatchBackend(git_dir, runner)
+        _backends[git_dir] = backend
+    return backend
+
+
+class GitContext(object):
+    """The git repository pbr is running in, and the git it is using.
+
+    Each property is worked out the first time it is needed and remembered.
+    Contexts are per working directory: get_context returns a different
+    one after a chdir. Call invalidate after changing the repository under
+    a context, for instance with git init.
+
+    :param path: The directory the context describes, which must be the
+        working directory whenever git needs to be asked.
+    :param runner: A callable like packaging._run_shell_command.
+    """
+
+    def __init__(self, path, runner):
+        self.path = path
+        self._runner = runner
+        self._values = {}
+
+    def _remember(self, name, compute):
+        if name not in self._values:
+            self._values[name] = compute()
+        return self._values[name]
+
+    def invalidate(self):
+        """Forget everything discovered so far."""
+        self._values.clear()
+
+    def _probe_git(self):
+        try:
+            output = self._runner(['git', '--version'])
+        except OSError:
+            return None
+        match = re.search(r'(\d+(?:\.\d+)*)', output or '')
+        if match is None:
+            return ()
+        return tuple(int(part) for part in match.group(1).split('.'))
+
+    @property
+    def git_version(self):
+        """The version of git as a tuple of ints, or None if not installed.
+
+        An installed git whose version cannot be parsed gives ().
+        """
+        return self._remember('git_version', self._probe_git)
+
+    @property
+    def git_installed(self):
+        return self.git_version is not None
+
+    def _find_git_dir(self):
+        git_dir = refs.find_git_dir(self.path)
+        if git_dir is None:
+            git_dir = self._runner(['git', 'rev-parse', '--git-dir'])
+        return git_dir
+
+    @property
+    def git_dir(self):
+        """The git directory, as git rev-parse --git-dir gives it.
+
+        This is '' outside of a git repository.
+        """
+        return self._remember('git_dir', self._find_git_dir)
+
+    def _find_top_dir(self):
+        if not self.git_dir:
+            return ''
+        git_dir = os.path.join(self.path, self.git_dir)
+        if os.path.basename(git_dir) == '.git':
+            return os.path.dirname(git_dir)
+        return self._runner(['git', 'rev-parse', '--show-toplevel'])
+
+    @property
+    def top_dir(self):
+        """The top directory of the work tree, or '' outside of one."""
+        return self._remember('top_dir', self._find_top_dir)
+
+
+def get_context(runner):
+    """Return the GitContext for the current working directory."""
+    path = os.getcwd()
+    context = _contexts.get(path)
+    if context is None:
+        context = GitContext(path, runner)
+        _contexts[path] = context
+    return context
+
+
+def reset_contexts():
+    """Forget the GitContexts of all working directories."""
+    _contexts.clear()
+
+
+def close_backends():
+    """Shut down helper processes and report the git processes saved."""
+    saved = 0
+    started = 0
+    for backend in _backends.values():
+        backend.close()
+        saved += backend.forks_saved
+        started += getattr(backend, 'processes_started', 0)
+    _backends.clear()
+    if saved or started:
+        log.debug('[pbr] git backend saved %d git processes using %d helper '
+                  'processes' % (saved, started))
+    return saved - started
+
+
+atexit.register(close_backends)
@@ -25,8 +25,8 @@ class BackwardsCompatConfig(base.BaseConfig):
         self.config['include_package_data'] = 'True'
         packaging.append_text_list(
             self.config, 'dependency_links',
-            packaging.parse_dependency_links())
+            packaging.get_requirements_set().dependency_links)
         packaging.append_text_list(
             self.config, 'tests_require',
-            packaging.parse_requirements(
-                packaging.TEST_REQUIREMENTS_FILES))
+            packaging.get_requirements_set(
+                packaging.TEST_REQUIREMENTS_FILES).requirements)
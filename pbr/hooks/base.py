@@ -13,6 +13,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from pbr import trace
+
 
 class BaseConfig(object):
 
@@ -24,8 +26,9 @@ class BaseConfig(object):
         self.pbr_config = config.get('pbr', dict())
 
     def run(self):
-        self.hook()
-        self.save()
+        with trace.phase('config %s' % self.__class__.__name__):
+            self.hook()
+            self.save()
 
     def hook(self):
         pass
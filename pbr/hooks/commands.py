@@ -43,16 +43,18 @@ class CommandsConfig(base.BaseConfig):
         if os.name != 'nt':
             easy_install.get_script_args = packaging.override_get_script_args
 
-        if packaging.have_sphinx():
-            self.add_command('pbr.packaging.LocalBuildDoc')
-            self.add_command('pbr.packaging.LocalBuildLatex')
+        # Only look for sphinx here: importing it is left until a command
+        # needs it, and a sphinx pbr cannot use then skips the command.
+        if packaging.sphinx_installed():
+            self.add_command('pbr.builddoc.LocalBuildDoc')
+            self.add_command('pbr.builddoc.LocalBuildLatex')
 
         if os.path.exists('.testr.conf') and packaging.have_testr():
             # There is a .testr.conf file. We want to use it.
-            self.add_command('pbr.packaging.TestrTest')
+            self.add_command('pbr.testr_command.TestrTest')
         elif self.config.get('nosetests', False) and packaging.have_nose():
             # We seem to still have nose configured
-            self.add_command('pbr.packaging.NoseTest')
+            self.add_command('pbr.nose_command.NoseTest')
 
         use_egg = packaging.get_boolean_option(
             self.pbr_config, 'use-egg', 'PBR_USE_EGG')
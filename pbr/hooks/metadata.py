@@ -26,7 +26,7 @@ class MetadataConfig(base.BaseConfig):
             self.config['name'], self.config.get('version', None))
         packaging.append_text_list(
             self.config, 'requires_dist',
-            packaging.parse_requirements())
+            packaging.get_requirements_set().requirements)
 
     def get_name(self):
         return self.config['name']
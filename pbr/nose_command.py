@@ -0,0 +1,35 @@
+# Copyright 2013 Hewlett-Packard Development Company, L.P.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""setuptools command to run the tests with nose.
+
+This module imports nose, so it is only imported when distutils
+instantiates the command; see :func:`pbr.packaging.have_nose`.
+"""
+
+from nose import commands
+
+from pbr import packaging
+
+
+class NoseTest(commands.nosetests, packaging._PipInstallTestRequires):
+    """Fallback test runner if testr is a no-go."""
+
+    command_name = 'test'
+
+    def run(self):
+        self.pre_run()
+        # Can't use super - base class old-style class
+        commands.nosetests.run(self)
@@ -20,21 +20,21 @@ Utilities with minimum-depends for use in setup.py
 
 from __future__ import unicode_literals
 
+import collections
 from distutils.command import install as du_install
 import distutils.errors
 from distutils import log
 import email
+import hashlib
 import io
+import itertools
 import os
 import re
 import subprocess
 import sys
-try:
-    import cStringIO
-except ImportError:
-    import io as cStringIO
+import types
+import warnings
 
-import pkg_resources
 from setuptools.command import easy_install
 from setuptools.command import egg_info
 from setuptools.command import install
@@ -42,6 +42,10 @@ from setuptools.command import install_scripts
 from setuptools.command import sdist
 
 from pbr import extra_files
+from pbr import git
+from pbr import refs
+from pbr import requirements
+from pbr import trace
 from pbr import version
 
 TRUE_VALUES = ('true', '1', 'yes')
@@ -72,21 +76,113 @@ def append_text_list(config, key, text_list):
     config[key] = '\n'.join(new_value)
 
 
+# The distributions installed on sys.path, by key, once looked up.
+_installed_distributions = None
+
+
+def _get_installed_distributions():
+    global _installed_distributions
+    if _installed_distributions is None:
+        import pkg_resources
+
+        _installed_distributions = dict(
+            (dist.key, dist) for dist in pkg_resources.WorkingSet())
+    return _installed_distributions
+
+
+def _unsatisfied_requirements(requires):
+    """Return the requirements that the installed distributions do not meet.
+
+    Anything that cannot be checked without pip - links, editables, extras -
+    is returned as unsatisfied.
+    """
+    import pkg_resources
+
+    installed = _get_installed_distributions()
+    unsatisfied = []
+    for line in requires:
+        try:
+            requirement = pkg_resources.Requirement.parse(line)
+        except ValueError:
+            unsatisfied.append(line)
+            continue
+        marker = getattr(requirement, 'marker', None)
+        # pip evaluates requirements file markers with no extra requested.
+        if marker is not None and not marker.evaluate({'extra': ''}):
+            log.info('[pbr] Skipping %s: not for this environment' % line)
+            continue
+        dist = installed.get(requirement.key)
+        if (requirement.extras or dist is None
+                or dist.version not in requirement):
+            unsatisfied.append(line)
+            continue
+        log.info('[pbr] Skipping %s: %s is installed' % (line, dist))
+    return unsatisfied
+
+
+def _get_wheelhouse(option_dict):
+    """Return the local wheelhouse to install from, or None.
+
+    PBR_WHEELHOUSE in the environment overrides the wheelhouse option.
+    """
+    wheelhouse = (os.getenv('PBR_WHEELHOUSE')
+                  or option_dict.get('wheelhouse', (None, None))[1])
+    if not wheelhouse:
+        return None
+    return os.path.abspath(os.path.expanduser(wheelhouse))
+
+
+def _pip_wheel(links, requires, wheelhouse):
+    """Build wheels of requires and their dependencies into wheelhouse."""
+    if not os.path.isdir(wheelhouse):
+        os.makedirs(wheelhouse)
+    cmd = [sys.executable, '-m', 'pip.__init__', 'wheel',
+           '--wheel-dir=%s' % wheelhouse, '--find-links=%s' % wheelhouse]
+    for link in links:
+        cmd.append("-f")
+        cmd.append(link)
+    _run_shell_command(
+        cmd + requires,
+        throw_on_error=True, buffer=False, env=dict(PIP_USE_WHEEL=b"true"))
+
+
 def _pip_install(links, requires, root=None, option_dict=dict()):
+    global _installed_distributions
     if get_boolean_option(
             option_dict, 'skip_pip_install', 'SKIP_PIP_INSTALL'):
         return
+    wheelhouse = _get_wheelhouse(option_dict)
+    if (wheelhouse and requires and get_boolean_option(
+            option_dict, 'wheelhouse_build', 'PBR_WHEELHOUSE_BUILD')):
+        # Everything, so that the wheelhouse serves where nothing is
+        # installed yet.
+        _pip_wheel(links, requires, wheelhouse)
+    if not root:
+        # What is installed here says nothing about an alternate root.
+        requires = _unsatisfied_requirements(requires)
+        if not requires:
+            return
     cmd = [sys.executable, '-m', 'pip.__init__', 'install']
     if root:
         cmd.append("--root=%s" % root)
-    for link in links:
-        cmd.append("-f")
-        cmd.append(link)
+    if wheelhouse:
+        # The wheelhouse stands in for the index and the dependency links.
+        cmd.append("--no-index")
+        cmd.append("--find-links=%s" % wheelhouse)
+    else:
+        for link in links:
+            cmd.append("-f")
+            cmd.append(link)
 
     # NOTE(ociuhandu): popen on Windows does not accept unicode strings
-    _run_shell_command(
-        cmd + requires,
-        throw_on_error=True, buffer=False, env=dict(PIP_USE_WHEEL=b"true"))
+    try:
+        _run_shell_command(
+            cmd + requires,
+            throw_on_error=True, buffer=False,
+            env=dict(PIP_USE_WHEEL=b"true"))
+    finally:
+        # pip has changed what is installed.
+        _installed_distributions = None
 
 
 def _any_existing(file_list):
@@ -101,87 +197,36 @@ def get_reqs_from_files(requirements_files):
     return []
 
 
-def parse_requirements(requirements_files=None):
+def get_requirements_set(requirements_files=None):
+    """Return the shared requirements.RequirementsSet for the files.
 
+    :param requirements_files: The candidate files, of which the first that
+        exists is used. Defaults to get_requirements_files().
+    """
     if requirements_files is None:
         requirements_files = get_requirements_files()
+    return requirements.get_requirements_set(requirements_files)
 
-    def egg_fragment(match):
-        # take a versioned egg fragment and return a
-        # versioned package requirement e.g.
-        # nova-1.2.3 becomes nova>=1.2.3
-        return re.sub(r'([\w.]+)-([\w.-]+)',
-                      r'\1>=\2',
-                      match.group(1))
-
-    requirements = []
-    for line in get_reqs_from_files(requirements_files):
-        # Ignore comments
-        if (not line.strip()) or line.startswith('#'):
-            continue
 
-        # Handle nested requirements files such as:
-        # -r other-requirements.txt
-        if line.startswith('-r'):
-            req_file = line.partition(' ')[2]
-            requirements += parse_requirements([req_file])
-            continue
-
-        try:
-            project_name = pkg_resources.Requirement.parse(line).project_name
-        except ValueError:
-            project_name = None
-
-        # For the requirements list, we need to inject only the portion
-        # after egg= so that distutils knows the package it's looking for
-        # such as:
-        # -e git://github.com/openstack/nova/master#egg=nova
-        # -e git://github.com/openstack/nova/master#egg=nova-1.2.3
-        if re.match(r'\s*-e\s+', line):
-            line = re.sub(r'\s*-e\s+.*#egg=(.*)$', egg_fragment, line)
-        # such as:
-        # http://github.com/openstack/nova/zipball/master#egg=nova
-        # http://github.com/openstack/nova/zipball/master#egg=nova-1.2.3
-        elif re.match(r'\s*https?:', line):
-            line = re.sub(r'\s*https?:.*#egg=(.*)$', egg_fragment, line)
-        # -f lines are for index locations, and don't get used here
-        elif re.match(r'\s*-f\s+', line):
-            line = None
-            reason = 'Index Location'
-
-        if line is not None:
-            requirements.append(line)
-        else:
-            log.info(
-                '[pbr] Excluding %s: %s' % (project_name, reason))
-
-    return requirements
+def parse_requirements(requirements_files=None):
+    return list(get_requirements_set(requirements_files).requirements)
 
 
 def parse_dependency_links(requirements_files=None):
-    if requirements_files is None:
-        requirements_files = get_requirements_files()
-    dependency_links = []
-    # dependency_links inject alternate locations to find packages listed
-    # in requirements
-    for line in get_reqs_from_files(requirements_files):
-        # skip comments and blank lines
-        if re.match(r'(\s*#)|(\s*$)', line):
-            continue
-        # lines with -e or -f need the whole line, minus the flag
-        if re.match(r'\s*-[ef]\s+', line):
-            dependency_links.append(re.sub(r'\s*-[ef]\s+', '', line))
-        # lines that are only urls can go in unmolested
-        elif re.match(r'\s*https?:', line):
-            dependency_links.append(line)
-    return dependency_links
+    return list(get_requirements_set(requirements_files).dependency_links)
 
 
 def _run_git_command(cmd, git_dir, **kwargs):
     if not isinstance(cmd, (list, tuple)):
         cmd = [cmd]
-    return _run_shell_command(
-        ['git', '--git-dir=%s' % git_dir] + cmd, **kwargs)
+    return _get_git_backend(git_dir).run(cmd, **kwargs)
+
+
+def _get_git_backend(git_dir):
+    # Look _run_shell_command up on each call rather than binding it into
+    # the (process-wide) backend, so that it can still be replaced.
+    return git.get_backend(
+        git_dir, lambda cmd, **kwargs: _run_shell_command(cmd, **kwargs))
 
 
 def _run_shell_command(cmd, throw_on_error=False, buffer=True, env=None):
@@ -196,11 +241,19 @@ def _run_shell_command(cmd, throw_on_error=False, buffer=True, env=None):
     if env:
         newenv.update(env)
 
-    output = subprocess.Popen(cmd,
-                              stdout=out_location,
-                              stderr=err_location,
-                              env=newenv)
+    traced = trace.begin(cmd)
+    try:
+        output = subprocess.Popen(cmd,
+                                  stdout=out_location,
+                                  stderr=err_location,
+                                  env=newenv)
+    except OSError:
+        trace.end(traced, None)
+        raise
     out = output.communicate()
+    trace.end(traced, output.returncode,
+              *[len(stream) if stream is not None else None
+                for stream in out])
     if output.returncode and throw_on_error:
         raise distutils.errors.DistutilsError(
             "%s returned %d" % (cmd, output.returncode))
@@ -209,19 +262,33 @@ def _run_shell_command(cmd, throw_on_error=False, buffer=True, env=None):
     return out[0].strip().decode('utf-8')
 
 
+def _get_git_context():
+    """Return the git.GitContext for the current working directory."""
+    return git.get_context(
+        lambda cmd, **kwargs: _run_shell_command(cmd, **kwargs))
+
+
 def _get_git_directory():
-    return _run_shell_command(['git', 'rev-parse', '--git-dir'])
+    return _get_git_context().git_dir
+
+
+def _get_history_snapshot(git_dir=None):
+    """Return the shared HistorySnapshot for git_dir.
+
+    :return: A git.HistorySnapshot, or None when not in a git repository.
+    """
+    if git_dir is None:
+        git_dir = _get_git_directory()
+    if not git_dir:
+        return None
+    return _get_git_backend(git_dir).history()
 
 
 def _git_is_installed():
-    try:
-        # We cannot use 'which git' as it may not be available
-        # in some distributions, So just try 'git --version'
-        # to see if we run into trouble
-        _run_shell_command(['git', '--version'])
-    except OSError:
-        return False
-    return True
+    # We cannot use 'which git' as it may not be available
+    # in some distributions, So the context just tries 'git --version'
+    # to see if we run into trouble
+    return _get_git_context().git_installed
 
 
 def _get_highest_tag(tags):
@@ -230,28 +297,125 @@ def _get_highest_tag(tags):
     Pass in a list of tag strings and this will return the highest
     (latest) as sorted by the pkg_resources version parser.
     """
+    import pkg_resources
+
     return max(tags, key=pkg_resources.parse_version)
 
 
+def _get_highest_version_tag(tags):
+    """Find the highest semantic version among tags.
+
+    Tags that are not valid versions are ignored.
+
+    :return: The release string of the highest version, or None.
+    """
+    highest = version.SemanticVersion.max_of(tags)
+    if highest is None:
+        return None
+    return version.SemanticVersion.from_pip_string(highest).release_string()
+
+
+_TAG_INDEX_STATE = 'tag-index'
+_TagInfo = collections.namedtuple('_TagInfo', ['tags', 'version', 'heading'])
+_tag_indexes = {}
+
+
+def _read_tag_targets(git_dir):
+    """Return a dict mapping the tag names of git_dir to the commits."""
+    peeled = refs.read_peeled_tags(git_dir)
+    if peeled is not None:
+        return dict((name, commit)
+                    for name, (commit, annotated) in peeled.items())
+    targets = {}
+    output = _run_git_command(
+        ['for-each-ref', '--format=%(objectname) %(*objectname) %(refname)',
+         'refs/tags'], git_dir)
+    for line in output.split('\n'):
+        fields = line.split(' ')
+        if len(fields) == 3 and fields[2].startswith('refs/tags/'):
+            targets[fields[2][len('refs/tags/'):]] = fields[1] or fields[0]
+    return targets
+
+
+def _get_tag_index(git_dir):
+    """Return the tags of git_dir, indexed by the commit they tag.
+
+    Each tag is parsed once per state of the repository's tags; the index
+    is kept in git_dir for later runs.
+
+    :return: A dict mapping commit shas to _TagInfo tuples: the commit's tag
+        names, the release string of the highest of them that is a semantic
+        version (or None), and the tag heading the commit's ChangeLog
+        section (or None if that could not be worked out).
+    """
+    digest = refs.refs_digest(git_dir)
+    key = os.path.abspath(git_dir)
+    cached = _tag_indexes.get(key)
+    if cached is not None and cached[0] == digest:
+        return cached[1]
+    state = git.read_state(git_dir, _TAG_INDEX_STATE)
+    if state and state.get('digest') == digest:
+        index = dict((commit, _TagInfo(*info))
+                     for commit, info in state['commits'].items())
+    else:
+        by_commit = {}
+        for name, commit in _read_tag_targets(git_dir).items():
+            by_commit.setdefault(commit, []).append(name)
+        index = {}
+        for commit, names in by_commit.items():
+            names.sort()
+            # Tags that are not versions at all are only used to head
+            # ChangeLog sections; don't warn about them here.
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                try:
+                    heading = _get_highest_tag(names)
+                except Exception:
+                    heading = None
+            index[commit] = _TagInfo(
+                names, _get_highest_version_tag(names), heading)
+        git.write_state(git_dir, _TAG_INDEX_STATE, dict(
+            digest=digest, commits=index))
+    _tag_indexes[key] = (digest, index)
+    return index
+
+
+def _get_changelog_headings(git_dir):
+    """Return a dict mapping sets of tags to the tag heading their section."""
+    return dict((frozenset(info.tags), info.heading)
+                for info in _get_tag_index(git_dir).values()
+                if info.heading is not None)
+
+
 def get_boolean_option(option_dict, option_name, env_name):
     return ((option_name in option_dict
              and option_dict[option_name][1].lower() in TRUE_VALUES) or
             str(os.getenv(env_name)).lower() in TRUE_VALUES)
 
 
-def _iter_changelog(changelog):
+_CHANGELOG_HEADER = "CHANGES\n=======\n\n"
+_CHANGELOG_STATE = 'changelog'
+
+
+def _iter_changelog(changelog, headings=None):
     """Convert a oneline log iterator to formatted strings.
 
     :param changelog: An iterator of one line log entries like
         that given by _iter_log_oneline.
+    :param headings: A dict mapping sets of tags to the tag to head their
+        section with, like that given by _get_changelog_headings.
     :return: An iterator over (release, formatted changelog) tuples.
     """
+    if headings is None:
+        headings = {}
     first_line = True
     current_release = None
-    yield current_release, "CHANGES\n=======\n\n"
+    yield current_release, _CHANGELOG_HEADER
     for hash, tags, msg in changelog:
         if tags:
-            current_release = _get_highest_tag(tags)
+            current_release = headings.get(frozenset(tags))
+            if current_release is None:
+                current_release = _get_highest_tag(tags)
             underline = len(current_release) * '-'
             if not first_line:
                 yield current_release, '\n'
@@ -266,13 +430,15 @@ def _iter_changelog(changelog):
         first_line = False
 
 
-def _iter_log_oneline(git_dir=None, option_dict=None):
+def _iter_log_oneline(git_dir=None, option_dict=None, snapshot=None):
     """Iterate over --oneline log entries if possible.
 
     This parses the output into a structured form but does not apply
     presentation logic to the output - making it suitable for different
     uses.
 
+    :param snapshot: A HistorySnapshot to take the entries from instead of
+        running git log.
     :return: An iterator of (hash, tags_set, 1st_line) tuples, or None if
         changelog generation is disabled / not available.
     """
@@ -282,6 +448,9 @@ def _iter_log_oneline(git_dir=None, option_dict=None):
                                      'SKIP_WRITE_GIT_CHANGELOG')
     if should_skip:
         return
+    if snapshot is not None:
+        log.info('[pbr] Generating ChangeLog')
+        return snapshot.iter_oneline()
     if git_dir is None:
         git_dir = _get_git_directory()
     if not git_dir:
@@ -300,8 +469,9 @@ def _iter_log_inner(git_dir):
     """
     log.info('[pbr] Generating ChangeLog')
     log_cmd = ['log', '--oneline', '--decorate']
-    changelog = _run_git_command(log_cmd, git_dir)
-    for line in changelog.split('\n'):
+    # Stream the log rather than buffering it, so that the ChangeLog can be
+    # written while git is still walking history.
+    for line in _get_git_backend(git_dir).stream(log_cmd):
         line_parts = line.split()
         if len(line_parts) < 2:
             continue
@@ -323,13 +493,100 @@ def _iter_log_inner(git_dir):
         yield line_parts[0], tags, msg
 
 
+def _new_commits(git_dir, snapshot, head, count):
+    """Return the commits of snapshot that an older snapshot did not have.
+
+    :param head: The sha of the older snapshot's HEAD.
+    :param count: The number of commits in the older snapshot.
+    :return: The new commits, newest first, reading no further back than
+        head, or None if they cannot be shown to be all the commits
+        reachable from snapshot but not from head, e.g. because history was
+        rewritten.
+    """
+    new = []
+    for commit in snapshot.iter_commits():
+        if commit.sha == head:
+            break
+        new.append(commit)
+    else:
+        return None
+    # Log order only guarantees that every new commit precedes the old head
+    # if the new commits' parents are all new or the old head itself;
+    # otherwise count the commits to check that none was missed.
+    known = set(commit.sha for commit in new)
+    known.add(head)
+    if any(parent not in known for commit in new for parent in commit.parents):
+        total = _run_git_command(
+            ['rev-list', '--count', snapshot.head().sha], git_dir)
+        if total != str(count + len(new)):
+            return None
+    return new
+
+
+def _update_changelog(git_dir, snapshot, path):
+    """Add the commits made since path was last written to it.
+
+    Only the commits newer than the one the ChangeLog was last written from
+    are read from the history. The update is abandoned if the ChangeLog was
+    edited, if a tag changed other than by tagging a new commit (tags head
+    the sections of older commits), or if the new commits cannot be shown
+    to be all those missing from the ChangeLog, e.g. because history was
+    rewritten.
+
+    :return: A (content, commit count) tuple, or None if the ChangeLog has
+        to be regenerated from scratch.
+    """
+    state = git.read_state(git_dir, _CHANGELOG_STATE)
+    if (not state or state.get('path') != os.path.abspath(path)
+            or not os.path.exists(path)):
+        return None
+    with io.open(path, 'r', encoding='utf-8') as changelog_file:
+        old = changelog_file.read()
+    if (hashlib.sha1(old.encode('utf-8')).hexdigest() != state.get('digest')
+            or not old.startswith(_CHANGELOG_HEADER)):
+        return None
+    new = _new_commits(git_dir, snapshot, state['head'], state['count'])
+    if new is None:
+        return None
+    new_tags = set(tag for commit in new for tag in commit.tags)
+    old_tags = state['tags']
+    for name, target in refs.read_tags(git_dir).items():
+        if name in new_tags:
+            if name in old_tags:
+                return None
+        elif old_tags.pop(name, None) != target:
+            return None
+    if old_tags:
+        # Tags were deleted.
+        return None
+    if not new:
+        return old, state['count']
+    log.info('[pbr] Adding %d commits to ChangeLog' % len(new))
+    entries = _iter_changelog(
+        ((commit.short_sha, set(commit.tags), commit.subject)
+         for commit in new), _get_changelog_headings(git_dir))
+    body = ''.join(content for release, content in itertools.islice(
+        entries, 1, None))
+    # The old first entry's section heading is separated from new entries.
+    separator = '\n' if state['head_tagged'] else ''
+    return (_CHANGELOG_HEADER + body + separator +
+            old[len(_CHANGELOG_HEADER):], state['count'] + len(new))
+
+
 def write_git_changelog(git_dir=None, dest_dir=os.path.curdir,
-                        option_dict=dict(), changelog=None):
-    """Write a changelog based on the git changelog."""
+                        option_dict=dict(), changelog=None, snapshot=None):
+    """Write a changelog based on the git changelog.
+
+    :param snapshot: A HistorySnapshot of git_dir to write the changelog
+        from. A ChangeLog last written from an earlier snapshot of git_dir
+        is updated by reading only the commits it is missing.
+    """
     if not changelog:
-        changelog = _iter_log_oneline(git_dir=git_dir, option_dict=option_dict)
+        changelog = _iter_log_oneline(git_dir=git_dir, option_dict=option_dict,
+                                      snapshot=snapshot)
         if changelog:
-            changelog = _iter_changelog(changelog)
+            changelog = _iter_changelog(
+                changelog, git_dir and _get_changelog_headings(git_dir))
     if not changelog:
         return
     log.info('[pbr] Writing ChangeLog')
@@ -338,13 +595,99 @@ def write_git_changelog(git_dir=None, dest_dir=os.path.curdir,
     if (os.path.exists(new_changelog)
             and not os.access(new_changelog, os.W_OK)):
         return
+    incremental = snapshot is not None and git_dir
+    update = incremental and _update_changelog(git_dir, snapshot,
+                                               new_changelog)
+    if update:
+        changelog = [(None, update[0])]
+    digest = hashlib.sha1()
     with io.open(new_changelog, "w", encoding="utf-8") as changelog_file:
         for release, content in changelog:
             changelog_file.write(content)
+            digest.update(content.encode('utf-8'))
+    if incremental and snapshot.head() is not None:
+        git.write_state(git_dir, _CHANGELOG_STATE, dict(
+            path=os.path.abspath(new_changelog),
+            digest=digest.hexdigest(),
+            tags=refs.read_tags(git_dir),
+            head=snapshot.head().sha,
+            head_tagged=bool(snapshot.head().tags),
+            count=update[1] if update else snapshot.length()))
+
+
+_AUTHORS_STATE = 'authors'
+# don't include jenkins email address in AUTHORS file
+_IGNORE_EMAILS = 'jenkins@review infra@lists jenkins@openstack'
+_ignore_emails_res = {}
+
+
+def _get_ignore_emails_re(option_dict):
+    """Return a regex matching the authors to leave out of AUTHORS.
+
+    The authors_ignore_emails option lists email address fragments, any of
+    which excludes an author.
+    """
+    emails = option_dict.get('authors_ignore_emails',
+                             (None, _IGNORE_EMAILS))[1]
+    emails = tuple(sorted(set(emails.split())))
+    if emails not in _ignore_emails_res:
+        _ignore_emails_res[emails] = re.compile(
+            '|'.join(re.escape(email) for email in emails) or '(?!)')
+    return _ignore_emails_res[emails]
+
+
+def _mailmap_digest(git_dir):
+    """Return a digest of the .mailmap that git log applies to authors."""
+    git_dir = os.path.abspath(git_dir)
+    if os.path.basename(git_dir) == '.git':
+        top_dir = os.path.dirname(git_dir)
+    else:
+        top_dir = _get_git_context().top_dir
+    try:
+        with open(os.path.join(top_dir, '.mailmap'), 'rb') as mailmap:
+            return hashlib.sha1(mailmap.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
 
+def _get_authors(git_dir, snapshot):
+    """Return the (authors, co_authors) sets of the commits in snapshot.
 
-def generate_authors(git_dir=None, dest_dir='.', option_dict=dict()):
-    """Create AUTHORS file using git commits."""
+    The sets are kept in an index in git_dir, so that only the commits made
+    since the last call need to be read from the history.
+    """
+    head = snapshot.head()
+    if head is None:
+        return set(), set()
+    mailmap = _mailmap_digest(git_dir)
+    state = git.read_state(git_dir, _AUTHORS_STATE)
+    new = None
+    if state and state.get('mailmap') == mailmap:
+        new = _new_commits(git_dir, snapshot, state['head'], state['count'])
+    if new is None:
+        authors, co_authors, count = set(), set(), 0
+        new = snapshot.stream()
+    else:
+        authors = set(state['authors'])
+        co_authors = set(state['co_authors'])
+        count = state['count']
+    for commit in new:
+        authors.add(commit.author)
+        co_authors.update(commit.co_authors)
+        count += 1
+    git.write_state(git_dir, _AUTHORS_STATE, dict(
+        head=head.sha, count=count, mailmap=mailmap,
+        authors=sorted(authors), co_authors=sorted(co_authors)))
+    return authors, co_authors
+
+
+def generate_authors(git_dir=None, dest_dir='.', option_dict=dict(),
+                     snapshot=None):
+    """Create AUTHORS file using git commits.
+
+    :param snapshot: A HistorySnapshot to take the authors from instead of
+        reading the history of git_dir.
+    """
     should_skip = get_boolean_option(option_dict, 'skip_authors',
                                      'SKIP_GENERATE_AUTHORS')
     if should_skip:
@@ -356,26 +699,16 @@ def generate_authors(git_dir=None, dest_dir='.', option_dict=dict()):
             and not os.access(new_authors, os.W_OK)):
         return
     log.info('[pbr] Generating AUTHORS')
-    ignore_emails = '(jenkins@review|infra@lists|jenkins@openstack)'
     if git_dir is None:
         git_dir = _get_git_directory()
     if git_dir:
-        authors = []
-
-        # don't include jenkins email address in AUTHORS file
-        git_log_cmd = ['log', '--format=%aN <%aE>']
-        authors += _run_git_command(git_log_cmd, git_dir).split('\n')
-        authors = [a for a in authors if not re.search(ignore_emails, a)]
-
-        # get all co-authors from commit messages
-        co_authors_out = _run_git_command('log', git_dir)
-        co_authors = re.findall('Co-authored-by:.+', co_authors_out,
-                                re.MULTILINE)
-        co_authors = [signed.split(":", 1)[1].strip()
-                      for signed in co_authors if signed]
-
-        authors += co_authors
-        authors = sorted(set(authors))
+        if snapshot is None:
+            snapshot = _get_history_snapshot(git_dir)
+        authors, co_authors = _get_authors(git_dir, snapshot)
+        ignore_emails = _get_ignore_emails_re(option_dict)
+        authors = set(author for author in authors
+                      if not ignore_emails.search(author))
+        authors = sorted(authors | co_authors)
 
         with open(new_authors, 'wb') as new_authors_fh:
             if os.path.exists(old_authors):
@@ -401,23 +734,6 @@ def _find_git_files(dirname='', git_dir=None):
     return [f for f in file_list if f]
 
 
-_rst_template = """%(heading)s
-%(underline)s
-
-.. automodule:: %(module)s
-  :members:
-  :undoc-members:
-  :show-inheritance:
-"""
-
-
-def _find_modules(arg, dirname, files):
-    for filename in files:
-        if filename.endswith('.py') and filename != '__init__.py':
-            arg["%s.%s" % (dirname.replace('/', '.'),
-                           filename[:-3])] = True
-
-
 class LocalInstall(install.install):
     """Runs python setup.py install in a sensible manner.
 
@@ -448,17 +764,42 @@ class LocalInstall(install.install):
         return du_install.install.run(self)
 
 
-def _newer_requires_files(egg_info_dir):
-    """Check to see if any of the requires files are newer than egg-info."""
-    for target, sources in (('requires.txt', get_requirements_files()),
-                            ('test-requires.txt', TEST_REQUIREMENTS_FILES)):
-        target_path = os.path.join(egg_info_dir, target)
-        for src in _any_existing(sources):
-            if (not os.path.exists(target_path) or
-                    os.path.getmtime(target_path)
-                    < os.path.getmtime(src)):
-                return True
-    return False
+# Holds _requires_digest() as of the last time pre_run brought egg-info and
+# the test requirements up to date.
+_REQUIRES_STAMP = 'pbr-requires.stamp'
+
+
+def _requires_digest():
+    """Hash the resolved runtime and test requirements.
+
+    Only what the requirements files say counts, so that a checkout which
+    merely touches them does not look like a change.
+    """
+    digest = hashlib.sha1()
+    for requirements_files in (get_requirements_files(),
+                               TEST_REQUIREMENTS_FILES):
+        requirements_set = get_requirements_set(requirements_files)
+        for entries in (requirements_set.requirements,
+                        requirements_set.dependency_links,
+                        requirements_set.index_locations):
+            text = '\n'.join(entries) + '\0'
+            if not isinstance(text, bytes):
+                text = text.encode('utf-8')
+            digest.update(text)
+    return digest.hexdigest()
+
+
+def _read_requires_stamp(egg_info_dir):
+    try:
+        with open(os.path.join(egg_info_dir, _REQUIRES_STAMP), 'r') as stamp:
+            return stamp.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _write_requires_stamp(egg_info_dir, digest):
+    with open(os.path.join(egg_info_dir, _REQUIRES_STAMP), 'w') as stamp:
+        stamp.write(digest + '\n')
 
 
 def _copy_test_requires_to(egg_info_dir):
@@ -473,7 +814,8 @@ class _PipInstallTestRequires(object):
 
     def install_test_requirements(self):
 
-        links = parse_dependency_links(TEST_REQUIREMENTS_FILES)
+        links = get_requirements_set(
+            TEST_REQUIREMENTS_FILES).dependency_links
         if self.distribution.tests_require:
             option_dict = self.distribution.get_option_dict('pbr')
             _pip_install(
@@ -481,59 +823,22 @@ class _PipInstallTestRequires(object):
                 option_dict=option_dict)
 
     def pre_run(self):
+        import pkg_resources
+
         self.egg_name = pkg_resources.safe_name(self.distribution.get_name())
         self.egg_info = "%s.egg-info" % pkg_resources.to_filename(
             self.egg_name)
+        digest = _requires_digest()
         if (not os.path.exists(self.egg_info) or
-                _newer_requires_files(self.egg_info)):
+                _read_requires_stamp(self.egg_info) != digest):
             ei_cmd = self.get_finalized_command('egg_info')
             ei_cmd.run()
             self.install_test_requirements()
             _copy_test_requires_to(self.egg_info)
-
-try:
-    from pbr import testr_command
-
-    class TestrTest(testr_command.Testr, _PipInstallTestRequires):
-        """Make setup.py test do the right thing."""
-
-        command_name = 'test'
-
-        def run(self):
-            self.pre_run()
-            # Can't use super - base class old-style class
-            testr_command.Testr.run(self)
-
-    _have_testr = True
-
-except ImportError:
-    _have_testr = False
-
-
-def have_testr():
-    return _have_testr
-
-try:
-    from nose import commands
-
-    class NoseTest(commands.nosetests, _PipInstallTestRequires):
-        """Fallback test runner if testr is a no-go."""
-
-        command_name = 'test'
-
-        def run(self):
-            self.pre_run()
-            # Can't use super - base class old-style class
-            commands.nosetests.run(self)
-
-    _have_nose = True
-
-except ImportError:
-    _have_nose = False
-
-
-def have_nose():
-    return _have_nose
+            _write_requires_stamp(self.egg_info, digest)
+        else:
+            log.info('[pbr] Requirements unchanged since %s' % os.path.join(
+                self.egg_info, _REQUIRES_STAMP))
 
 
 _script_text = """# PBR Generated from %(group)r
@@ -577,6 +882,7 @@ class LocalInstallScripts(install_scripts.install_scripts):
             get_script_args = easy_install.get_script_args
 
         import distutils.command.install_scripts
+        import pkg_resources
 
         self.run_command("egg_info")
         if self.distribution.scripts:
@@ -637,11 +943,62 @@ class LocalManifestMaker(egg_info.manifest_maker):
         self.filelist.include_pattern("*", prefix=ei_cmd.egg_info)
 
 
+_version_module_text = """# PBR Generated from egg_info; do not edit.
+
+version = %(version)r
+semantic = %(semantic)r
+git_sha = %(git_sha)r
+"""
+
+
+def write_version_modules(distribution):
+    """Write the version into each top level package of distribution.
+
+    pbr.version.VersionInfo reads the generated module in preference to
+    the installed metadata, so looking the version up at runtime neither
+    scans sys.path nor runs git.
+
+    :return: The paths written.
+    """
+    semantic = version.SemanticVersion.from_pip_string(
+        distribution.get_version())
+    git_sha = None
+    git_dir = _get_git_directory()
+    if git_dir:
+        git_sha = refs.read_ref(git_dir)
+    text = _version_module_text % dict(
+        version=semantic.release_string(), semantic=semantic.components(),
+        git_sha=git_sha)
+    root = (distribution.package_dir or {}).get('', '')
+    written = []
+    for package in distribution.packages or []:
+        if '.' in package:
+            continue
+        path = os.path.join(root, package, version.VERSION_MODULE + '.py')
+        if os.path.exists(path):
+            with io.open(path, 'r', encoding='utf-8') as existing:
+                if existing.read() == text:
+                    continue
+        log.info("[pbr] Writing %s" % path)
+        with io.open(path, 'w', encoding='utf-8') as module:
+            module.write(text)
+        written.append(path)
+    return written
+
+
 class LocalEggInfo(egg_info.egg_info):
     """Override the egg_info command to regenerate SOURCES.txt sensibly."""
 
     command_name = 'egg_info'
 
+    def run(self):
+        option_dict = self.distribution.get_option_dict('pbr')
+        if get_boolean_option(option_dict, 'version_module',
+                              'PBR_VERSION_MODULE'):
+            write_version_modules(self.distribution)
+        # egg_info.egg_info is an old style class, can't use super()
+        egg_info.egg_info.run(self)
+
     def find_sources(self):
         """Generate SOURCES.txt only if there isn't one already.
 
@@ -663,6 +1020,18 @@ class LocalEggInfo(egg_info.egg_info):
                 self.filelist.append(entry)
 
 
+def _write_git_files(option_dict):
+    """Write ChangeLog and AUTHORS from one pass over the git history."""
+    git_dir = _get_git_directory()
+    if not git_dir:
+        return
+    snapshot = _get_history_snapshot(git_dir)
+    write_git_changelog(git_dir=git_dir, option_dict=option_dict,
+                        snapshot=snapshot)
+    generate_authors(git_dir=git_dir, option_dict=option_dict,
+                     snapshot=snapshot)
+
+
 class LocalSDist(sdist.sdist):
     """Builds the ChangeLog and Authors files from VC first."""
 
@@ -670,202 +1039,163 @@ class LocalSDist(sdist.sdist):
 
     def run(self):
         option_dict = self.distribution.get_option_dict('pbr')
-        changelog = _iter_log_oneline(option_dict=option_dict)
-        if changelog:
-            changelog = _iter_changelog(changelog)
-        write_git_changelog(option_dict=option_dict, changelog=changelog)
-        generate_authors(option_dict=option_dict)
+        _write_git_files(option_dict)
         # sdist.sdist is an old style class, can't use super()
         sdist.sdist.run(self)
 
-try:
-    from sphinx import apidoc
-    from sphinx import application
-    from sphinx import config
-    from sphinx import setup_command
 
-    class LocalBuildDoc(setup_command.BuildDoc):
+def _module_available(name):
+    """Check whether the module name could be imported, without importing.
 
-        command_name = 'build_sphinx'
-        builders = ['html', 'man']
+    Only the module's parent packages are imported to locate it.
+    """
+    try:
+        from importlib import util as importlib_util
+        find_spec = importlib_util.find_spec
+    except (ImportError, AttributeError):
+        import pkgutil
+        try:
+            return pkgutil.find_loader(name) is not None
+        except ImportError:
+            return False
+    try:
+        return find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
 
-        def _get_source_dir(self):
-            option_dict = self.distribution.get_option_dict('build_sphinx')
-            if 'source_dir' in option_dict:
-                source_dir = os.path.join(option_dict['source_dir'][1], 'api')
-            else:
-                source_dir = 'doc/source/api'
-            if not os.path.exists(source_dir):
-                os.makedirs(source_dir)
-            return source_dir
-
-        def generate_autoindex(self, excluded_modules=None):
-            log.info("[pbr] Autodocumenting from %s"
-                     % os.path.abspath(os.curdir))
-            modules = {}
-            source_dir = self._get_source_dir()
-            for pkg in self.distribution.packages:
-                if '.' not in pkg:
-                    for dirpath, dirnames, files in os.walk(pkg):
-                        _find_modules(modules, dirpath, files)
-            module_list = set(modules.keys())
-            if excluded_modules is not None:
-                module_list -= set(excluded_modules)
-            module_list = sorted(module_list)
-            autoindex_filename = os.path.join(source_dir, 'autoindex.rst')
-            with open(autoindex_filename, 'w') as autoindex:
-                autoindex.write(""".. toctree::
-   :maxdepth: 1
-
-""")
-                for module in module_list:
-                    output_filename = os.path.join(source_dir,
-                                                   "%s.rst" % module)
-                    heading = "The :mod:`%s` Module" % module
-                    underline = "=" * len(heading)
-                    values = dict(module=module, heading=heading,
-                                  underline=underline)
-
-                    log.info("[pbr] Generating %s"
-                             % output_filename)
-                    with open(output_filename, 'w') as output_file:
-                        output_file.write(_rst_template % values)
-                    autoindex.write("   %s.rst\n" % module)
-
-        def _sphinx_tree(self):
-                source_dir = self._get_source_dir()
-                cmd = ['apidoc', '.', '-H', 'Modules', '-o', source_dir]
-                apidoc.main(cmd + self.autodoc_tree_excludes)
-
-        def _sphinx_run(self):
-            if not self.verbose:
-                status_stream = cStringIO.StringIO()
-            else:
-                status_stream = sys.stdout
-            confoverrides = {}
-            if self.version:
-                confoverrides['version'] = self.version
-            if self.release:
-                confoverrides['release'] = self.release
-            if self.today:
-                confoverrides['today'] = self.today
-            sphinx_config = config.Config(self.config_dir, 'conf.py', {}, [])
-            sphinx_config.init_values()
-            if self.builder == 'man' and len(sphinx_config.man_pages) == 0:
-                return
-            app = application.Sphinx(
-                self.source_dir, self.config_dir,
-                self.builder_target_dir, self.doctree_dir,
-                self.builder, confoverrides, status_stream,
-                freshenv=self.fresh_env, warningiserror=True)
-
-            try:
-                app.build(force_all=self.all_files)
-            except Exception as err:
-                from docutils import utils
-                if isinstance(err, utils.SystemMessage):
-                    sys.stder.write('reST markup error:\n')
-                    sys.stderr.write(err.args[0].encode('ascii',
-                                                        'backslashreplace'))
-                    sys.stderr.write('\n')
-                else:
-                    raise
-
-            if self.link_index:
-                src = app.config.master_doc + app.builder.out_suffix
-                dst = app.builder.get_outfilename('index')
-                os.symlink(src, dst)
-
-        def run(self):
-            option_dict = self.distribution.get_option_dict('pbr')
-            if _git_is_installed():
-                write_git_changelog(option_dict=option_dict)
-                generate_authors(option_dict=option_dict)
-            tree_index = get_boolean_option(option_dict,
-                                            'autodoc_tree_index_modules',
-                                            'AUTODOC_TREE_INDEX_MODULES')
-            auto_index = get_boolean_option(option_dict,
-                                            'autodoc_index_modules',
-                                            'AUTODOC_INDEX_MODULES')
-            if not os.getenv('SPHINX_DEBUG'):
-                # NOTE(afazekas): These options can be used together,
-                # but they do a very similar thing in a different way
-                if tree_index:
-                    self._sphinx_tree()
-                if auto_index:
-                    self.generate_autoindex(
-                        option_dict.get(
-                            "autodoc_exclude_modules",
-                            [None, ""])[1].split())
-
-            for builder in self.builders:
-                self.builder = builder
-                self.finalize_options()
-                self.project = self.distribution.get_name()
-                self.version = self.distribution.get_version()
-                self.release = self.distribution.get_version()
-                if get_boolean_option(option_dict, 'warnerrors', 'WARNERRORS'):
-                    self._sphinx_run()
-                else:
-                    setup_command.BuildDoc.run(self)
-
-        def initialize_options(self):
-            # Not a new style class, super keyword does not work.
-            setup_command.BuildDoc.initialize_options(self)
-
-            # NOTE(dstanek): exclude setup.py from the autodoc tree index
-            # builds because all projects will have an issue with it
-            self.autodoc_tree_excludes = ['setup.py']
-
-        def finalize_options(self):
-            # Not a new style class, super keyword does not work.
-            setup_command.BuildDoc.finalize_options(self)
-            # Allow builders to be configurable - as a comma separated list.
-            if not isinstance(self.builders, list) and self.builders:
-                self.builders = self.builders.split(',')
-
-            # NOTE(dstanek): check for autodoc tree exclusion overrides
-            # in the setup.cfg
-            opt = 'autodoc_tree_excludes'
-            option_dict = self.distribution.get_option_dict('pbr')
-            if opt in option_dict:
-                self.autodoc_tree_excludes = option_dict[opt][1]
-                self.ensure_string_list(opt)
 
-    class LocalBuildLatex(LocalBuildDoc):
-        builders = ['latex']
-        command_name = 'build_sphinx_latex'
+def have_testr():
+    return _module_available('testrepository')
+
 
-    _have_sphinx = True
+def have_nose():
+    return _module_available('nose')
 
-except ImportError:
-    _have_sphinx = False
+
+def sphinx_installed():
+    """Check whether sphinx can be found, without importing it.
+
+    Unlike have_sphinx, this does not tell whether pbr's Sphinx commands
+    will work with the sphinx found.
+    """
+    return _module_available('sphinx')
+
+
+_have_sphinx = None
 
 
 def have_sphinx():
+    """Check whether the sphinx modules pbr's Sphinx commands use import.
+
+    This imports sphinx; see sphinx_installed for a check that does not.
+    """
+    global _have_sphinx
+    if _have_sphinx is None:
+        try:
+            from sphinx import apidoc  # noqa
+            from sphinx import application  # noqa
+            from sphinx import config  # noqa
+            from sphinx import setup_command  # noqa
+            _have_sphinx = True
+        except ImportError:
+            _have_sphinx = False
     return _have_sphinx
 
 
-def _get_increment_kwargs(git_dir, tag):
+# Commands whose classes import optional dependencies, by the name they are
+# configured with in setup.cfg, mapped to the distutils command name and the
+# class implementing it. The class is only imported when distutils looks the
+# command up; see pbr.util.CommandClasses.
+LAZY_COMMANDS = {
+    'pbr.builddoc.LocalBuildDoc': (
+        'build_sphinx', 'pbr.builddoc.LocalBuildDoc'),
+    'pbr.builddoc.LocalBuildLatex': (
+        'build_sphinx_latex', 'pbr.builddoc.LocalBuildLatex'),
+    'pbr.testr_command.TestrTest': ('test', 'pbr.testr_command.TestrTest'),
+    'pbr.nose_command.NoseTest': ('test', 'pbr.nose_command.NoseTest'),
+    # The names these commands had when pbr.packaging defined them.
+    'pbr.packaging.LocalBuildDoc': (
+        'build_sphinx', 'pbr.builddoc.LocalBuildDoc'),
+    'pbr.packaging.LocalBuildLatex': (
+        'build_sphinx_latex', 'pbr.builddoc.LocalBuildLatex'),
+    'pbr.packaging.TestrTest': ('test', 'pbr.testr_command.TestrTest'),
+    'pbr.packaging.NoseTest': ('test', 'pbr.nose_command.NoseTest'),
+}
+
+
+def _get_moved_command(name):
+    """Import a command class that used to be defined in this module.
+
+    :raises: AttributeError if name is not such a class, or if the class
+        cannot be imported.
+    """
+    lazy = LAZY_COMMANDS.get('%s.%s' % (__name__, name))
+    if lazy is None:
+        raise AttributeError(
+            "module %r has no attribute %r" % (__name__, name))
+    from pbr import util
+    try:
+        return util.resolve_name(lazy[1])
+    except ImportError as e:
+        raise AttributeError(
+            "module %r has no attribute %r: %s" % (__name__, name, e))
+
+
+class _PackagingModule(types.ModuleType):
+    """What importers of pbr.packaging get.
+
+    Every attribute is read from, written to and deleted from the real
+    module, so monkeypatching keeps working. Names the real module lacks
+    are tried as command classes that moved out of it, which are imported
+    on first use. Unlike a module __getattr__ this works on every Python
+    pbr supports, so 'from pbr.packaging import LocalBuildDoc' keeps
+    working without importing sphinx along with pbr.packaging.
+    """
+
+    def __init__(self, module):
+        super(_PackagingModule, self).__init__(module.__name__, module.__doc__)
+        types.ModuleType.__setattr__(self, '_module', module)
+
+    def __getattribute__(self, name):
+        # __dict__ too comes from the real module, as tools such as
+        # fixtures.MonkeyPatch look there for what they replace.
+        module = types.ModuleType.__getattribute__(self, '_module')
+        try:
+            return getattr(module, name)
+        except AttributeError:
+            return module._get_moved_command(name)
+
+    def __setattr__(self, name, value):
+        setattr(types.ModuleType.__getattribute__(self, '_module'),
+                name, value)
+
+    def __delattr__(self, name):
+        delattr(types.ModuleType.__getattribute__(self, '_module'), name)
+
+    def __dir__(self):
+        module = types.ModuleType.__getattribute__(self, '_module')
+        prefix = module.__name__ + '.'
+        return sorted(set(dir(module)) | set(
+            name[len(prefix):] for name in module.LAZY_COMMANDS
+            if name.startswith(prefix)))
+
+
+def _get_increment_kwargs(git_dir, tag, snapshot=None):
     """Calculate the sort of semver increment needed from git history.
 
     Every commit from HEAD to tag is consider for Sem-Ver metadata lines.
     See the pbr docs for their syntax.
 
+    :param snapshot: The HistorySnapshot to examine, if already available.
     :return: a dict of kwargs for passing into SemanticVersion.increment.
     """
     result = {}
-    if tag:
-        version_spec = tag + "..HEAD"
-    else:
-        version_spec = "HEAD"
-    changelog = _run_git_command(['log', version_spec], git_dir)
-    header_len = len('    sem-ver:')
-    commands = [line[header_len:].strip() for line in changelog.split('\n')
-                if line.lower().startswith('    sem-ver:')]
+    if snapshot is None:
+        snapshot = _get_history_snapshot(git_dir)
     symbols = set()
-    for command in commands:
-        symbols.update([symbol.strip() for symbol in command.split(',')])
+    for commit in snapshot.since(tag):
+        for command in commit.semver:
+            symbols.update([symbol.strip() for symbol in command.split(',')])
 
     def _handle_symbol(symbol, symbols, impact):
         if symbol in symbols:
@@ -883,28 +1213,54 @@ def _get_increment_kwargs(git_dir, tag):
     return result
 
 
-def _get_revno_and_last_tag(git_dir):
+def _get_revno_and_last_tag(git_dir, snapshot=None):
     """Return the commit data about the most recent tag.
 
     We use git-describe to find this out, but if there are no
     tags then we fall back to counting commits since the beginning
     of time.
     """
-    changelog = _iter_log_oneline(git_dir=git_dir)
+    if snapshot is None:
+        snapshot = _get_history_snapshot(git_dir)
+    tag_index = _get_tag_index(git_dir)
     row_count = 0
-    for row_count, (ignored, tag_set, ignored) in enumerate(changelog):
-        version_tags = set()
-        for tag in list(tag_set):
-            try:
-                version_tags.add(version.SemanticVersion.from_pip_string(tag))
-            except Exception:
-                pass
-        if version_tags:
-            return max(version_tags).release_string(), row_count
+    for row_count, commit in enumerate(snapshot.iter_commits()):
+        tags = tag_index.get(commit.sha)
+        if tags is not None and tags.version is not None:
+            # Nothing older matters for the version - stop git walking the
+            # rest of history. Anything that needs it will restart the walk.
+            snapshot.pause()
+            return tags.version, row_count
     return "", row_count
 
 
-def _get_version_from_git_target(git_dir, target_version):
+def _get_head_version_tag(git_dir):
+    """Return the highest version tag of HEAD, read without running git.
+
+    :return: The tag's release string, or None if HEAD has no version tag
+        or its tags cannot be read without git.
+    """
+    return _get_highest_version_tag(refs.read_head_tags(git_dir) or ())
+
+
+def _get_exact_match_tag(git_dir):
+    """Return the annotated tag of HEAD, as git describe --exact-match does.
+
+    :raises: An Exception if HEAD has no annotated tag.
+    """
+    head_tags = refs.read_head_tags(git_dir)
+    annotated = [tag for tag, is_annotated in (head_tags or {}).items()
+                 if is_annotated]
+    # git describe prefers the newest of several annotated tags.
+    if head_tags is None or len(annotated) > 1:
+        return _run_git_command(
+            ['describe', '--exact-match'], git_dir, throw_on_error=True)
+    if not annotated:
+        raise ValueError('HEAD has no annotated tag')
+    return annotated[0]
+
+
+def _get_version_from_git_target(git_dir, target_version, snapshot=None):
     """Calculate a version from a target version in git_dir.
 
     This is used for untagged versions only. A new version is calculated as
@@ -917,17 +1273,28 @@ def _get_version_from_git_target(git_dir, target_version):
         version following semver rules. Otherwise target_version is used as a
         constraint - if semver rules would result in a newer version then an
         exception is raised.
+    :param snapshot: The HistorySnapshot to examine, if already available.
     :return: A semver version object.
     """
-    sha = _run_git_command(
-        ['log', '-n1', '--pretty=format:%h'], git_dir)
-    tag, distance = _get_revno_and_last_tag(git_dir)
+    tag = None
+    if snapshot is None:
+        # A tagged release needs no history.
+        tag = _get_head_version_tag(git_dir)
+        if tag is None:
+            snapshot = _get_history_snapshot(git_dir)
+    if tag is None:
+        head = snapshot.head()
+        sha = head.short_sha if head else ''
+        tag, distance = _get_revno_and_last_tag(git_dir, snapshot)
+    else:
+        sha = ''
+        distance = 0
     last_semver = version.SemanticVersion.from_pip_string(tag or '0')
     if distance == 0:
         new_version = last_semver
     else:
         new_version = last_semver.increment(
-            **_get_increment_kwargs(git_dir, tag))
+            **_get_increment_kwargs(git_dir, tag, snapshot))
     if target_version is not None and new_version > target_version:
         raise ValueError(
             "git history requires a target version of %(new)s, but target "
@@ -955,10 +1322,21 @@ def _get_version_from_git(pre_version=None):
     """
     git_dir = _get_git_directory()
     if git_dir and _git_is_installed():
+        cache_key = None
+        if str(os.getenv('SKIP_VERSION_CACHE')).lower() not in TRUE_VALUES:
+            head = refs.read_ref(git_dir, 'HEAD')
+            if head is None:
+                head = _get_git_backend(git_dir).resolve('HEAD')
+            if head:
+                cache_key = git.version_cache_key(git_dir, head, pre_version)
+        if cache_key:
+            result = git.get_cached_version(git_dir, cache_key)
+            if result:
+                log.debug('[pbr] Version cache hit: %s' % result)
+                return result
+            log.debug('[pbr] Version cache miss')
         try:
-            tagged = _run_git_command(
-                ['describe', '--exact-match'], git_dir,
-                throw_on_error=True).replace('-', '.')
+            tagged = _get_exact_match_tag(git_dir).replace('-', '.')
             target_version = version.SemanticVersion.from_pip_string(tagged)
         except Exception:
             if pre_version:
@@ -968,8 +1346,11 @@ def _get_version_from_git(pre_version=None):
             else:
                 # not released yet - just calculate from git history
                 target_version = None
-        result = _get_version_from_git_target(git_dir, target_version)
-        return result.release_string()
+        result = _get_version_from_git_target(
+            git_dir, target_version).release_string()
+        if cache_key:
+            git.set_cached_version(git_dir, cache_key, result)
+        return result
     # If we don't know the version, return an empty string so at least
     # the downstream users of the value always have the same type of
     # object to work with.
@@ -1038,3 +1419,6 @@ def get_version(package_name, pre_version=None):
     raise Exception("Versioning for this project requires either an sdist"
                     " tarball, or access to an upstream git repository."
                     " Are you sure that git is installed?")
+
+
+sys.modules[__name__] = _PackagingModule(sys.modules[__name__])
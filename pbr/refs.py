@@ -0,0 +1,271 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Read-only access to git refs without running git.
+
+Only the simple, common repository layouts are understood: a .git directory
+or a 'gitdir:' file pointing at one, linked worktrees, loose refs, packed-refs
+and loose objects. Functions return None when asked about anything else, in
+which case the caller should ask git itself.
+"""
+
+import hashlib
+import os
+import re
+import zlib
+
+_SHA_RE = re.compile(r'^[0-9a-f]{40}([0-9a-f]{24})?$')
+# Environment variables that change how git finds a repository.
+_DISCOVERY_ENV = ('GIT_DIR', 'GIT_WORK_TREE', 'GIT_CEILING_DIRECTORIES',
+                  'GIT_DISCOVERY_ACROSS_FILESYSTEM', 'GIT_COMMON_DIR')
+_MAX_SYMREF_DEPTH = 5
+# Enough of a loose object to read its header.
+_OBJECT_HEADER_SIZE = 32
+
+
+def _is_git_dir(path):
+    return (os.path.isfile(os.path.join(path, 'HEAD'))
+            and (os.path.isdir(os.path.join(path, 'objects'))
+                 or os.path.isfile(os.path.join(path, 'commondir'))))
+
+
+def _owned(path):
+    # git refuses to use repositories owned by someone else unless told
+    # otherwise by safe.directory; leave that decision to git.
+    getuid = getattr(os, 'geteuid', None)
+    return getuid is None or os.stat(path).st_uid == getuid()
+
+
+def find_git_dir(path=None):
+    """Return what git rev-parse --git-dir would print when run in path.
+
+    :return: The git directory, relative if it is .git in path itself, or
+        None if it cannot be found without git.
+    """
+    if any(name in os.environ for name in _DISCOVERY_ENV):
+        return None
+    start = os.path.abspath(path or os.getcwd())
+    current = start
+    while True:
+        dot_git = os.path.join(current, '.git')
+        if os.path.isdir(dot_git):
+            if not _is_git_dir(dot_git) or not _owned(dot_git):
+                return None
+            if current == start:
+                return '.git'
+            return dot_git
+        if os.path.isfile(dot_git):
+            try:
+                with open(dot_git, 'r') as gitfile:
+                    content = gitfile.read().strip()
+            except (IOError, OSError):
+                return None
+            if not content.startswith('gitdir:'):
+                return None
+            git_dir = os.path.normpath(os.path.join(
+                current, content[len('gitdir:'):].strip()))
+            if not _is_git_dir(git_dir) or not _owned(git_dir):
+                return None
+            return git_dir
+        if _is_git_dir(current):
+            # A bare repository, or we are inside .git.
+            return None
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+def common_dir(git_dir):
+    """Return the directory with the refs shared by all worktrees."""
+    try:
+        with open(os.path.join(git_dir, 'commondir')) as commondir:
+            return os.path.join(git_dir, commondir.read().strip())
+    except (IOError, OSError):
+        return git_dir
+
+
+def _read_packed_refs(git_dir):
+    """Return the refs, peeled refs and traits listed in packed-refs."""
+    refs = {}
+    peeled = {}
+    traits = set()
+    last = None
+    try:
+        with open(os.path.join(common_dir(git_dir), 'packed-refs')) as packed:
+            for line in packed:
+                line = line.strip()
+                if line.startswith('# pack-refs with:'):
+                    traits.update(line[len('# pack-refs with:'):].split())
+                elif line.startswith('^'):
+                    if last is not None:
+                        peeled[last] = line[1:]
+                elif line and not line.startswith('#'):
+                    sha, _, last = line.partition(' ')
+                    refs[last] = sha
+    except (IOError, OSError):
+        pass
+    return refs, peeled, traits
+
+
+def _supported(git_dir):
+    return not os.path.isdir(os.path.join(common_dir(git_dir), 'reftable'))
+
+
+def read_ref(git_dir, ref='HEAD'):
+    """Return the sha ref points at, following symbolic refs.
+
+    :param ref: HEAD, or a full ref name such as refs/heads/master.
+    :return: The sha, or None if ref does not exist or cannot be read
+        without git.
+    """
+    if not _supported(git_dir):
+        return None
+    for depth in range(_MAX_SYMREF_DEPTH):
+        if ref.startswith('refs/') and not ref.startswith(
+                ('refs/bisect/', 'refs/worktree/')):
+            base = common_dir(git_dir)
+        else:
+            base = git_dir
+        try:
+            with open(os.path.join(base, *ref.split('/')), 'r') as ref_file:
+                content = ref_file.read().strip()
+        except (IOError, OSError):
+            if not ref.startswith('refs/'):
+                return None
+            return _read_packed_refs(git_dir)[0].get(ref)
+        if content.startswith('ref:'):
+            ref = content[len('ref:'):].strip()
+        elif _SHA_RE.match(content):
+            return content
+        else:
+            return None
+    return None
+
+
+def read_tags(git_dir):
+    """Return a dict mapping tag names in git_dir to the objects they name.
+
+    Loose tags override packed ones, as they do in git.
+    """
+    tags = dict((ref[len('refs/tags/'):], sha)
+                for ref, sha in _read_packed_refs(git_dir)[0].items()
+                if ref.startswith('refs/tags/'))
+    tags_dir = os.path.join(common_dir(git_dir), 'refs', 'tags')
+    for dirpath, dirnames, filenames in os.walk(tags_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                with open(path, 'r') as ref:
+                    sha = ref.read().strip()
+            except (IOError, OSError):
+                continue
+            name = os.path.relpath(path, tags_dir).replace(os.sep, '/')
+            tags[name] = sha
+    return tags
+
+
+def refs_digest(git_dir):
+    """Return a digest of the tags in git_dir."""
+    base = common_dir(git_dir)
+    names = ['packed-refs']
+    for dirpath, dirnames, filenames in os.walk(
+            os.path.join(base, 'refs', 'tags')):
+        dirnames.sort()
+        names.extend(os.path.relpath(os.path.join(dirpath, name), base)
+                     for name in sorted(filenames))
+    digest = hashlib.sha1()
+    for name in names:
+        try:
+            with open(os.path.join(base, name), 'rb') as ref:
+                content = ref.read()
+        except (IOError, OSError):
+            continue
+        digest.update(name.encode('utf-8') + b'\0' + content + b'\0')
+    return digest.hexdigest()
+
+
+def _read_object(git_dir, sha, header_only=False):
+    """Return the (type, body) of a loose object, or None if not loose."""
+    path = os.path.join(common_dir(git_dir), 'objects', sha[:2], sha[2:])
+    try:
+        with open(path, 'rb') as loose:
+            data = loose.read()
+        decompress = zlib.decompressobj()
+        if header_only:
+            data = decompress.decompress(data, _OBJECT_HEADER_SIZE)
+        else:
+            data = decompress.decompress(data) + decompress.flush()
+    except (IOError, OSError, zlib.error):
+        return None
+    header, _, body = data.partition(b'\0')
+    return header.split(b' ')[0].decode('ascii'), body
+
+
+def _peel(git_dir, sha):
+    """Return (commit, annotated) for the object a loose tag names."""
+    annotated = False
+    for depth in range(_MAX_SYMREF_DEPTH):
+        obj = _read_object(git_dir, sha, header_only=True)
+        if obj is None:
+            return None
+        if obj[0] != 'tag':
+            return sha, annotated
+        body = _read_object(git_dir, sha)[1].decode('utf-8', 'replace')
+        annotated = True
+        sha = body.split('\n', 1)[0].split(' ')[-1]
+    return None
+
+
+def read_peeled_tags(git_dir):
+    """Return a dict mapping tag names to (commit, annotated) tuples.
+
+    :return: The dict, or None if some tag cannot be peeled without git,
+        for instance because the tag object is in a pack.
+    """
+    if not _supported(git_dir):
+        return None
+    refs, peeled, traits = _read_packed_refs(git_dir)
+    packed = dict((ref, sha) for ref, sha in refs.items()
+                  if ref.startswith('refs/tags/'))
+    if packed and not traits & set(['peeled', 'fully-peeled']):
+        return None
+    tags = {}
+    for ref, sha in packed.items():
+        tags[ref[len('refs/tags/'):]] = (peeled.get(ref, sha), ref in peeled)
+    for name, sha in read_tags(git_dir).items():
+        if packed.get('refs/tags/' + name) == sha:
+            continue
+        target = _peel(git_dir, sha)
+        if target is None:
+            return None
+        tags[name] = target
+    return tags
+
+
+def read_head_tags(git_dir):
+    """Return a dict mapping the tags of HEAD to whether they are annotated.
+
+    :return: The dict, or None if it cannot be worked out without git.
+    """
+    head = read_ref(git_dir, 'HEAD')
+    if head is None:
+        return None
+    tags = read_peeled_tags(git_dir)
+    if tags is None:
+        return None
+    return dict((name, annotated)
+                for name, (commit, annotated) in tags.items()
+                if commit == head)
@@ -0,0 +1,224 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Parsing of pip requirements files.
+
+Each file is read and parsed once per process, and again only when its
+mtime or size changes. The '-r' includes below a file are walked once:
+every file contributes its lines at its first inclusion only, and an
+include that would form a cycle is skipped with a warning.
+
+get_requirements_set gathers all that one list of candidate files gives
+into a RequirementsSet, shared by everything that asks for that list.
+"""
+
+from distutils import log
+import os
+import re
+
+# Every line is classified by one match of this expression.
+_LINE_RE = re.compile(r'''
+    (?P<blank>\s*(?:\#.*)?\Z)
+  | (?P<include>-r)
+  | \s*-(?P<flag>[ef])\s+(?P<link>.*)
+  | (?P<url>\s*https?:)
+''', re.VERBOSE | re.DOTALL)
+# The last egg fragment of a link: '...#egg=nova-1.2.3' -> 'nova-1.2.3'.
+_EGG_RE = re.compile(r'.*#egg=(.*)', re.DOTALL)
+# A versioned egg fragment: 'nova-1.2.3' -> 'nova>=1.2.3'.
+_EGG_VERSION_RE = re.compile(r'([\w.]+)-([\w.-]+)')
+
+REQUIREMENT = 'requirement'
+INCLUDE = 'include'
+INDEX_LOCATION = 'index'
+
+# Absolute path -> ParsedFile.
+_parsed_files = {}
+# Absolute path -> (stamps of the files walked, requirements, excluded).
+_resolved = {}
+
+
+class ParsedFile(object):
+    """The lines of one requirements file, classified.
+
+    :ivar entries: (kind, value) pairs in file order, where kind is
+        REQUIREMENT, INCLUDE (value is the included path) or INDEX_LOCATION.
+    :ivar links: The dependency links given by the file.
+    """
+
+    def __init__(self, stamp, entries, links):
+        self.stamp = stamp
+        self.entries = entries
+        self.links = links
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size)
+
+
+def _egg_requirement(line):
+    # For the requirements list, we need to inject only the portion after
+    # egg= so that distutils knows the package it's looking for, such as:
+    # -e git://github.com/openstack/nova/master#egg=nova-1.2.3
+    # http://github.com/openstack/nova/zipball/master#egg=nova-1.2.3
+    match = _EGG_RE.match(line)
+    if match is None:
+        return line
+    return _EGG_VERSION_RE.sub(r'\1>=\2', match.group(1))
+
+
+def parse_lines(lines):
+    """Classify the lines of a requirements file.
+
+    :return: The (entries, links) of a ParsedFile.
+    """
+    entries = []
+    links = []
+    for line in lines:
+        match = _LINE_RE.match(line)
+        if match is None:
+            entries.append((REQUIREMENT, line))
+        elif match.group('blank') is not None:
+            continue
+        elif match.group('include'):
+            entries.append((INCLUDE, line.partition(' ')[2].strip()))
+        elif match.group('flag'):
+            # dependency_links inject alternate locations to find packages
+            # listed in requirements; they need the whole line minus the
+            # flag.
+            links.append(match.group('link'))
+            if match.group('flag') == 'e':
+                entries.append((REQUIREMENT, _egg_requirement(line)))
+            else:
+                entries.append((INDEX_LOCATION, match.group('link')))
+        else:
+            links.append(line)
+            entries.append((REQUIREMENT, _egg_requirement(line)))
+    return entries, links
+
+
+def parse_file(path):
+    """Return the ParsedFile for path, or None if there is no such file."""
+    path = os.path.abspath(path)
+    stamp = _stamp(path)
+    if stamp is None:
+        return None
+    parsed = _parsed_files.get(path)
+    if parsed is None or parsed.stamp != stamp:
+        try:
+            with open(path, 'r') as requirements_file:
+                lines = requirements_file.read().split('\n')
+        except IOError:
+            return None
+        parsed = ParsedFile(stamp, *parse_lines(lines))
+        _parsed_files[path] = parsed
+    return parsed
+
+
+def _walk(path, seen, stack, stamps, requirements, excluded):
+    parsed = parse_file(path)
+    seen.add(path)
+    stamps.append((path, parsed and parsed.stamp))
+    if parsed is None:
+        return
+    stack.add(path)
+    for kind, value in parsed.entries:
+        if kind == REQUIREMENT:
+            requirements.append(value)
+        elif kind == INDEX_LOCATION:
+            excluded.append(value)
+        else:
+            include = os.path.abspath(value)
+            if include in stack:
+                log.warn('[pbr] Skipping -r %s in %s: it forms a cycle'
+                         % (value, path))
+            elif include not in seen:
+                _walk(include, seen, stack, stamps, requirements, excluded)
+    stack.remove(path)
+
+
+def _resolve(path):
+    path = os.path.abspath(path)
+    resolved = _resolved.get(path)
+    if (resolved is None
+            or any(_stamp(walked) != stamp for walked, stamp in resolved[0])):
+        stamps = []
+        requirements = []
+        excluded = []
+        _walk(path, set(), set(), stamps, requirements, excluded)
+        resolved = (stamps, requirements, excluded)
+        _resolved[path] = resolved
+    return resolved
+
+
+class RequirementsSet(object):
+    """What the first existing file of a list of requirements files gives.
+
+    Instances are shared; treat them and their lists as read-only.
+
+    :ivar path: The file used, or None if none of the files exist.
+    :ivar requirements: The requirements, with those of included files.
+    :ivar dependency_links: The links given by the file itself.
+    :ivar index_locations: The '-f' locations, with those of included files.
+    :ivar excluded: (entry, reason) pairs for the entries left out of the
+        requirements.
+    """
+
+    def __init__(self, path=None, resolved=None):
+        self.path = path
+        self._resolved = resolved
+        self.requirements = []
+        self.dependency_links = []
+        self.index_locations = []
+        if resolved is not None:
+            self.requirements = resolved[1]
+            self.index_locations = resolved[2]
+            parsed = parse_file(path)
+            if parsed is not None:
+                self.dependency_links = parsed.links
+        self.excluded = [(index_location, 'Index Location')
+                         for index_location in self.index_locations]
+
+
+# Tuple of requirements files -> RequirementsSet.
+_sets = {}
+
+
+def get_requirements_set(requirements_files):
+    """Return the RequirementsSet for requirements_files.
+
+    The set is built once, and again only when the file it was built from
+    stops being the first that exists, or it or an included file changes.
+    """
+    requirements_files = tuple(requirements_files)
+    path = None
+    for requirements_file in requirements_files:
+        if os.path.exists(requirements_file):
+            path = requirements_file
+            break
+    resolved = path and _resolve(path)
+    cached = _sets.get(requirements_files)
+    if (cached is not None and cached.path == path
+            and cached._resolved is resolved):
+        return cached
+    requirements_set = RequirementsSet(path, resolved)
+    for entry, reason in requirements_set.excluded:
+        log.info('[pbr] Excluding %s: %s' % (entry, reason))
+    _sets[requirements_files] = requirements_set
+    return requirements_set
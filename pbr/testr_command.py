@@ -46,6 +46,8 @@ import sys
 
 from testrepository import commands
 
+from pbr import packaging
+
 logger = logging.getLogger(__name__)
 
 
@@ -133,3 +135,14 @@ class Testr(cmd.Command):
         logger.debug("_coverage_after called")
         os.system("coverage combine")
         os.system("coverage html -d ./cover %s" % self.omit)
+
+
+class TestrTest(Testr, packaging._PipInstallTestRequires):
+    """Make setup.py test do the right thing."""
+
+    command_name = 'test'
+
+    def run(self):
+        self.pre_run()
+        # Can't use super - base class old-style class
+        Testr.run(self)
@@ -89,6 +89,15 @@ class BaseTestCase(testtools.TestCase, testresources.ResourcedTestCase):
             self.useFixture(fixtures.MonkeyPatch('sys.stderr', stderr))
         self.log_fixture = self.useFixture(
             fixtures.FakeLogger('pbr'))
+        # Versions looked up by one test must not be seen by the next.
+        self.useFixture(fixtures.MonkeyPatch(
+            'pbr.version._semantic_versions', {}))
+        self.useFixture(fixtures.MonkeyPatch(
+            'pbr.requirements._parsed_files', {}))
+        self.useFixture(fixtures.MonkeyPatch('pbr.requirements._resolved', {}))
+        self.useFixture(fixtures.MonkeyPatch('pbr.requirements._sets', {}))
+        self.useFixture(fixtures.MonkeyPatch(
+            'pbr.packaging._installed_distributions', None))
 
         # Older git does not have config --local, so create a temporary home
         # directory to permit using git config --global without stepping on
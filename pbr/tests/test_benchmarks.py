@@ -0,0 +1,97 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+
+from pbr.benchmarks import repo
+from pbr.benchmarks import suite
+from pbr import packaging
+from pbr.tests import base
+
+
+class TestSyntheticRepo(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestSyntheticRepo, self).setUp()
+        self.spec = repo.RepoSpec(commits=40, tags=8, files=3, requirements=4)
+        self.path = repo.get_repo(self.temp_dir, self.spec)
+
+    def _git(self, *args):
+        return packaging._run_shell_command(
+            ['git', '--git-dir=%s' % os.path.join(self.path, '.git')] +
+            list(args))
+
+    def test_history(self):
+        self.assertEqual('40', self._git('rev-list', '--count', 'HEAD'))
+        self.assertEqual(sorted(repo.tag_names(self.spec).values()),
+                         sorted(self._git('tag').split('\n')))
+        self.assertIn('junk-build-3', self._git('tag'))
+        self.assertIn('0.1.3.0b1', self._git('tag'))
+        self.assertIn('Co-authored-by:', self._git('log', '--format=%B'))
+        files = self._git('ls-files').split('\n')
+        self.assertIn('benchpkg/module2.py', files)
+        self.assertEqual(4, len(open(os.path.join(
+            self.path, 'requirements.txt')).readlines()))
+
+    def test_head_untagged(self):
+        self.assertNotIn(self.spec.commits - 1, repo.tag_names(self.spec))
+        head = repo.RepoSpec(commits=40, tags=8, tag_head=True)
+        self.assertEqual('0.1.5', repo.tag_names(head)[39])
+
+    def test_reused(self):
+        self.assertEqual(self.path, repo.get_repo(self.temp_dir, self.spec))
+
+    def test_run(self):
+        results = suite.run([self.spec], self.temp_dir, repeat=2,
+                            names=['get_version', 'SemanticVersion sort'])
+        self.assertEqual(
+            [('get_version', 'cold'), ('get_version', 'warm'),
+             ('SemanticVersion sort', 'warm')],
+            [(result['benchmark'], result['mode']) for result in results])
+        for result in results:
+            self.assertNotIn('error', result)
+            self.assertEqual(2, len(result['times']))
+            self.assertEqual(40, result['commits'])
+        # pbr's caches are cleared after each benchmark.
+        state = [name for name in os.listdir(os.path.join(self.path, '.git'))
+                 if name.startswith('pbr-')]
+        self.assertEqual([], state)
+
+
+class TestCompare(base.BaseTestCase):
+
+    def _report(self, **medians):
+        return dict(results=[
+            dict(benchmark=name, mode='cold', commits=10, tags=1, files=1,
+                 requirements=1, tag_head=False, median=median)
+            for name, median in medians.items()])
+
+    def test_compare(self):
+        rows, regressions = suite.compare(
+            self._report(fast=1.0, slow=1.0, gone=1.0),
+            self._report(fast=0.5, slow=2.0, new=1.0))
+        self.assertEqual(2, len(rows))
+        self.assertEqual([('slow', 'cold', 10, 1, 1, 1, False)], regressions)
+
+    def test_main_compare(self):
+        paths = []
+        for name, report in (('old', self._report(a=1.0)),
+                             ('new', self._report(a=1.1))):
+            paths.append(os.path.join(self.temp_dir, name + '.json'))
+            with open(paths[-1], 'w') as report_file:
+                json.dump(report, report_file)
+        self.assertEqual(0, suite.main(['compare'] + paths))
+        self.assertEqual(
+            1, suite.main(['compare', '--threshold', '1.05'] + paths))
@@ -38,7 +38,10 @@
 # INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
 # BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
 
+import io
+import itertools
 import os
+import sys
 import tempfile
 
 import fixtures
@@ -46,8 +49,12 @@ import mock
 import testscenarios
 from testtools import matchers
 
+from pbr import git
 from pbr import packaging
+from pbr import refs
+from pbr import requirements
 from pbr.tests import base
+from pbr import version
 
 
 class TestRepo(fixtures.Fixture):
@@ -101,19 +108,32 @@ class GPGKeyFixture(fixtures.Fixture):
     def setUp(self):
         super(GPGKeyFixture, self).setUp()
         tempdir = self.useFixture(fixtures.TempDir())
-        config_file = tempdir.path + '/key-config'
-        f = open(config_file, 'wt')
-        try:
-            f.write("""
+        gnupg_version = base._run_cmd(['gpg', '--version'], tempdir.path)[0]
+        gnupg_version = tuple(
+            int(part) for part in gnupg_version.split()[2].split('.')[:2])
+        if gnupg_version < (2, 1):
+            config = """
             #%no-protection -- these would be ideal but they are documented
             #%transient-key -- but not implemented in gnupg!
             %no-ask-passphrase
+            Preferences: (setpref)
+            """
+        else:
+            # gnupg 2.1 prompts for a passphrase, through the agent, unless
+            # told not to protect the key, and rejects (setpref).
+            config = """
+            %no-protection
+            %transient-key
+            """
+        config_file = tempdir.path + '/key-config'
+        f = open(config_file, 'wt')
+        try:
+            f.write(config + """
             Key-Type: RSA
             Name-Real: Example Key
             Name-Comment: N/A
             Name-Email: example@example.com
             Expire-Date: 2d
-            Preferences: (setpref)
             %commit
             """)
         finally:
@@ -185,6 +205,43 @@ class TestPackagingInPlainDirectory(base.BaseTestCase):
         self.assertFalse(os.path.exists(filename))
 
 
+class TestVersionModule(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestVersionModule, self).setUp()
+        self.repo = self.useFixture(TestRepo(self.package_dir))
+        self.repo.commit()
+        self.useFixture(
+            fixtures.EnvironmentVariable('PBR_VERSION_MODULE', '1'))
+        self.run_setup('egg_info', allow_fail=False)
+        self.path = os.path.join(
+            self.package_dir, 'pbr_testpackage', '_pbr_version.py')
+
+    def test_module_written(self):
+        namespace = {}
+        with open(self.path, 'r') as module:
+            exec(module.read(), namespace)
+        self.assertEqual(
+            refs.read_ref(os.path.join(self.package_dir, '.git')),
+            namespace['git_sha'])
+        self.assertEqual(
+            namespace['version'],
+            version.SemanticVersion(*namespace['semantic']).release_string())
+
+    def test_version_info_reads_module(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'sys.path', [self.package_dir] + sys.path))
+        __import__('pbr_testpackage')
+        with mock.patch.object(
+                version.VersionInfo, '_get_version_from_metadata') as meta:
+            info = version.VersionInfo('pbr_testpackage')
+            semantic = info.semantic_version()
+        self.assertFalse(meta.called)
+        self.assertEqual(
+            sys.modules['pbr_testpackage._pbr_version'].semantic,
+            semantic.components())
+
+
 class TestPresenceOfGit(base.BaseTestCase):
 
     def testGitIsInstalled(self):
@@ -200,6 +257,501 @@ class TestPresenceOfGit(base.BaseTestCase):
             self.assertEqual(False, packaging._git_is_installed())
 
 
+class TestGitContext(base.BaseTestCase):
+
+    def test_discovery_remembered(self):
+        self.useFixture(TestRepo(self.package_dir))
+        context = packaging._get_git_context()
+        self.assertEqual('.git', packaging._get_git_directory())
+        self.assertTrue(packaging._git_is_installed())
+        with mock.patch.object(packaging, '_run_shell_command',
+                               side_effect=AssertionError):
+            self.assertIs(context, packaging._get_git_context())
+            self.assertEqual('.git', packaging._get_git_directory())
+            self.assertTrue(packaging._git_is_installed())
+            self.assertEqual(self.package_dir, context.top_dir)
+
+    def test_context_per_directory(self):
+        self.useFixture(TestRepo(self.package_dir))
+        context = packaging._get_git_context()
+        self.useFixture(base.DiveDir(
+            os.path.join(self.package_dir, 'pbr_testpackage')))
+        self.assertIsNot(context, packaging._get_git_context())
+        self.assertEqual(os.path.join(self.package_dir, '.git'),
+                         packaging._get_git_directory())
+
+    def test_invalidate(self):
+        context = git.GitContext(self.temp_dir, lambda cmd: '')
+        self.assertEqual('', context.git_dir)
+        base._run_cmd(['git', 'init', '.'], self.temp_dir)
+        self.assertEqual('', context.git_dir)
+        context.invalidate()
+        self.assertEqual('.git', context.git_dir)
+
+    def test_git_version(self):
+        context = git.GitContext(
+            self.temp_dir, lambda cmd: 'git version 2.1.4.windows.1')
+        self.assertEqual((2, 1, 4), context.git_version)
+
+        def missing(cmd):
+            raise OSError()
+        context = git.GitContext(self.temp_dir, missing)
+        self.assertIsNone(context.git_version)
+        self.assertFalse(context.git_installed)
+
+
+class TestGitBackend(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestGitBackend, self).setUp()
+        self.useFixture(fixtures.EnvironmentVariable('PBR_GIT_BACKEND'))
+        self.repo = self.useFixture(TestRepo(self.package_dir))
+        self.git_dir = os.path.join(self.package_dir, '.git')
+        self.addCleanup(git.close_backends)
+
+    def test_repeated_query_reuses_output(self):
+        self.repo.commit()
+        backend = packaging._get_git_backend(self.git_dir)
+        self.assertIsInstance(backend, git.BatchBackend)
+        first = packaging._run_git_command(['log', '--oneline'], self.git_dir)
+        second = packaging._run_git_command(['log', '--oneline'], self.git_dir)
+        self.assertEqual(first, second)
+        self.assertEqual(1, backend.forks_saved)
+        # HEAD is read from the git directory without a helper process.
+        self.assertEqual(0, backend.processes_started)
+
+    def test_new_commit_invalidates_output(self):
+        self.repo.commit()
+        first = packaging._run_git_command(['log', '--oneline'], self.git_dir)
+        self.repo.commit()
+        second = packaging._run_git_command(['log', '--oneline'], self.git_dir)
+        self.assertEqual(2, len(second.split('\n')))
+        self.assertNotEqual(first, second)
+
+    def test_resolve(self):
+        self.repo.commit()
+        backend = packaging._get_git_backend(self.git_dir)
+        sha = backend.resolve('HEAD')
+        self.assertEqual(40, len(sha))
+        self.assertEqual(sha, git.SubprocessBackend(
+            self.git_dir, packaging._run_shell_command).resolve('HEAD'))
+        self.assertIsNone(backend.resolve('no-such-ref'))
+
+    def test_subprocess_fallback_forced(self):
+        self.useFixture(
+            fixtures.EnvironmentVariable('PBR_GIT_BACKEND', 'subprocess'))
+        backend = packaging._get_git_backend(self.git_dir)
+        self.assertIsInstance(backend, git.SubprocessBackend)
+        self.assertNotIsInstance(backend, git.BatchBackend)
+
+
+class TestRefs(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestRefs, self).setUp()
+        self.repo = self.useFixture(TestRepo(self.package_dir))
+        self.useFixture(GPGKeyFixture())
+        self.useFixture(base.DiveDir(self.package_dir))
+        self.git_dir = os.path.join(self.package_dir, '.git')
+
+    def _git(self, *args):
+        return packaging._run_shell_command(['git'] + list(args))
+
+    def test_find_git_dir(self):
+        self.assertEqual('.git', refs.find_git_dir())
+        subdir = os.path.join(self.package_dir, 'pbr_testpackage')
+        self.assertEqual(self.git_dir, refs.find_git_dir(subdir))
+        self.useFixture(fixtures.EnvironmentVariable('GIT_DIR', self.git_dir))
+        self.assertIsNone(refs.find_git_dir())
+
+    def test_find_git_dir_gitdir_file(self):
+        checkout = os.path.join(self.temp_dir, 'checkout')
+        os.mkdir(checkout)
+        with open(os.path.join(checkout, '.git'), 'w') as gitfile:
+            gitfile.write('gitdir: %s\n' % self.git_dir)
+        self.assertEqual(self.git_dir, refs.find_git_dir(checkout))
+
+    def test_read_ref(self):
+        self.repo.commit()
+        self.assertEqual(self._git('rev-parse', 'HEAD'),
+                         refs.read_ref(self.git_dir, 'HEAD'))
+        self._git('pack-refs', '--all')
+        self.assertEqual(self._git('rev-parse', 'HEAD'),
+                         refs.read_ref(self.git_dir, 'HEAD'))
+        self.assertIsNone(refs.read_ref(self.git_dir, 'refs/heads/missing'))
+
+    def test_read_ref_unborn(self):
+        self.assertIsNone(refs.read_ref(self.git_dir, 'HEAD'))
+
+    def test_worktree(self):
+        self.repo.commit()
+        self.repo.tag('1.0.0')
+        worktree = os.path.join(self.temp_dir, 'worktree')
+        self._git('worktree', 'add', '-b', 'other', worktree)
+        base._run_cmd(['git', 'commit', '--allow-empty', '-m', 'other'],
+                      worktree)
+        git_dir = refs.find_git_dir(worktree)
+        self.assertEqual(os.path.join(self.git_dir, 'worktrees', 'worktree'),
+                         git_dir)
+        self.assertEqual(
+            base._run_cmd(['git', 'rev-parse', 'HEAD'], worktree)[0].strip(),
+            refs.read_ref(git_dir, 'HEAD'))
+        self.assertEqual(['1.0.0'], list(refs.read_tags(git_dir)))
+
+    def test_read_head_tags(self):
+        self.repo.commit()
+        self.repo.tag('1.0.0')
+        self._git('tag', 'lightweight')
+        expected = {'1.0.0': True, 'lightweight': False}
+        self.assertEqual(expected, refs.read_head_tags(self.git_dir))
+        self._git('pack-refs', '--all')
+        self.assertEqual(expected, refs.read_head_tags(self.git_dir))
+        self.repo.commit()
+        self.assertEqual({}, refs.read_head_tags(self.git_dir))
+
+    def test_read_head_tags_packed_object(self):
+        self.repo.commit()
+        self.repo.tag('1.0.0')
+        self._git('repack', '-a', '-d')
+        self._git('prune-packed')
+        self.assertIsNone(refs.read_head_tags(self.git_dir))
+
+
+class TestHistorySnapshot(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestHistorySnapshot, self).setUp()
+        self.repo = self.useFixture(TestRepo(self.package_dir))
+        self.useFixture(GPGKeyFixture())
+        self.git_dir = os.path.join(self.package_dir, '.git')
+        self.addCleanup(git.close_backends)
+
+    def test_snapshot_contents(self):
+        self.repo.commit('First (with parens)')
+        self.repo.tag('1.2.3')
+        self.repo.commit('Second\n\nSem-Ver: feature, api-break\n'
+                         'Co-authored-by: Foo Bar <foo@bar.com>')
+        snapshot = packaging._get_history_snapshot(self.git_dir)
+        self.assertEqual(2, len(snapshot.commits))
+        head = snapshot.head()
+        self.assertEqual('Second', head.subject)
+        self.assertEqual(('feature, api-break',), head.semver)
+        self.assertEqual(('Foo Bar <foo@bar.com>',), head.co_authors)
+        self.assertEqual(
+            'OpenStack Developer <example@example.com>', head.author)
+        self.assertEqual(frozenset(['1.2.3']), snapshot.commits[1].tags)
+        self.assertEqual((snapshot.commits[1].sha,), head.parents)
+        self.assertEqual(
+            [(head.short_sha, set(), 'Second'),
+             (snapshot.commits[1].short_sha, set(['1.2.3']),
+              'First (with parens)')],
+            list(snapshot.iter_oneline()))
+
+    def test_snapshot_reused_until_history_changes(self):
+        self.repo.commit()
+        first = packaging._get_history_snapshot(self.git_dir)
+        self.assertIs(first, packaging._get_history_snapshot(self.git_dir))
+        self.repo.commit()
+        second = packaging._get_history_snapshot(self.git_dir)
+        self.assertEqual(2, len(second.commits))
+
+    def test_history_read_lazily(self):
+        pulled = []
+
+        def commits(revs):
+            for sha in 'abc':
+                pulled.append(sha)
+                yield git.Commit(sha, sha, (), frozenset(), sha, '', (), ())
+        snapshot = git.HistorySnapshot(commits)
+        self.assertEqual('a', snapshot.head().sha)
+        self.assertEqual(['a'], pulled)
+        self.assertEqual(['a', 'b'], [c.sha for c in itertools.islice(
+            snapshot.iter_commits(), 2)])
+        self.assertEqual(['a', 'b'], pulled)
+        self.assertEqual(3, len(snapshot.commits))
+
+    def test_stream_keeps_no_more_commits(self):
+        pulled = []
+
+        def commits(revs):
+            for sha in 'abc':
+                pulled.append(sha)
+                yield git.Commit(sha, sha, (), frozenset(), sha, '', (), ())
+        snapshot = git.HistorySnapshot(commits)
+        self.assertEqual('a', snapshot.head().sha)
+        self.assertEqual(
+            ['a', 'b', 'c'], [c.sha for c in snapshot.stream()])
+        self.assertEqual(['a'], [c.sha for c in snapshot._commits])
+        self.assertEqual(3, snapshot.length())
+        self.assertEqual(['a', 'a', 'b', 'c'], pulled)
+
+    def test_git_files_do_not_keep_history(self):
+        for n in range(4):
+            self.repo.commit('commit %d' % n)
+        snapshot = packaging._get_history_snapshot(self.git_dir)
+        packaging._write_git_files({})
+        self.assertEqual(1, len(snapshot._commits))
+        with open('ChangeLog') as changelog:
+            self.assertIn('* commit 0\n', changelog.read())
+
+    def test_history_resumes_after_pause(self):
+        for n in range(4):
+            self.repo.commit('commit %d' % n)
+        snapshot = packaging._get_history_snapshot(self.git_dir)
+        self.assertEqual('commit 3', snapshot.head().subject)
+        snapshot.pause()
+        self.assertEqual(
+            ['commit 3', 'commit 2', 'commit 1', 'commit 0'],
+            [c.subject for c in snapshot.iter_commits()])
+
+    def test_version_stops_at_last_tag(self):
+        self.repo.commit()
+        self.repo.tag('1.2.3')
+        self.repo.commit('sem-ver: feature')
+        self.repo.commit()
+        snapshot = packaging._get_history_snapshot(self.git_dir)
+        tag, distance = packaging._get_revno_and_last_tag(
+            self.git_dir, snapshot)
+        self.assertEqual(('1.2.3', 2), (tag, distance))
+        # Only the history up to the tag has been read, and reading stopped.
+        self.assertEqual(3, len(snapshot._commits))
+        self.assertIsNone(snapshot._pending)
+        self.assertEqual(
+            dict(minor=True),
+            packaging._get_increment_kwargs(self.git_dir, tag, snapshot))
+        self.assertEqual(3, len(snapshot._commits))
+
+    def test_stream_splits_across_chunks(self):
+        self.useFixture(fixtures.MonkeyPatch('pbr.git._STREAM_CHUNK', 1))
+        output = u'one\n\u00e9t\u00e9\nthree'
+        self.useFixture(fixtures.FakePopen(lambda _: {
+            'stdout': io.BytesIO(output.encode('utf-8'))}))
+        backend = git.SubprocessBackend(self.git_dir, None)
+        self.assertEqual(
+            output.split('\n'), list(backend.stream(['log'])))
+
+    def test_stream_closed_early(self):
+        for n in range(3):
+            self.repo.commit()
+        backend = packaging._get_git_backend(self.git_dir)
+        lines = backend.stream(['log', '--oneline'])
+        self.assertEqual(1, len(list(itertools.islice(lines, 1))))
+        lines.close()
+        self.assertEqual([], list(lines))
+
+    def test_since_excludes_history_of_tag(self):
+        commit = lambda sha, parents, tags=(): git.Commit(
+            sha, sha, tuple(parents), frozenset(tags), sha, '', (), ())
+        # d merges c (a side branch off a) into b (which is tagged).
+        commits = [
+            commit('d', ['b', 'c']),
+            commit('c', ['a']),
+            commit('b', ['a'], ['1.0.0']),
+            commit('a', []),
+        ]
+        snapshot = git.HistorySnapshot(lambda revs: iter(commits))
+        self.assertEqual(4, len(snapshot.commits))
+        self.assertEqual(
+            ['d', 'c'], [c.sha for c in snapshot.since('1.0.0')])
+        self.assertEqual(4, len(snapshot.since('')))
+        self.assertEqual([], snapshot.since('no-such-tag'))
+
+
+class TestChangeLogUpdates(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestChangeLogUpdates, self).setUp()
+        self.repo = self.useFixture(TestRepo(self.package_dir))
+        self.useFixture(GPGKeyFixture())
+        self.useFixture(base.DiveDir(self.package_dir))
+        self.git_dir = os.path.join(self.package_dir, '.git')
+        self.changelog = os.path.join(self.temp_dir, 'ChangeLog')
+
+    def _write_changelog(self):
+        backend = packaging._get_git_backend(self.git_dir)
+        snapshot = git.HistorySnapshot(backend._log)
+        packaging.write_git_changelog(
+            git_dir=self.git_dir, dest_dir=self.temp_dir, snapshot=snapshot)
+        return snapshot
+
+    def assertChangeLogComplete(self):
+        expected = ''.join(content for release, content in
+                           packaging._iter_changelog(
+                               packaging._iter_log_inner(self.git_dir)))
+        with io.open(self.changelog, encoding='utf-8') as changelog:
+            self.assertEqual(expected, changelog.read())
+
+    def test_new_commits_added(self):
+        self.repo.commit('first')
+        self.repo.tag('1.0.0')
+        self.repo.commit('second')
+        self._write_changelog()
+        self.repo.commit('third')
+        self.repo.tag('1.1.0')
+        self.repo.commit('fourth')
+        snapshot = self._write_changelog()
+        self.assertChangeLogComplete()
+        # The two new commits and the one the ChangeLog ended at.
+        self.assertEqual(3, len(snapshot._commits))
+
+    def test_tagged_head_updated(self):
+        self.repo.commit('first')
+        self.repo.tag('1.0.0')
+        self._write_changelog()
+        self.repo.commit('second')
+        self._write_changelog()
+        self.assertChangeLogComplete()
+
+    def test_merged_branch_added(self):
+        self.repo.commit('first')
+        base._run_cmd(['git', 'checkout', '-b', 'side'], self.package_dir)
+        self.repo.commit('side')
+        base._run_cmd(['git', 'checkout', 'master'], self.package_dir)
+        self.repo.commit('second')
+        self._write_changelog()
+        base._run_cmd(['git', 'merge', '--no-ff', '-m', 'Merge side', 'side'],
+                      self.package_dir)
+        self._write_changelog()
+        self.assertChangeLogComplete()
+
+    def test_new_tag_regenerates(self):
+        self.repo.commit('first')
+        self.repo.commit('second')
+        self._write_changelog()
+        base._run_cmd(['git', 'tag', '-sm', 'test tag', '1.0.0', 'HEAD^'],
+                      self.package_dir)
+        self.repo.commit('third')
+        snapshot = self._write_changelog()
+        self.assertChangeLogComplete()
+        # Only the commits read looking for the old head are kept; the
+        # regenerated ChangeLog was streamed.
+        self.assertEqual(2, len(snapshot._commits))
+
+    def test_edited_changelog_regenerates(self):
+        self.repo.commit('first')
+        self._write_changelog()
+        with open(self.changelog, 'a') as changelog:
+            changelog.write('* local edit\n')
+        self.repo.commit('second')
+        self._write_changelog()
+        self.assertChangeLogComplete()
+
+    def test_rewritten_history_regenerates(self):
+        self.repo.commit('first')
+        self.repo.commit('second')
+        self._write_changelog()
+        self.repo.uncommit()
+        self.repo.commit('replacement')
+        self._write_changelog()
+        self.assertChangeLogComplete()
+
+
+class TestAuthorsIndex(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestAuthorsIndex, self).setUp()
+        self.repo = self.useFixture(TestRepo(self.package_dir))
+        self.useFixture(base.DiveDir(self.package_dir))
+        self.git_dir = os.path.join(self.package_dir, '.git')
+
+    def _generate_authors(self, option_dict={}):
+        backend = packaging._get_git_backend(self.git_dir)
+        snapshot = git.HistorySnapshot(backend._log)
+        packaging.generate_authors(
+            git_dir=self.git_dir, dest_dir=self.temp_dir,
+            option_dict=option_dict, snapshot=snapshot)
+        with open(os.path.join(self.temp_dir, 'AUTHORS')) as authors:
+            return authors.read(), snapshot
+
+    def test_new_commits_added(self):
+        self.repo.commit()
+        self.repo.commit()
+        self._generate_authors()
+        self.repo.commit('Pairing\n\nCo-authored-by: Foo Bar <foo@bar.com>')
+        authors, snapshot = self._generate_authors()
+        self.assertEqual(
+            'Foo Bar <foo@bar.com>\n'
+            'OpenStack Developer <example@example.com>\n', authors)
+        # The new commit and the one the index ended at.
+        self.assertEqual(2, len(snapshot._commits))
+
+    def test_ignore_emails_configurable(self):
+        self.repo.commit()
+        authors, _ = self._generate_authors(
+            {'authors_ignore_emails': ('setup.cfg', 'foo@ example@')})
+        self.assertEqual('\n', authors)
+        authors, _ = self._generate_authors()
+        self.assertEqual('OpenStack Developer <example@example.com>\n',
+                         authors)
+
+    def test_mailmap_change_rebuilds(self):
+        self.repo.commit()
+        self._generate_authors()
+        with open('.mailmap', 'w') as mailmap:
+            mailmap.write('Mapped Developer <example@example.com>\n')
+        authors, _ = self._generate_authors()
+        self.assertEqual('Mapped Developer <example@example.com>\n', authors)
+
+
+class TestTagIndex(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestTagIndex, self).setUp()
+        self.repo = self.useFixture(TestRepo(self.package_dir))
+        self.useFixture(GPGKeyFixture())
+        self.useFixture(base.DiveDir(self.package_dir))
+        self.git_dir = os.path.join(self.package_dir, '.git')
+        self.addCleanup(packaging._tag_indexes.clear)
+
+    def _head(self):
+        return packaging._run_shell_command(['git', 'rev-parse', 'HEAD'])
+
+    def test_index(self):
+        self.repo.commit()
+        self.repo.tag('1.0.0')
+        self.repo.tag('1.0.1')
+        self.repo.tag('not-a-version')
+        first = self._head()
+        self.repo.commit()
+        self.repo.tag('not-a-version-either')
+        second = self._head()
+        index = packaging._get_tag_index(self.git_dir)
+        self.assertEqual(['1.0.0', '1.0.1', 'not-a-version'],
+                         index[first].tags)
+        self.assertEqual('1.0.1', index[first].version)
+        self.assertIsNone(index[second].version)
+        self.assertEqual(
+            {frozenset(['1.0.0', '1.0.1', 'not-a-version']): '1.0.1',
+             frozenset(['not-a-version-either']): 'not-a-version-either'},
+            packaging._get_changelog_headings(self.git_dir))
+
+    def test_index_kept_in_git_dir(self):
+        self.repo.commit()
+        self.repo.tag('1.0.0')
+        index = packaging._get_tag_index(self.git_dir)
+        packaging._tag_indexes.clear()
+        with mock.patch.object(packaging, '_read_tag_targets',
+                               side_effect=AssertionError):
+            self.assertEqual(index, packaging._get_tag_index(self.git_dir))
+
+    def test_new_tag_rebuilds_index(self):
+        self.repo.commit()
+        self.repo.tag('1.0.0')
+        packaging._get_tag_index(self.git_dir)
+        self.repo.tag('1.0.1')
+        index = packaging._get_tag_index(self.git_dir)
+        self.assertEqual('1.0.1', index[self._head()].version)
+
+    def test_for_each_ref_fallback(self):
+        self.repo.commit()
+        self.repo.tag('1.0.0')
+        base._run_cmd(['git', 'tag', 'lightweight'], self.package_dir)
+        with mock.patch.object(refs, 'read_peeled_tags', return_value=None):
+            targets = packaging._read_tag_targets(self.git_dir)
+        self.assertEqual({'1.0.0': self._head(), 'lightweight': self._head()},
+                         targets)
+
+
 class TestNestedRequirements(base.BaseTestCase):
 
     def test_nested_requirement(self):
@@ -213,6 +765,187 @@ class TestNestedRequirements(base.BaseTestCase):
         result = packaging.parse_requirements([requirements])
         self.assertEqual(result, ['pbr'])
 
+    def _write(self, name, text):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_shared_include_once(self):
+        common = self._write('common.txt', 'd')
+        left = self._write('left.txt', 'b\n-r ' + common)
+        right = self._write('right.txt', 'c\n-r ' + common)
+        top = self._write(
+            'requirements.txt', 'a\n-r %s\n-r %s\nz' % (left, right))
+        self.assertEqual(['a', 'b', 'd', 'c', 'z'],
+                         packaging.parse_requirements([top]))
+
+    def test_include_cycle(self):
+        first = os.path.join(self.temp_dir, 'first.txt')
+        second = self._write('second.txt', 'b\n-r ' + first)
+        self._write('first.txt', 'a\n-r ' + second)
+        self.assertEqual(['a', 'b'], packaging.parse_requirements([first]))
+        self.assertEqual(['b', 'a'], packaging.parse_requirements([second]))
+
+    def test_missing_include(self):
+        top = self._write(
+            'requirements.txt',
+            'a\n-r ' + os.path.join(self.temp_dir, 'missing.txt'))
+        self.assertEqual(['a'], packaging.parse_requirements([top]))
+
+    def test_parsed_once(self):
+        top = self._write('requirements.txt', 'a\n-f http://x')
+        with mock.patch.object(requirements, 'parse_lines',
+                               wraps=requirements.parse_lines) as parse:
+            packaging.parse_requirements([top])
+            packaging.parse_dependency_links([top])
+            packaging.parse_requirements([top])
+        self.assertEqual(1, parse.call_count)
+
+    def test_requirements_set_shared(self):
+        top = self._write('requirements.txt', 'a\n-e git://x#egg=b\n-f y')
+        requirements_set = packaging.get_requirements_set(
+            ['missing.txt', top])
+        self.assertIs(requirements_set,
+                      packaging.get_requirements_set(['missing.txt', top]))
+        self.assertEqual(top, requirements_set.path)
+        self.assertEqual(['a', 'b'], requirements_set.requirements)
+        self.assertEqual(['git://x#egg=b', 'y'],
+                         requirements_set.dependency_links)
+        self.assertEqual(['y'], requirements_set.index_locations)
+        self.assertEqual([('y', 'Index Location')], requirements_set.excluded)
+
+    def test_requirements_set_rebuilt_on_change(self):
+        top = self._write('requirements.txt', 'a')
+        requirements_set = packaging.get_requirements_set([top])
+        self._write('requirements.txt', 'a\nbb')
+        self.assertIsNot(requirements_set,
+                         packaging.get_requirements_set([top]))
+        self.assertEqual(['a', 'bb'], packaging.parse_requirements([top]))
+
+    def test_requirements_set_no_files(self):
+        requirements_set = packaging.get_requirements_set(['missing.txt'])
+        self.assertIsNone(requirements_set.path)
+        self.assertEqual([], requirements_set.requirements)
+        self.assertEqual([], requirements_set.dependency_links)
+
+    def test_changed_include_reparsed(self):
+        nested = self._write('nested.txt', 'a')
+        top = self._write('requirements.txt', '-r ' + nested)
+        self.assertEqual(['a'], packaging.parse_requirements([top]))
+        self._write('nested.txt', 'a\nbb')
+        self.assertEqual(['a', 'bb'],
+                         packaging.parse_requirements([top]))
+
+
+class TestPipInstall(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestPipInstall, self).setUp()
+        patcher = mock.patch.object(packaging, '_run_shell_command')
+        self.run_shell_command = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unsatisfied_requirements(self):
+        self.assertEqual(
+            ['setuptools<1', 'no-such-distribution', 'setuptools[certs]',
+             '-e git://example.com/zipball#egg=bar'],
+            packaging._unsatisfied_requirements(
+                ['setuptools>=1', 'setuptools<1', 'no-such-distribution',
+                 'setuptools[certs]', 'Setuptools',
+                 'bar; python_version < "1"',
+                 '-e git://example.com/zipball#egg=bar']))
+
+    def test_satisfied_skips_pip(self):
+        packaging._pip_install([], ['setuptools'])
+        self.assertEqual(0, self.run_shell_command.call_count)
+
+    def test_only_unsatisfied_installed(self):
+        packaging._pip_install(
+            ['http://example.com'], ['setuptools', 'no-such-distribution'])
+        self.assertEqual(
+            [sys.executable, '-m', 'pip.__init__', 'install',
+             '-f', 'http://example.com', 'no-such-distribution'],
+            self.run_shell_command.call_args[0][0])
+        self.assertIsNone(packaging._installed_distributions)
+
+    def test_root_not_checked(self):
+        packaging._pip_install([], ['setuptools'], root='/root')
+        self.assertEqual(
+            [sys.executable, '-m', 'pip.__init__', 'install', '--root=/root',
+             'setuptools'],
+            self.run_shell_command.call_args[0][0])
+
+    def test_wheelhouse(self):
+        wheelhouse = os.path.join(self.temp_dir, 'wheelhouse')
+        packaging._pip_install(
+            ['http://example.com'], ['no-such-distribution'],
+            option_dict={'wheelhouse': ('setup.cfg', wheelhouse)})
+        self.assertEqual(
+            [sys.executable, '-m', 'pip.__init__', 'install', '--no-index',
+             '--find-links=%s' % wheelhouse, 'no-such-distribution'],
+            self.run_shell_command.call_args[0][0])
+
+    def test_wheelhouse_from_environment(self):
+        wheelhouse = os.path.join(self.temp_dir, 'wheelhouse')
+        self.useFixture(
+            fixtures.EnvironmentVariable('PBR_WHEELHOUSE', wheelhouse))
+        self.assertEqual(
+            wheelhouse, packaging._get_wheelhouse(
+                {'wheelhouse': ('setup.cfg', 'elsewhere')}))
+
+    def test_wheelhouse_build(self):
+        wheelhouse = os.path.join(self.temp_dir, 'wheelhouse')
+        self.useFixture(
+            fixtures.EnvironmentVariable('PBR_WHEELHOUSE_BUILD', 'true'))
+        packaging._pip_install(
+            ['http://example.com'], ['setuptools'],
+            option_dict={'wheelhouse': ('setup.cfg', wheelhouse)})
+        self.assertTrue(os.path.isdir(wheelhouse))
+        self.assertEqual(
+            [[sys.executable, '-m', 'pip.__init__', 'wheel',
+              '--wheel-dir=%s' % wheelhouse, '--find-links=%s' % wheelhouse,
+              '-f', 'http://example.com', 'setuptools']],
+            [args[0][0] for args in self.run_shell_command.call_args_list])
+
+
+class TestRequiresStamp(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestRequiresStamp, self).setUp()
+        self.useFixture(base.DiveDir(self.temp_dir))
+        self._write_requirements('foo')
+        os.mkdir('pbr_stamp.egg-info')
+        self.command = packaging._PipInstallTestRequires()
+        self.command.distribution = mock.Mock()
+        self.command.distribution.get_name.return_value = 'pbr-stamp'
+        self.command.get_finalized_command = mock.Mock()
+        self.command.install_test_requirements = mock.Mock()
+
+    def _write_requirements(self, text):
+        with open('test-requirements.txt', 'w') as f:
+            f.write(text)
+
+    def test_first_run_installs(self):
+        self.command.pre_run()
+        self.assertEqual(1, self.command.install_test_requirements.call_count)
+        self.assertEqual(
+            packaging._requires_digest(),
+            packaging._read_requires_stamp('pbr_stamp.egg-info'))
+
+    def test_touched_requirements_skip(self):
+        self.command.pre_run()
+        os.utime('test-requirements.txt', (0, 0))
+        self._write_requirements('foo')
+        self.command.pre_run()
+        self.assertEqual(1, self.command.install_test_requirements.call_count)
+
+    def test_changed_requirements_install(self):
+        self.command.pre_run()
+        self._write_requirements('foo\nbar')
+        self.command.pre_run()
+        self.assertEqual(2, self.command.install_test_requirements.call_count)
+
 
 class TestVersions(base.BaseTestCase):
 
@@ -299,6 +1032,52 @@ class TestVersions(base.BaseTestCase):
             ValueError, packaging._get_version_from_git, '1.2.4')
         self.assertThat(err.args[0], matchers.StartsWith('git history'))
 
+    def test_version_cached(self):
+        self.repo.commit()
+        self.repo.tag('1.2.3')
+        self.repo.commit()
+        version = packaging._get_version_from_git()
+        self.assertThat(version, matchers.StartsWith('1.2.4.dev1.g'))
+        with mock.patch.object(packaging, '_get_version_from_git_target',
+                               side_effect=AssertionError):
+            self.assertEqual(version, packaging._get_version_from_git())
+            # pre_version is part of the key
+            self.assertRaises(
+                AssertionError, packaging._get_version_from_git, '1.2.5')
+
+    def test_version_cache_invalidated_by_tags(self):
+        self.repo.commit()
+        self.repo.tag('1.2.3')
+        self.repo.commit()
+        packaging._get_version_from_git()
+        self.repo.tag('1.2.4')
+        self.assertEqual('1.2.4', packaging._get_version_from_git())
+
+    def test_tagged_version_without_git(self):
+        self.repo.commit()
+        self.repo.tag('1.2.3')
+        self.useFixture(
+            fixtures.EnvironmentVariable('SKIP_VERSION_CACHE', '1'))
+        with mock.patch.object(packaging, '_git_is_installed',
+                               return_value=True):
+            with mock.patch('subprocess.Popen', side_effect=AssertionError):
+                self.assertEqual('1.2.3', packaging._get_version_from_git())
+
+    def test_tagged_version_packed_object(self):
+        self.repo.commit()
+        self.repo.tag('1.2.3')
+        base._run_cmd(['git', 'repack', '-a', '-d'], self.package_dir)
+        base._run_cmd(['git', 'prune-packed'], self.package_dir)
+        self.assertEqual('1.2.3', packaging._get_version_from_git())
+
+    def test_version_cache_skipped(self):
+        self.useFixture(
+            fixtures.EnvironmentVariable('SKIP_VERSION_CACHE', '1'))
+        self.repo.commit()
+        packaging._get_version_from_git()
+        self.assertFalse(os.path.exists(git.state_path(
+            os.path.join(self.package_dir, '.git'), git._VERSION_CACHE)))
+
     def test_get_kwargs_corner_cases(self):
         # No tags:
         git_dir = self.repo._basedir + '/.git'
@@ -323,6 +1102,20 @@ class TestVersions(base.BaseTestCase):
         self.repo.tag('1.2.3')
         _check_combinations('1.2.3')
 
+    def test_unparseable_tag_ignored(self):
+        # Some tags make the version parser fail with IndexError rather
+        # than ValueError; they must be skipped all the same.
+        self.repo.commit()
+        self.repo.tag('1.2')
+        self.repo.tag('v1.0')
+        self.repo.tag('1.')
+        self.repo.commit()
+        version = packaging._get_version_from_git()
+        self.assertThat(version, matchers.StartsWith('1.2.1.dev1.g'))
+        self.repo.tag('2014.')
+        version = packaging._get_version_from_git()
+        self.assertThat(version, matchers.StartsWith('1.2.1.dev1.g'))
+
     def test_invalid_tag_ignored(self):
         # Fix for bug 1356784 - we treated any tag as a version, not just those
         # that are valid versions.
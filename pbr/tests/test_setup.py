@@ -30,8 +30,16 @@ except ImportError:
 import fixtures
 import testscenarios
 
+from pbr import git
 from pbr import packaging
 from pbr.tests import base
+from pbr import util
+
+try:
+    # Imports sphinx, which may be missing or of an unsupported version.
+    from pbr import builddoc
+except ImportError:
+    builddoc = None
 
 
 class SkipFileWrites(base.BaseTestCase):
@@ -148,16 +156,12 @@ class GitLogsTest(base.BaseTestCase):
         co_author = u"Foo Bar <foo@bar.com>"
         co_author_by = u"Co-authored-by: " + co_author
 
-        git_log_cmd = (
-            "git --git-dir=%s log --format=%%aN <%%aE>"
-            % self.git_dir)
-        git_co_log_cmd = ("git --git-dir=%s log" % self.git_dir)
-        git_top_level = "git rev-parse --show-toplevel"
-        cmd_map = {
-            git_log_cmd: author_new,
-            git_co_log_cmd: co_author_by,
-            git_top_level: self.root_dir,
-        }
+        git_log_cmd = [
+            "git", "--git-dir=%s" % self.git_dir,
+            "log", "--format=%s" % git._HISTORY_FORMAT, "HEAD"]
+        git_log_out = '\x1f'.join(
+            ['\x1e' + 'a' * 40, 'aaaaaaa', '', '', 'Subject', author_new,
+             'Subject\n\n' + co_author_by])
 
         exist_files = [self.git_dir,
                        os.path.join(self.temp_path, "AUTHORS.in")]
@@ -165,12 +169,11 @@ class GitLogsTest(base.BaseTestCase):
             "os.path.exists",
             lambda path: os.path.abspath(path) in exist_files))
 
-        def _fake_run_shell_command(cmd, **kwargs):
-            return cmd_map[" ".join(cmd)]
+        def _fake_git_log(proc_args):
+            self.assertEqual(git_log_cmd, proc_args['args'])
+            return {"stdout": BytesIO(git_log_out.encode('utf-8'))}
 
-        self.useFixture(fixtures.MonkeyPatch(
-            "pbr.packaging._run_shell_command",
-            _fake_run_shell_command))
+        self.useFixture(fixtures.FakePopen(_fake_git_log))
 
         with open(os.path.join(self.temp_path, "AUTHORS.in"), "w") as auth_fh:
             auth_fh.write("%s\n" % author_old)
@@ -204,6 +207,8 @@ class BuildSphinxTest(base.BaseTestCase):
 
     def setUp(self):
         super(BuildSphinxTest, self).setUp()
+        if builddoc is None:
+            self.skipTest('sphinx is not usable')
 
         self.useFixture(fixtures.MonkeyPatch(
             "sphinx.setup_command.BuildDoc.run", lambda self: None))
@@ -228,7 +233,7 @@ class BuildSphinxTest(base.BaseTestCase):
             options["autodoc_index_modules"] = ('setup.cfg', self.autodoc)
 
     def test_build_doc(self):
-        build_doc = packaging.LocalBuildDoc(self.distr)
+        build_doc = builddoc.LocalBuildDoc(self.distr)
         build_doc.run()
 
         self.assertTrue(
@@ -245,27 +250,27 @@ class BuildSphinxTest(base.BaseTestCase):
                 "api/fake_package.fake_private_module.rst"))
 
     def test_builders_config(self):
-        build_doc = packaging.LocalBuildDoc(self.distr)
+        build_doc = builddoc.LocalBuildDoc(self.distr)
         build_doc.finalize_options()
 
         self.assertEqual(2, len(build_doc.builders))
         self.assertIn('html', build_doc.builders)
         self.assertIn('man', build_doc.builders)
 
-        build_doc = packaging.LocalBuildDoc(self.distr)
+        build_doc = builddoc.LocalBuildDoc(self.distr)
         build_doc.builders = ''
         build_doc.finalize_options()
 
         self.assertEqual('', build_doc.builders)
 
-        build_doc = packaging.LocalBuildDoc(self.distr)
+        build_doc = builddoc.LocalBuildDoc(self.distr)
         build_doc.builders = 'man'
         build_doc.finalize_options()
 
         self.assertEqual(1, len(build_doc.builders))
         self.assertIn('man', build_doc.builders)
 
-        build_doc = packaging.LocalBuildDoc(self.distr)
+        build_doc = builddoc.LocalBuildDoc(self.distr)
         build_doc.builders = 'html,man,doctest'
         build_doc.finalize_options()
 
@@ -274,6 +279,93 @@ class BuildSphinxTest(base.BaseTestCase):
         self.assertIn('doctest', build_doc.builders)
 
 
+class LazyCommandsTest(base.BaseTestCase):
+
+    def test_sphinx_installed_does_not_import(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'sys.modules', dict(sys.modules)))
+        sys.modules.pop('pbr.builddoc', None)
+        sys.modules.pop('sphinx', None)
+        packaging.sphinx_installed()
+        self.assertNotIn('pbr.builddoc', sys.modules)
+        self.assertNotIn('sphinx', sys.modules)
+
+    def test_have_sphinx_needs_setup_command(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'pbr.packaging._have_sphinx', None))
+        self.useFixture(fixtures.MonkeyPatch(
+            'sys.modules', dict(sys.modules, **{
+                'sphinx.setup_command': None})))
+        self.assertFalse(packaging.have_sphinx())
+
+    def test_missing_module_is_not_available(self):
+        self.assertFalse(packaging._module_available('pbr_no_such_module'))
+
+    def test_resolved_on_lookup(self):
+        cmdclass = util.CommandClasses()
+        cmdclass.add_lazy('sdist', 'pbr.packaging.LocalSDist')
+        self.assertIn('sdist', cmdclass)
+        self.assertIs(packaging.LocalSDist, cmdclass['sdist'])
+        self.assertIs(packaging.LocalSDist, cmdclass.get('sdist'))
+
+    def test_unusable_command_skipped(self):
+        cmdclass = util.CommandClasses()
+        cmdclass.add_lazy('test', 'pbr.no_such_module.NoSuchTest')
+        cmdclass['sdist'] = packaging.LocalSDist
+        self.assertEqual([('sdist', packaging.LocalSDist)], cmdclass.items())
+        self.assertNotIn('test', cmdclass)
+        self.assertIsNone(cmdclass.get('test'))
+        self.assertRaises(KeyError, lambda: cmdclass['test'])
+
+    def test_setting_replaces_lazy_command(self):
+        cmdclass = util.CommandClasses()
+        cmdclass.add_lazy('test', 'pbr.no_such_module.NoSuchTest')
+        cmdclass['test'] = packaging.LocalSDist
+        self.assertEqual([('test', packaging.LocalSDist)], cmdclass.items())
+
+    def test_packaging_compat_names(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'pbr.packaging.LAZY_COMMANDS',
+            {'pbr.packaging.MovedCommand': (
+                'sdist', 'pbr.packaging.LocalSDist'),
+             'pbr.packaging.BrokenCommand': (
+                'test', 'pbr.no_such_module.NoSuchTest')}))
+        self.assertIs(packaging.LocalSDist, packaging.MovedCommand)
+        self.assertFalse(hasattr(packaging, 'BrokenCommand'))
+        self.assertFalse(hasattr(packaging, 'NoSuchCommand'))
+        from pbr.packaging import MovedCommand
+        self.assertIs(packaging.LocalSDist, MovedCommand)
+        self.assertIn('MovedCommand', dir(packaging))
+
+    def test_packaging_old_names(self):
+        if packaging.have_sphinx():
+            from pbr.packaging import LocalBuildDoc
+            from pbr.packaging import LocalBuildLatex
+            self.assertIs(builddoc.LocalBuildDoc, LocalBuildDoc)
+            self.assertIs(builddoc.LocalBuildLatex, LocalBuildLatex)
+        if packaging.have_testr():
+            from pbr.packaging import TestrTest
+            from pbr import testr_command
+            self.assertIs(testr_command.TestrTest, TestrTest)
+        if packaging.have_nose():
+            from pbr.packaging import NoseTest
+            from pbr import nose_command
+            self.assertIs(nose_command.NoseTest, NoseTest)
+
+    def test_packaging_monkeypatch_reaches_module(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'pbr.packaging._any_existing', lambda files: []))
+        self.assertEqual([], packaging.get_reqs_from_files(['setup.py']))
+
+    def test_setup_kwargs_defer_known_commands(self):
+        kwargs = util.setup_cfg_to_setup_kwargs(
+            {'global': {'commands': 'pbr.packaging.LocalBuildDoc'}})
+        cmdclass = kwargs['cmdclass']
+        self.assertEqual(['build_sphinx'], list(cmdclass))
+        self.assertEqual('pbr.builddoc.LocalBuildDoc',
+                         cmdclass._lazy['build_sphinx'])
+
+
 class ParseRequirementsTest(base.BaseTestCase):
 
     def setUp(self):
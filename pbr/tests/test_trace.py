@@ -0,0 +1,171 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import sys
+
+import fixtures
+from testtools import matchers
+
+from pbr import packaging
+from pbr.tests import base
+from pbr import trace
+from pbr import util
+
+
+class TestTrace(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestTrace, self).setUp()
+        self.trace_file = os.path.join(self.temp_dir, 'trace.json')
+        self.useFixture(
+            fixtures.EnvironmentVariable('PBR_TRACE', self.trace_file))
+        self.useFixture(fixtures.MonkeyPatch('pbr.trace._totals', {}))
+        self.summaries = []
+        self.useFixture(fixtures.MonkeyPatch(
+            'atexit.register', self.summaries.append))
+
+    def _records(self):
+        with open(self.trace_file) as trace_file:
+            return [json.loads(line) for line in trace_file]
+
+    def test_command_type(self):
+        self.assertEqual('git log', trace.command_type(
+            ['git', '--git-dir=.git', 'log', '--oneline']))
+        self.assertEqual('git', trace.command_type(['git', '--version']))
+        self.assertEqual('pip install', trace.command_type(
+            ['/usr/bin/python', '-m', 'pip.__init__', 'install', 'foo']))
+
+    def _run_git(self):
+        return packaging._run_shell_command(['git', '--version'])
+
+    def test_command_traced(self):
+        output = self._run_git()
+        [record] = self._records()
+        self.assertEqual(['git', '--version'], record['argv'])
+        self.assertEqual(os.getcwd(), record['cwd'])
+        self.assertEqual(0, record['exit'])
+        self.assertEqual(len(output) + 1, record['stdout_bytes'])
+        self.assertEqual(0, record['stderr_bytes'])
+        self.assertEqual('pbr.tests.test_trace._run_git', record['caller'])
+        self.assertEqual([trace.print_summary], self.summaries)
+
+    def test_failed_command_traced(self):
+        self.assertRaises(
+            OSError, packaging._run_shell_command, ['no-such-pbr-command'])
+        [record] = self._records()
+        self.assertIsNone(record['exit'])
+
+    def test_summary(self):
+        self._run_git()
+        self._run_git()
+        packaging._run_shell_command([sys.executable, '-c', 'pass'])
+        self.assertEqual(1, len(self.summaries))
+        summary = trace.summary().split('\n')
+        self.assertEqual(3, len(summary))
+        self.assertThat(summary[1] + summary[2],
+                        matchers.MatchesRegex('.*git +2 '))
+
+    def test_not_traced_by_default(self):
+        self.useFixture(fixtures.EnvironmentVariable('PBR_TRACE'))
+        self._run_git()
+        self.assertFalse(os.path.exists(self.trace_file))
+        self.assertEqual([], self.summaries)
+
+
+class TestPhases(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestPhases, self).setUp()
+        self.useFixture(fixtures.EnvironmentVariable('PBR_TIMING', '1'))
+        self.useFixture(fixtures.MonkeyPatch('pbr.trace._phases', []))
+        self.reports = []
+        self.useFixture(fixtures.MonkeyPatch(
+            'atexit.register', self.reports.append))
+
+    def test_nested_phases(self):
+        with trace.phase('outer'):
+            with trace.phase('inner'):
+                pass
+        with trace.phase('next'):
+            pass
+        self.assertEqual(
+            [('outer', 0), ('inner', 1), ('next', 0)],
+            [(p['name'], p['depth']) for p in trace._phases])
+        self.assertEqual([trace.report_phases], self.reports)
+        table = trace.phase_table().split('\n')
+        self.assertThat(table[2], matchers.EndsWith('    inner'))
+
+    def test_not_timed_by_default(self):
+        self.useFixture(fixtures.EnvironmentVariable('PBR_TIMING'))
+        with trace.phase('outer'):
+            pass
+        self.assertEqual([], trace._phases)
+        self.assertEqual([], self.reports)
+
+    def _test_false_value(self, value):
+        self.useFixture(fixtures.EnvironmentVariable('PBR_TIMING', value))
+        self.assertFalse(trace.timing_enabled())
+        with trace.phase('outer'):
+            pass
+        self.assertEqual([], trace._phases)
+        self.assertEqual([], self.reports)
+        trace._phases.append(dict(name='outer', depth=0, seconds=0.0))
+        trace.report_phases()
+        self.assertFalse(os.path.exists(value))
+
+    def test_zero_is_off(self):
+        self._test_false_value('0')
+
+    def test_false_is_off(self):
+        self._test_false_value('false')
+
+    def test_report_to_file(self):
+        timings = os.path.join(self.temp_dir, 'timings.json')
+        self.useFixture(fixtures.EnvironmentVariable('PBR_TIMING', timings))
+        with trace.phase('outer'):
+            pass
+        trace.report_phases()
+        with open(timings) as timings_file:
+            report = json.loads(timings_file.read())
+        self.assertEqual(['outer'], [p['name'] for p in report['phases']])
+
+    def test_timed_command(self):
+        runs = []
+
+        class Command(object):
+            def get_command_name(self):
+                return 'example'
+
+            def run(self):
+                runs.append(self)
+
+        command = trace.timed_command(Command)()
+        command.run()
+        self.assertEqual([command], runs)
+        self.assertEqual(['command example'],
+                         [p['name'] for p in trace._phases])
+
+    def test_cfg_to_args_phases(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'sys.path', [self.package_dir] + sys.path))
+        kwargs = util.cfg_to_args()
+        names = [p['name'] for p in trace._phases]
+        for name in ('config parse', 'config MetadataConfig',
+                     'config FilesConfig', 'setup kwargs', 'wrap commands'):
+            self.assertIn(name, names)
+        sdist = kwargs['cmdclass']['sdist']
+        self.assertTrue(issubclass(sdist, packaging.LocalSDist))
+        self.assertIsNot(sdist, packaging.LocalSDist)
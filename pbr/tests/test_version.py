@@ -13,8 +13,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import itertools
 import operator
+import os
+import pickle
+import sys
+import threading
+import time
 
+import fixtures
 from testtools import matchers
 
 from pbr.tests import base
@@ -99,6 +106,27 @@ class TestSemanticVersion(base.BaseTestCase):
         self.assertThat(dev_count, matchers.GreaterThan(dev_base))
         self.assertRaises(TypeError, operator.lt, dev_base, githash)
 
+    def test_hash(self):
+        self.assertEqual(hash(version.SemanticVersion(1)),
+                         hash(version.SemanticVersion(1, 0, 0)))
+        self.assertNotEqual(
+            hash(version.SemanticVersion(1, 2, 3, dev_count=6, githash='6')),
+            hash(version.SemanticVersion(1, 2, 3, dev_count=6, githash='7')))
+
+    def test_no_instance_dict(self):
+        semver = version.SemanticVersion(1, 2, 3)
+        self.assertFalse(hasattr(semver, '__dict__'))
+
+    def test_strings_cached(self):
+        semver = version.SemanticVersion(1, 2, 3, 'rc', 1)
+        self.assertIs(semver.release_string(), semver.release_string())
+        self.assertIs(semver.debian_string(), semver.debian_string())
+        self.assertIs(semver.rpm_string(), semver.rpm_string())
+
+    def test_pickle(self):
+        semver = version.SemanticVersion(1, 2, 3, dev_count=6, githash='6')
+        self.assertEqual(semver, pickle.loads(pickle.dumps(semver)))
+
     def test_from_pip_string_legacy_alpha(self):
         expected = version.SemanticVersion(
             1, 2, 0, prerelease_type='rc', prerelease=1)
@@ -339,3 +367,190 @@ class TestSemanticVersion(base.BaseTestCase):
         self.assertEqual(
             version.SemanticVersion(1, 2, 3),
             version.SemanticVersion(1, 2, 3, 'rc', 1).to_release())
+
+
+class TestInstalledVersion(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestInstalledVersion, self).setUp()
+        self.path = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.MonkeyPatch('sys.path', [self.path]))
+
+    def _write(self, relative_path, content):
+        path = os.path.join(self.path, relative_path)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as metadata:
+            metadata.write(content)
+
+    def test_dist_info(self):
+        self._write('fake_pkg-1.2.3.dist-info/METADATA',
+                    'Metadata-Version: 2.0\nName: fake-pkg\n'
+                    'Version: 1.2.3\n\nVersion: 0.0.0\n')
+        self.assertEqual('1.2.3', version._scan_metadata_version('Fake-Pkg'))
+
+    def test_egg_info_file(self):
+        self._write('fake_pkg-2.0.0-py2.7.egg-info',
+                    'Metadata-Version: 1.1\nVersion: 2.0.0\n')
+        self.assertEqual('2.0.0', version._scan_metadata_version('fake-pkg'))
+
+    def test_egg_on_path(self):
+        egg = os.path.join(self.path, 'fake_pkg-3.0.0-py2.7.egg')
+        self._write(os.path.join(egg, 'EGG-INFO', 'PKG-INFO'),
+                    'Metadata-Version: 1.1\nVersion: 3.0.0\n')
+        sys.path.append(egg)
+        self.assertEqual('3.0.0', version._scan_metadata_version('fake_pkg'))
+
+    def test_not_installed(self):
+        self._write('other_pkg-1.0.0.dist-info/METADATA', 'Version: 1.0.0\n')
+        self.assertIsNone(version._scan_metadata_version('fake_pkg'))
+
+
+class TestVersionInfo(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestVersionInfo, self).setUp()
+        self.lookups = []
+
+        def lookup(info):
+            self.lookups.append(info)
+            # Give the other threads time to ask for the version too.
+            time.sleep(0.1)
+            return version.SemanticVersion(1, 2, 3)
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'pbr.version.VersionInfo._get_version_from_metadata', lookup))
+
+    def test_concurrent_lookups_run_once(self):
+        info = version.VersionInfo('fake_pkg')
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(info.semantic_version()))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(self.lookups))
+        self.assertEqual([version.SemanticVersion(1, 2, 3)] * 8, results)
+
+    def test_instances_share_result(self):
+        first = version.VersionInfo('fake_pkg').semantic_version()
+        second = version.VersionInfo('fake_pkg').semantic_version()
+        self.assertIs(first, second)
+        self.assertEqual(1, len(self.lookups))
+        version.VersionInfo('other_pkg').semantic_version()
+        self.assertEqual(2, len(self.lookups))
+
+
+class TestFromPipStringParsers(base.BaseTestCase):
+    """The compiled parser must agree with the one it replaced."""
+
+    releases = ['1', '1.2', '1.2.3', '0.0', '10.20.30', '01.2.3', '1.0',
+                '1.2.0', '1.2.3.4', '1.2.3.0']
+    separators = ['', '.']
+    remainders = ['', '0', '4', '05', '0a1', '00rc2', 'a1', 'b2', 'rc3',
+                  'alpha1', 'beta', 'r2', 'dev4', 'dev0', 'dev', 'g1234',
+                  'gabc', 'g', 'x1', '0dev4', '0g1', 'a']
+    tails = ['', '.g1234', '.gabc', '.5', '.', '.x', '.g', '.dev5', '.0',
+             '.a1', '.12ab']
+
+    def _parse_outcome(self, parse, version_string):
+        # The legacy parser fails some malformed strings with IndexError;
+        # from_pip_string must fail them the same way.
+        try:
+            semver = parse(version_string)
+        except (IndexError, ValueError) as e:
+            return type(e)
+        return semver and semver.components()
+
+    def test_differential(self):
+        matched = 0
+        for parts in itertools.product(
+                self.releases, self.separators, self.remainders, self.tails):
+            version_string = ''.join(parts)
+            expected = self._parse_outcome(
+                version._from_pip_string_legacy, version_string)
+            self.assertEqual(
+                expected,
+                self._parse_outcome(from_pip_string, version_string),
+                version_string)
+            compiled = self._parse_outcome(
+                version._from_pip_string_re, version_string)
+            if compiled is not None:
+                matched += 1
+                self.assertEqual(expected, compiled, version_string)
+        self.assertThat(matched, matchers.GreaterThan(1000))
+
+    def test_generated_forms_compiled(self):
+        for version_string in ['1.2.3', '1.2.3.0a1', '1.2.3.0rc1',
+                               '1.2.3.dev4.g1234', '0.10.1.3.g83bef74',
+                               '1.2.0a1', '1.2.dev4.g1234', '1.2.b4']:
+            self.assertEqual(
+                version._from_pip_string_legacy(version_string),
+                version._from_pip_string_re(version_string))
+
+    def test_cached(self):
+        self.assertIs(from_pip_string('1.2.3.dev4.g1234'),
+                      from_pip_string('1.2.3.dev4.g1234'))
+
+
+class TestVersionBatch(base.BaseTestCase):
+
+    ordered = ['0.9', '1.2.3.0a1', '1.2.3.0a2', '1.2.3.0b1', '1.2.3.0rc1',
+               '1.2.3.dev1.g1234', '1.2.3.dev4.g1234', '1.2.3', '1.2.4',
+               '1.10.0', '2.0.0', '10.0.0']
+
+    def test_skips_non_versions(self):
+        batch = version.SemanticVersion.parse_many(
+            ['1.2.3', 'foo', 'release-1', '1.2.x', '2.0'])
+        self.assertEqual(['1.2.3', '2.0'], batch.strings)
+        self.assertEqual(2, len(batch))
+
+    def test_sort_many(self):
+        shuffled = list(reversed(self.ordered))
+        self.assertEqual(
+            self.ordered, version.SemanticVersion.sort_many(shuffled))
+
+    def test_sort_many_agrees_with_objects(self):
+        # Pre-releases and dev builds of one release do not compare as
+        # objects, so leave the pre-releases out.
+        comparable = self.ordered[:1] + self.ordered[5:]
+        shuffled = comparable[1::2] + comparable[::3] + comparable
+        expected = [
+            semver.release_string() for semver in sorted(
+                from_pip_string(version_string)
+                for version_string in shuffled)]
+        self.assertEqual(
+            expected,
+            [from_pip_string(version_string).release_string()
+             for version_string in
+             version.SemanticVersion.sort_many(shuffled)])
+
+    def test_sort_many_unique(self):
+        self.assertEqual(
+            ['1.2.3.0a1', '1.2.3', '2.0'],
+            version.SemanticVersion.sort_many(
+                ['2.0', '1.2.3', '1.2.3.0a1', '2.0.0', '1.2.3'],
+                unique=True))
+
+    def test_prerelease_before_dev(self):
+        self.assertEqual(
+            ['1.2.3.0rc1', '1.2.3.dev4.g1234'],
+            version.SemanticVersion.sort_many(
+                ['1.2.3.dev4.g1234', '1.2.3.0rc1']))
+
+    def test_max_of(self):
+        self.assertEqual(
+            '10.0.0', version.SemanticVersion.max_of(self.ordered))
+        self.assertEqual(
+            '1.2.3.dev1.g1234',
+            version.SemanticVersion.max_of(['1.2.3.0rc1', '1.2.3.dev1.g1234',
+                                            'foo']))
+        self.assertEqual(
+            '10.0.0', version.SemanticVersion.parse_many(self.ordered).max())
+
+    def test_max_of_none(self):
+        self.assertIsNone(version.SemanticVersion.max_of(['foo', 'bar']))
+        self.assertIsNone(version.SemanticVersion.parse_many([]).max())
@@ -0,0 +1,206 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Tracing of the external commands pbr runs, and timing of its phases.
+
+Setting PBR_TRACE to a file name makes pbr append a JSON object per line to
+that file for every command it runs, and print the totals for each kind of
+command to stderr when the process exits.
+
+Setting PBR_TIMING to a true value makes pbr print how long each phase of
+its work took to stderr when the process exits; setting it to anything but
+a true or false value, a file name, appends the timings to that file as a
+line of JSON instead.
+"""
+
+import atexit
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+# Frames that run commands on behalf of the interesting caller.
+_PLUMBING_MODULES = ('pbr.trace', 'pbr.git')
+_PLUMBING_FUNCTIONS = ('_run_shell_command', '_run_git_command', '<lambda>',
+                       '<genexpr>')
+
+# As pbr.packaging.TRUE_VALUES, with the values that turn PBR_TIMING off.
+_TRUE_VALUES = ('true', '1', 'yes')
+_FALSE_VALUES = ('', 'false', '0', 'no')
+
+_lock = threading.Lock()
+_totals = {}
+_phases = []
+_local = threading.local()
+
+
+def _trace_file():
+    return os.environ.get('PBR_TRACE')
+
+
+def _caller():
+    """Return the name of the pbr function that asked for a command."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if (module.startswith('pbr') and module not in _PLUMBING_MODULES
+                and frame.f_code.co_name not in _PLUMBING_FUNCTIONS):
+            return '%s.%s' % (module, frame.f_code.co_name)
+        frame = frame.f_back
+    return None
+
+
+def command_type(argv):
+    """Return the program and subcommand of argv, e.g. 'git log'."""
+    words = [os.path.basename(argv[0])]
+    args = list(argv[1:])
+    if args[:1] == ['-m'] and len(args) > 1:
+        # python -m pip.__init__ install ...
+        words = [args[1].split('.')[0]]
+        args = args[2:]
+    for arg in args:
+        if not arg.startswith('-'):
+            words.append(arg)
+            break
+    return ' '.join(words)
+
+
+def begin(argv):
+    """Note that argv is about to be run.
+
+    :return: A handle to pass to end once the command has finished, or None
+        if tracing is off.
+    """
+    if not _trace_file():
+        return None
+    return dict(argv=list(argv), cwd=os.getcwd(), caller=_caller(),
+                start=time.time())
+
+
+def end(handle, returncode, stdout=None, stderr=None):
+    """Record a command started with begin.
+
+    :param returncode: The exit code, or None if the command did not run.
+    :param stdout: The number of bytes read from stdout, if captured.
+    :param stderr: The number of bytes read from stderr, if captured.
+    """
+    if handle is None:
+        return
+    wall = time.time() - handle.pop('start')
+    handle.update(wall=round(wall, 6), exit=returncode,
+                  stdout_bytes=stdout, stderr_bytes=stderr, pid=os.getpid())
+    with _lock:
+        if not _totals:
+            atexit.register(print_summary)
+        totals = _totals.setdefault(command_type(handle['argv']),
+                                    [0, 0.0, 0, 0])
+        totals[0] += 1
+        totals[1] += wall
+        totals[2] += stdout or 0
+        totals[3] += stderr or 0
+        try:
+            with open(_trace_file(), 'a') as trace:
+                trace.write(json.dumps(handle, sort_keys=True) + '\n')
+        except (IOError, OSError):
+            pass
+
+
+def summary():
+    """Return a table of the totals of each kind of command traced."""
+    lines = ['%-24s %6s %10s %12s %12s' % (
+        'command', 'calls', 'seconds', 'stdout', 'stderr')]
+    for name, (calls, wall, stdout, stderr) in sorted(
+            _totals.items(), key=lambda item: -item[1][1]):
+        lines.append('%-24s %6d %10.3f %12d %12d' % (
+            name, calls, wall, stdout, stderr))
+    return '\n'.join(lines)
+
+
+def print_summary():
+    if _totals:
+        sys.stderr.write('[pbr] Commands run (traced to %s):\n%s\n' % (
+            _trace_file(), summary()))
+
+
+def _timing():
+    """Return PBR_TIMING, or None if it is unset or a false value."""
+    timing = os.environ.get('PBR_TIMING', '')
+    if timing.lower() in _FALSE_VALUES:
+        return None
+    return timing
+
+
+def timing_enabled():
+    return bool(_timing())
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Time the body of the with statement as the phase called name."""
+    if not _timing():
+        yield
+        return
+    depth = getattr(_local, 'depth', 0)
+    record = dict(name=name, depth=depth, seconds=None)
+    with _lock:
+        if not _phases:
+            atexit.register(report_phases)
+        _phases.append(record)
+    _local.depth = depth + 1
+    start = time.time()
+    try:
+        yield
+    finally:
+        record['seconds'] = round(time.time() - start, 6)
+        _local.depth = depth
+
+
+def timed_command(cmdclass):
+    """Return a subclass of cmdclass whose run is timed as a phase."""
+    def run(self, cmdclass=cmdclass):
+        with phase('command %s' % self.get_command_name()):
+            cmdclass.run(self)
+
+    return type(cmdclass.__name__, (cmdclass, object), {'run': run})
+
+
+def phase_table():
+    """Return a table of the phases timed, nested phases indented."""
+    lines = ['%10s  %s' % ('seconds', 'phase')]
+    for record in _phases:
+        seconds = record['seconds']
+        lines.append('%10s  %s%s' % (
+            '%.3f' % seconds if seconds is not None else '-',
+            '  ' * record['depth'], record['name']))
+    return '\n'.join(lines)
+
+
+def report_phases():
+    """Write the phase timings where PBR_TIMING asks for them."""
+    destination = _timing()
+    if not _phases or not destination:
+        return
+    if destination.lower() in _TRUE_VALUES:
+        sys.stderr.write('[pbr] Phase timings:\n%s\n' % phase_table())
+        return
+    try:
+        with open(destination, 'a') as timings:
+            timings.write(json.dumps(dict(
+                argv=sys.argv, pid=os.getpid(), phases=_phases),
+                sort_keys=True) + '\n')
+    except (IOError, OSError):
+        pass
@@ -78,6 +78,8 @@ except ImportError:
     import configparser
 
 from pbr import extra_files
+from pbr import packaging
+from pbr import trace
 import pbr.hooks
 
 # A simplified RE for this; just checks that the line ends with version
@@ -200,10 +202,11 @@ def cfg_to_args(path='setup.cfg'):
     if not os.path.exists(path):
         raise DistutilsFileError("file '%s' does not exist" %
                                  os.path.abspath(path))
-    parser.read(path)
-    config = {}
-    for section in parser.sections():
-        config[section] = dict(parser.items(section))
+    with trace.phase('config parse'):
+        parser.read(path)
+        config = {}
+        for section in parser.sections():
+            config[section] = dict(parser.items(section))
 
     # Run setup_hooks, if configured
     setup_hooks = has_get_option(config, 'global', 'setup_hooks')
@@ -222,22 +225,25 @@ def cfg_to_args(path='setup.cfg'):
                 hook for hook in split_multiline(setup_hooks)
                 if hook != 'pbr.hooks.setup_hook']
             for hook in setup_hooks:
-                hook_fn = resolve_name(hook)
-                try :
-                    hook_fn(config)
-                except SystemExit:
-                    log.error('setup hook %s terminated the installation')
-                except:
-                    e = sys.exc_info()[1]
-                    log.error('setup hook %s raised exception: %s\n' %
-                              (hook, e))
-                    log.error(traceback.format_exc())
-                    sys.exit(1)
+                with trace.phase('setup_hook %s' % hook):
+                    hook_fn = resolve_name(hook)
+                    try :
+                        hook_fn(config)
+                    except SystemExit:
+                        log.error('setup hook %s terminated the installation')
+                    except:
+                        e = sys.exc_info()[1]
+                        log.error('setup hook %s raised exception: %s\n' %
+                                  (hook, e))
+                        log.error(traceback.format_exc())
+                        sys.exit(1)
 
         # Run the pbr hook
-        pbr.hooks.setup_hook(config)
+        with trace.phase('setup_hook pbr.hooks.setup_hook'):
+            pbr.hooks.setup_hook(config)
 
-        kwargs = setup_cfg_to_setup_kwargs(config)
+        with trace.phase('setup kwargs'):
+            kwargs = setup_cfg_to_setup_kwargs(config)
 
         # Set default config overrides
         kwargs['include_package_data'] = True
@@ -253,7 +259,8 @@ def cfg_to_args(path='setup.cfg'):
         if entry_points:
             kwargs['entry_points'] = entry_points
 
-        wrap_commands(kwargs)
+        with trace.phase('wrap commands'):
+            wrap_commands(kwargs)
 
         # Handle the [files]/extra_files option
         files_extra_files = has_get_option(config, 'files', 'extra_files')
@@ -352,11 +359,17 @@ def setup_cfg_to_setup_kwargs(config):
                     data_files = data_files.items()
                 in_cfg_value = data_files
             elif arg == 'cmdclass':
-                cmdclass = {}
+                cmdclass = CommandClasses()
                 dist = Distribution()
                 for cls in in_cfg_value:
+                    if cls in packaging.LAZY_COMMANDS:
+                        cmd, cls = packaging.LAZY_COMMANDS[cls]
+                        cmdclass.add_lazy(cmd, cls)
+                        continue
                     cls = resolve_name(cls)
                     cmd = cls(dist)
+                    if trace.timing_enabled():
+                        cls = trace.timed_command(cls)
                     cmdclass[cmd.get_command_name()] = cls
                 in_cfg_value = cmdclass
 
@@ -539,7 +552,8 @@ def run_command_hooks(cmd_obj, hook_kind):
                  hook_kind, hook, cmd_obj.get_command_name())
 
         try :
-            hook_obj(cmd_obj)
+            with trace.phase('%s %s' % (hook_kind, hook)):
+                hook_obj(cmd_obj)
         except:
             e = sys.exc_info()[1]
             log.error('hook %s raised exception: %s\n' % (hook, e))
@@ -616,3 +630,71 @@ class IgnoreDict(dict):
         if self.__ignore.match(key):
             return
         super(IgnoreDict, self).__setitem__(key, val)
+
+
+class CommandClasses(dict):
+    """A cmdclass dictionary which imports some command classes on demand.
+
+    Commands added with add_lazy() are given by the dotted name of their
+    class, which is only resolved the first time the command is looked up.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CommandClasses, self).__init__(*args, **kwargs)
+        self._lazy = {}
+
+    def add_lazy(self, command, name):
+        super(CommandClasses, self).__setitem__(command, None)
+        self._lazy[command] = name
+
+    def __setitem__(self, command, cls):
+        self._lazy.pop(command, None)
+        super(CommandClasses, self).__setitem__(command, cls)
+
+    def __getitem__(self, command):
+        if command in self._lazy:
+            name = self._lazy.pop(command)
+            try:
+                cls = resolve_name(name)
+            except ImportError as e:
+                # The dependency is missing or unusable: carry on as if the
+                # command had never been configured, as pbr did when it
+                # imported the dependencies up front.
+                log.info('[pbr] Skipping command %s (%s): %s'
+                         % (command, name, e))
+                super(CommandClasses, self).__delitem__(command)
+                raise KeyError(command)
+            if trace.timing_enabled():
+                cls = trace.timed_command(cls)
+            super(CommandClasses, self).__setitem__(command, cls)
+        return super(CommandClasses, self).__getitem__(command)
+
+    def __contains__(self, command):
+        # distutils asks whether a command is known before looking it up.
+        if command in self._lazy:
+            try:
+                self[command]
+            except KeyError:
+                return False
+        return super(CommandClasses, self).__contains__(command)
+
+    def get(self, command, default=None):
+        try:
+            return self[command]
+        except KeyError:
+            return default
+
+    def _resolved_items(self):
+        items = []
+        for command in list(self):
+            try:
+                items.append((command, self[command]))
+            except KeyError:
+                pass
+        return items
+
+    def values(self):
+        return [cls for command, cls in self._resolved_items()]
+
+    def items(self):
+        return self._resolved_items()
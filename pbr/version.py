@@ -15,13 +15,113 @@
 #    under the License.
 
 """
-Utilities for consuming the version from pkg_resources.
+Utilities for consuming the version from installed package metadata.
 """
 
+import array
 import itertools
 import operator
+import os
+import re
+import sys
+import threading
 
-import pkg_resources
+# The module pbr writes into a package at build time to record its version;
+# see pbr.packaging.write_version_modules.
+VERSION_MODULE = '_pbr_version'
+
+
+# The SemanticVersion of each package looked up, shared by every VersionInfo
+# in the process. A lookup for a package holds that package's lock, so that
+# concurrent first lookups wait for one result instead of all running it.
+_semantic_versions = {}
+_package_locks = {}
+_lock = threading.Lock()
+
+
+def _safe_name(name):
+    """Normalise a distribution name the way metadata file names escape it."""
+    return re.sub(r'[-_.]+', '_', name).lower()
+
+
+def _read_metadata_version(path):
+    """Return the Version header of a PKG-INFO or METADATA file, or None."""
+    try:
+        with open(path) as metadata:
+            for line in metadata:
+                if not line.strip():
+                    break
+                if line.startswith('Version:'):
+                    return line[len('Version:'):].strip()
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def _scan_metadata_version(package):
+    """Find the version of package in the metadata on sys.path.
+
+    Looks for package-*.dist-info and package-*.egg-info entries, and for
+    package-*.egg entries on sys.path itself, without importing anything.
+    """
+    wanted = _safe_name(package)
+    for entry in sys.path:
+        entry = entry or os.curdir
+        basename = os.path.basename(entry)
+        if (basename.endswith('.egg') and
+                _safe_name(basename.split('-', 1)[0]) == wanted):
+            version = _read_metadata_version(
+                os.path.join(entry, 'EGG-INFO', 'PKG-INFO'))
+            if version:
+                return version
+        try:
+            filenames = os.listdir(entry)
+        except (IOError, OSError):
+            continue
+        for filename in filenames:
+            name, extension = os.path.splitext(filename)
+            if extension not in ('.dist-info', '.egg-info'):
+                continue
+            if _safe_name(name.split('-', 1)[0]) != wanted:
+                continue
+            path = os.path.join(entry, filename)
+            if extension == '.dist-info':
+                path = os.path.join(path, 'METADATA')
+            elif os.path.isdir(path):
+                path = os.path.join(path, 'PKG-INFO')
+            version = _read_metadata_version(path)
+            if version:
+                return version
+    return None
+
+
+def _get_installed_version(package):
+    """Return the installed version of package, or None if not installed.
+
+    importlib.metadata is used where available, with a direct scan of the
+    metadata on sys.path otherwise. pkg_resources, which scans every
+    distribution on sys.path when imported, is the last resort.
+    """
+    try:
+        from importlib import metadata
+    except ImportError:
+        version = _scan_metadata_version(package)
+    else:
+        try:
+            version = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            version = None
+    if version:
+        return version
+    try:
+        import pkg_resources
+    except ImportError:
+        return None
+    try:
+        requirement = pkg_resources.Requirement.parse(package)
+        return pkg_resources.get_provider(requirement).version
+    except pkg_resources.DistributionNotFound:
+        return None
 
 
 def _is_int(string):
@@ -32,12 +132,181 @@ def _is_int(string):
         return False
 
 
+# Every version string pbr has ever generated, in a single pass. Strings it
+# does not match are left to _from_pip_string_legacy.
+_PIP_VERSION_RE = re.compile(r"""
+    (?P<major>[0-9]+)
+    (?:\.(?P<minor>[0-9]+))?
+    (?:\.(?P<patch>[0-9]+))?
+    (?:
+        (?P<separator>\.?)
+        (?:
+            # old dev format - 0.1.2.3.g1234
+            (?P<dev_number>[0-9]+)(?:\.(?P<number_hash>[^.]*))?
+            | dev(?P<dev_count>[0-9]+)(?:\.(?![0-9]+\Z)(?P<dev_hash>[^.]*))?
+            | g(?P<g_hash>[^.]*)(?:\.(?![0-9]+\Z)(?P<g_hash2>[^.]*))?
+            # RC/beta layout: 0a1 after a full release, or a1/b1/rc1
+            | (?P<prerelease_zeros>0[0-9]*)?(?P<prerelease_type>[a-zA-Z]+)
+              (?P<prerelease>[0-9]+)
+        )
+    )?
+    \Z""", re.VERBOSE)
+
+# The most SemanticVersion.from_pip_string remembers before starting over.
+_PIP_STRING_CACHE_SIZE = 4096
+_pip_string_cache = {}
+
+# Strings with no component of just digits are never versions; this finds
+# them without raising from the legacy parser.
+_DIGIT_COMPONENT_RE = re.compile(r'(?:\A|\.)\d+(?=\.|\Z)', re.UNICODE)
+
+
+def _from_pip_string_re(version_string):
+    """Parse version_string with _PIP_VERSION_RE.
+
+    :return: A SemanticVersion, or None if the string needs the legacy
+        parser: either the expression does not match, or it matches a form
+        whose legacy handling depends on more than the expression checks.
+    """
+    match = _PIP_VERSION_RE.match(version_string)
+    if match is None:
+        return None
+    (major, minor, patch, separator, dev_number, number_hash, dev_count,
+     dev_hash, g_hash, g_hash2, prerelease_zeros, prerelease_type,
+     prerelease) = match.groups()
+    if separator == '' and minor is None:
+        # 1rc1 has no release digits at all.
+        return None
+    githash = None
+    if dev_number is not None:
+        if not separator or patch is None or not int(dev_number):
+            return None
+        dev_count = int(dev_number)
+        if number_hash is not None:
+            githash = number_hash[1:]
+    elif prerelease_type is not None:
+        if prerelease_zeros is not None:
+            if not separator or patch is None:
+                return None
+        elif prerelease_type[0] not in 'abr':
+            return None
+        prerelease = int(prerelease)
+    elif dev_count is not None:
+        dev_count = int(dev_count)
+        if dev_hash is not None:
+            githash = dev_hash[1:]
+    elif g_hash is not None:
+        dev_count = 1
+        githash = g_hash if g_hash2 is None else g_hash2[1:]
+    return SemanticVersion(
+        int(major), int(minor or 0), int(patch or 0),
+        prerelease_type=prerelease_type, prerelease=prerelease,
+        dev_count=dev_count, githash=githash)
+
+
+def _from_pip_string_legacy(version_string):
+    """Parse version_string one component at a time.
+
+    This is the parser SemanticVersion.from_pip_string used before
+    _PIP_VERSION_RE; it handles the irregular strings the expression does
+    not match, and defines the results the expression must reproduce.
+    """
+    input_components = version_string.split('.')
+    # decimals first (keep pre-release and dev/hashes to the right)
+    components = [c for c in input_components if c.isdigit()]
+    digit_len = len(components)
+    if digit_len == 0:
+        raise ValueError("Invalid version %r" % version_string)
+    elif digit_len < 3:
+        if (digit_len < len(input_components) and
+                input_components[digit_len][0].isdigit()):
+            # Handle X.YaZ - Y is a digit not a leadin to pre-release.
+            mixed_component = input_components[digit_len]
+            last_component = ''.join(itertools.takewhile(
+                lambda x: x.isdigit(), mixed_component))
+            components.append(last_component)
+            input_components[digit_len:digit_len + 1] = [
+                last_component, mixed_component[len(last_component):]]
+            digit_len += 1
+        components.extend([0] * (3 - digit_len))
+    components.extend(input_components[digit_len:])
+    major = int(components[0])
+    minor = int(components[1])
+    dev_count = None
+    prerelease_type = None
+    prerelease = None
+    githash = None
+
+    def _parse_type(segment):
+        # Discard leading digits (the 0 in 0a1)
+        isdigit = operator.methodcaller('isdigit')
+        segment = ''.join(itertools.dropwhile(isdigit, segment))
+        isalpha = operator.methodcaller('isalpha')
+        prerelease_type = ''.join(itertools.takewhile(isalpha, segment))
+        prerelease = segment[len(prerelease_type)::]
+        return prerelease_type, int(prerelease)
+    if _is_int(components[2]):
+        patch = int(components[2])
+    else:
+        # legacy version e.g. 1.2.0a1 (canonical is 1.2.0.0a1)
+        # or 1.2.dev4.g1234 or 1.2.b4
+        patch = 0
+        components[2:2] = [0]
+    remainder = components[3:]
+    remainder_starts_with_int = False
+    try:
+        if remainder and int(remainder[0]):
+            remainder_starts_with_int = True
+    except ValueError:
+        pass
+    if remainder_starts_with_int:
+        # old dev format - 0.1.2.3.g1234
+        dev_count = int(remainder[0])
+    else:
+        if remainder and (remainder[0][0] == '0' or
+                          remainder[0][0] in ('a', 'b', 'r')):
+            # Current RC/beta layout
+            prerelease_type, prerelease = _parse_type(remainder[0])
+            remainder = remainder[1:]
+        if remainder:
+            component = remainder[0]
+            if component.startswith('dev'):
+                dev_count = int(component[3:])
+            elif component.startswith('g'):
+                # git hash - so use a dev_count of 1 as we have to have one
+                dev_count = 1
+                githash = component[1:]
+            else:
+                raise ValueError(
+                    'Unknown remainder %r in %r'
+                    % (remainder, version_string))
+    if len(remainder) > 1:
+            githash = remainder[1][1:]
+    return SemanticVersion(
+        major, minor, patch, prerelease_type=prerelease_type,
+        prerelease=prerelease, dev_count=dev_count, githash=githash)
+
+
+# The stages of a SemanticVersion's sort key, in the order they sort in.
+# The sum of two stages tells which pair of stages is being compared.
+_PRERELEASE = 0
+_DEV = 1
+_FINAL = 3
+
+
 class SemanticVersion(object):
     """A pure semantic version independent of serialisation.
 
     See the pbr doc 'semver' for details on the semantics.
+
+    Instances are immutable: the key they sort by, their hash and their
+    string forms are computed once.
     """
 
+    __slots__ = ('_major', '_minor', '_patch', '_prerelease_type',
+                 '_prerelease', '_dev_count', '_githash', '_key', '_hash',
+                 '_release_string', '_debian_string', '_rpm_string')
+
     def __init__(self, major, minor=0, patch=0, prerelease_type=None,
                  prerelease=None, dev_count=None, githash=None):
         """Create a SemanticVersion.
@@ -70,61 +339,49 @@ class SemanticVersion(object):
             raise ValueError(
                 "invalid version: cannot have prerelease and dev strings %s %s"
                 % (prerelease_type, dev_count))
+        if self._prerelease_type:
+            # Use the a < b < rc cheat
+            self._key = (major, minor, patch, _PRERELEASE,
+                         self._prerelease_type, self._prerelease)
+        elif self._dev_count:
+            self._key = (major, minor, patch, _DEV, self._dev_count)
+        else:
+            self._key = (major, minor, patch, _FINAL)
+        self._hash = hash(self.components())
+        self._release_string = None
+        self._debian_string = None
+        self._rpm_string = None
+
+    def __reduce__(self):
+        return (SemanticVersion, self.components())
 
     def __eq__(self, other):
         if not isinstance(other, SemanticVersion):
             return False
-        return self.__dict__ == other.__dict__
+        return (self._hash == other._hash and
+                self.components() == other.components())
 
     def __hash__(self):
-        return sum(map(hash, self.__dict__.values()))
+        return self._hash
 
     def __lt__(self, other):
         """Compare self and other, another Semantic Version."""
-        # NB(lifeless) this could perhaps be rewritten as
-        # lt (tuple_of_one, tuple_of_other) with a single check for
-        # the typeerror corner cases - that would likely be faster
-        # if this ever becomes performance sensitive.
         if not isinstance(other, SemanticVersion):
             raise TypeError("ordering to non-SemanticVersion is undefined")
-        this_tuple = (self._major, self._minor, self._patch)
-        other_tuple = (other._major, other._minor, other._patch)
-        if this_tuple < other_tuple:
-            return True
-        elif this_tuple > other_tuple:
-            return False
-        if self._prerelease_type:
-            if other._prerelease_type:
-                # Use the a < b < rc cheat
-                this_tuple = (self._prerelease_type, self._prerelease)
-                other_tuple = (other._prerelease_type, other._prerelease)
-                return this_tuple < other_tuple
-            elif other._dev_count:
+        this_key = self._key
+        other_key = other._key
+        # The orderings semver leaves undefined are between a pre-release
+        # and a dev build, or two dev builds, of the same release.
+        stages = this_key[3] + other_key[3]
+        if ((stages == _PRERELEASE + _DEV or stages == _DEV + _DEV)
+                and this_key[:3] == other_key[:3]):
+            if stages == _PRERELEASE + _DEV:
                 raise TypeError(
                     "ordering pre-release with dev builds is undefined")
-            else:
-                return True
-        elif self._dev_count:
-            if other._dev_count:
-                if self._dev_count < other._dev_count:
-                    return True
-                elif self._dev_count > other._dev_count:
-                    return False
-                elif self._githash == other._githash:
-                    # == it not <
-                    return False
+            if this_key == other_key and self._githash != other._githash:
                 raise TypeError(
                     "same version with different hash has no defined order")
-            elif other._prerelease_type:
-                raise TypeError(
-                    "ordering pre-release with dev builds is undefined")
-            else:
-                return True
-        else:
-            # This is not pre-release.
-            # If the other is pre-release or dev, we are greater, which is ! <
-            # If the other is not pre-release, we are equal, which is ! <
-            return False
+        return this_key < other_key
 
     def __le__(self, other):
         return self == other or self < other
@@ -165,92 +422,64 @@ class SemanticVersion(object):
             ever released - we're treating that as a critical bug that we ever
             made them and have stopped doing that.
         """
-        input_components = version_string.split('.')
-        # decimals first (keep pre-release and dev/hashes to the right)
-        components = [c for c in input_components if c.isdigit()]
-        digit_len = len(components)
-        if digit_len == 0:
-            raise ValueError("Invalid version %r" % version_string)
-        elif digit_len < 3:
-            if (digit_len < len(input_components) and
-                    input_components[digit_len][0].isdigit()):
-                # Handle X.YaZ - Y is a digit not a leadin to pre-release.
-                mixed_component = input_components[digit_len]
-                last_component = ''.join(itertools.takewhile(
-                    lambda x: x.isdigit(), mixed_component))
-                components.append(last_component)
-                input_components[digit_len:digit_len + 1] = [
-                    last_component, mixed_component[len(last_component):]]
-                digit_len += 1
-            components.extend([0] * (3 - digit_len))
-        components.extend(input_components[digit_len:])
-        major = int(components[0])
-        minor = int(components[1])
-        dev_count = None
-        prerelease_type = None
-        prerelease = None
-        githash = None
-
-        def _parse_type(segment):
-            # Discard leading digits (the 0 in 0a1)
-            isdigit = operator.methodcaller('isdigit')
-            segment = ''.join(itertools.dropwhile(isdigit, segment))
-            isalpha = operator.methodcaller('isalpha')
-            prerelease_type = ''.join(itertools.takewhile(isalpha, segment))
-            prerelease = segment[len(prerelease_type)::]
-            return prerelease_type, int(prerelease)
-        if _is_int(components[2]):
-            patch = int(components[2])
-        else:
-            # legacy version e.g. 1.2.0a1 (canonical is 1.2.0.0a1)
-            # or 1.2.dev4.g1234 or 1.2.b4
-            patch = 0
-            components[2:2] = [0]
-        remainder = components[3:]
-        remainder_starts_with_int = False
-        try:
-            if remainder and int(remainder[0]):
-                remainder_starts_with_int = True
-        except ValueError:
-            pass
-        if remainder_starts_with_int:
-            # old dev format - 0.1.2.3.g1234
-            dev_count = int(remainder[0])
-        else:
-            if remainder and (remainder[0][0] == '0' or
-                              remainder[0][0] in ('a', 'b', 'r')):
-                # Current RC/beta layout
-                prerelease_type, prerelease = _parse_type(remainder[0])
-                remainder = remainder[1:]
-            if remainder:
-                component = remainder[0]
-                if component.startswith('dev'):
-                    dev_count = int(component[3:])
-                elif component.startswith('g'):
-                    # git hash - so use a dev_count of 1 as we have to have one
-                    dev_count = 1
-                    githash = component[1:]
-                else:
-                    raise ValueError(
-                        'Unknown remainder %r in %r'
-                        % (remainder, version_string))
-        if len(remainder) > 1:
-                githash = remainder[1][1:]
-        return SemanticVersion(
-            major, minor, patch, prerelease_type=prerelease_type,
-            prerelease=prerelease, dev_count=dev_count, githash=githash)
+        semver = _pip_string_cache.get(version_string)
+        if semver is None:
+            semver = (_from_pip_string_re(version_string) or
+                      _from_pip_string_legacy(version_string))
+            if len(_pip_string_cache) >= _PIP_STRING_CACHE_SIZE:
+                _pip_string_cache.clear()
+            _pip_string_cache[version_string] = semver
+        return semver
+
+    @classmethod
+    def parse_many(klass, version_strings):
+        """Parse many version strings into a VersionBatch.
+
+        Strings that are not versions are skipped.
+        """
+        return VersionBatch(version_strings)
+
+    @classmethod
+    def sort_many(klass, version_strings, unique=False):
+        """Return the version strings that are versions, in version order.
+
+        :param unique: Keep only the first of strings for the same version.
+        """
+        return VersionBatch(version_strings).sorted(unique=unique)
+
+    @classmethod
+    def max_of(klass, version_strings):
+        """Return the highest of the version strings, or None if none are.
+
+        This orders versions as VersionBatch does, in a single pass that
+        keeps no columns.
+        """
+        highest = None
+        highest_key = None
+        for version_string, semver in _iter_versions(version_strings):
+            if highest_key is None or semver._key > highest_key:
+                highest = version_string
+                highest_key = semver._key
+        return highest
 
     def brief_string(self):
         """Return the short version minus any alpha/beta tags."""
         return "%s.%s.%s" % (self._major, self._minor, self._patch)
 
+    def components(self):
+        """Return the arguments that recreate this SemanticVersion."""
+        return (self._major, self._minor, self._patch, self._prerelease_type,
+                self._prerelease, self._dev_count, self._githash)
+
     def debian_string(self):
         """Return the version number to use when building a debian package.
 
         This translates the PEP440/semver precedence rules into Debian version
         sorting operators.
         """
-        return self._long_version("~", "+g")
+        if self._debian_string is None:
+            self._debian_string = self._long_version("~", "+g")
+        return self._debian_string
 
     def decrement(self, minor=False, major=False):
         """Return a decremented SemanticVersion.
@@ -356,7 +585,9 @@ class SemanticVersion(object):
 
         This including suffixes indicating VCS status.
         """
-        return self._long_version(".", ".g", "0")
+        if self._release_string is None:
+            self._release_string = self._long_version(".", ".g", "0")
+        return self._release_string
 
     def rpm_string(self):
         """Return the version number to use when building an RPM package.
@@ -366,7 +597,9 @@ class SemanticVersion(object):
         ~ operator in dpkg),  we show all prerelease versions as being versions
         of the release before.
         """
-        return self._long_version(None, "+g")
+        if self._rpm_string is None:
+            self._rpm_string = self._long_version(None, "+g")
+        return self._rpm_string
 
     def to_dev(self, dev_count, githash):
         """Return a development version of this semver.
@@ -416,6 +649,140 @@ class SemanticVersion(object):
         return tuple(segments)
 
 
+def _int_column(values):
+    try:
+        return array.array('l', values)
+    except OverflowError:
+        return list(values)
+
+
+# Below this many versions, sorting with numpy costs more than it saves.
+_NUMPY_MIN_VERSIONS = 10000
+_numpy = []
+
+
+def _get_numpy():
+    """Return numpy if it can be imported, else None."""
+    if not _numpy:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy.append(numpy)
+    return _numpy[0]
+
+
+def _iter_versions(version_strings):
+    """Yield (string, SemanticVersion) for the strings that are versions."""
+    for version_string in version_strings:
+        semver = _pip_string_cache.get(version_string)
+        if semver is None:
+            if not _DIGIT_COMPONENT_RE.search(version_string):
+                continue
+            try:
+                semver = SemanticVersion.from_pip_string(version_string)
+            except Exception:
+                # The legacy parser fails some shapes, such as '1.' or
+                # 'v1.0', with IndexError rather than ValueError.
+                continue
+        yield version_string, semver
+
+
+class VersionBatch(object):
+    """Many versions, parsed once and stored column by column.
+
+    Each component is kept in its own integer array, and each version is
+    ordered by a single integer key packed from them, so that sorting and
+    maxing compare integers rather than SemanticVersion objects. numpy is
+    used to sort large batches when it is available.
+
+    The orderings SemanticVersion leaves undefined are defined here: a
+    pre-release sorts before a dev build of the same release, and dev
+    builds differing only in their hash keep their input order.
+    """
+
+    def __init__(self, version_strings):
+        strings = []
+        semvers = []
+        for version_string, semver in _iter_versions(version_strings):
+            strings.append(version_string)
+            semvers.append(semver)
+        prerelease_types = sorted(set(
+            semver._prerelease_type for semver in semvers
+            if semver._prerelease_type))
+        type_ranks = dict(
+            (prerelease_type, rank + 1)
+            for rank, prerelease_type in enumerate(prerelease_types))
+        #: The version strings given that are versions, in the given order.
+        self.strings = strings
+        self.githashes = [semver._githash for semver in semvers]
+        self.major = _int_column(semver._major for semver in semvers)
+        self.minor = _int_column(semver._minor for semver in semvers)
+        self.patch = _int_column(semver._patch for semver in semvers)
+        self.stage = _int_column(semver._key[3] for semver in semvers)
+        self.prerelease_type = _int_column(
+            type_ranks.get(semver._prerelease_type, 0) for semver in semvers)
+        self.serial = _int_column(
+            semver._prerelease or semver._dev_count or 0
+            for semver in semvers)
+        self._keys = None
+        self._key_bits = None
+
+    def __len__(self):
+        return len(self.strings)
+
+    def keys(self):
+        """Return the integer sort key of each version."""
+        if self._keys is None:
+            columns = (self.major, self.minor, self.patch, self.stage,
+                       self.prerelease_type, self.serial)
+            widths = [len(bin(max(column or [0]))) - 2 for column in columns]
+            keys = [0] * len(self.strings)
+            for column, width in zip(columns, widths):
+                keys = [(key << width) | value
+                        for key, value in zip(keys, column)]
+            self._keys = keys
+            self._key_bits = sum(widths)
+        return self._keys
+
+    def order(self):
+        """Return the indices of the versions in version order."""
+        keys = self.keys()
+        numpy = None
+        if len(keys) >= _NUMPY_MIN_VERSIONS and self._key_bits < 63:
+            numpy = _get_numpy()
+        if numpy is not None:
+            return numpy.argsort(
+                numpy.array(keys, dtype=numpy.int64), kind='mergesort'
+            ).tolist()
+        return sorted(range(len(keys)), key=keys.__getitem__)
+
+    def sorted(self, unique=False):
+        """Return the version strings in version order.
+
+        :param unique: Keep only the first of strings for the same version.
+        """
+        order = self.order()
+        if unique:
+            keys = self.keys()
+            seen = set()
+            unique_order = []
+            for index in order:
+                identity = (keys[index], self.githashes[index])
+                if identity not in seen:
+                    seen.add(identity)
+                    unique_order.append(index)
+            order = unique_order
+        return [self.strings[index] for index in order]
+
+    def max(self):
+        """Return the version string of the highest version, or None."""
+        keys = self.keys()
+        if not keys:
+            return None
+        return self.strings[max(range(len(keys)), key=keys.__getitem__)]
+
+
 class VersionInfo(object):
 
     def __init__(self, package):
@@ -438,18 +805,35 @@ class VersionInfo(object):
         return "pbr.version.VersionInfo(%s:%s)" % (
             self.package, self.version_string())
 
-    def _get_version_from_pkg_resources(self):
-        """Obtain a version from pkg_resources or setup-time logic if missing.
+    def _get_version_from_module(self):
+        """Obtain a version from the module pbr wrote at build time.
 
-        This will try to get the version of the package from the pkg_resources
-        record associated with the package, and if there is no such record
-        falls back to the logic sdist would use.
+        Only packages that have already been imported are consulted, so
+        that looking a version up never imports a package.
         """
-        try:
-            requirement = pkg_resources.Requirement.parse(self.package)
-            provider = pkg_resources.get_provider(requirement)
-            result_string = provider.version
-        except pkg_resources.DistributionNotFound:
+        names = [self.package.replace('-', '_')]
+        if self.package.startswith('python-'):
+            names.append(names[0][len('python_'):])
+        for name in names:
+            if name not in sys.modules:
+                continue
+            try:
+                module = __import__(
+                    '%s.%s' % (name, VERSION_MODULE), fromlist=['semantic'])
+                return SemanticVersion(*module.semantic)
+            except (ImportError, AttributeError, TypeError):
+                continue
+        return None
+
+    def _get_version_from_metadata(self):
+        """Obtain a version from package metadata or setup-time logic.
+
+        This will try to get the version of the package from the installed
+        metadata for the package, and if there is no such record falls back
+        to the logic sdist would use.
+        """
+        result_string = _get_installed_version(self.package)
+        if result_string is None:
             # The most likely cause for this is running tests in a tree
             # produced from a tarball where the package itself has not been
             # installed into anything. Revert to setup-time logic.
@@ -464,10 +848,26 @@ class VersionInfo(object):
         """
         return self.semantic_version().release_string()
 
+    def _resolve_semantic_version(self):
+        """Look the version up once per process, whatever the threads."""
+        semantic = _semantic_versions.get(self.package)
+        if semantic is not None:
+            return semantic
+        with _lock:
+            package_lock = _package_locks.setdefault(
+                self.package, threading.Lock())
+        with package_lock:
+            semantic = _semantic_versions.get(self.package)
+            if semantic is None:
+                semantic = (self._get_version_from_module() or
+                            self._get_version_from_metadata())
+                _semantic_versions[self.package] = semantic
+        return semantic
+
     def semantic_version(self):
         """Return the SemanticVersion object for this version."""
         if self._semantic is None:
-            self._semantic = self._get_version_from_pkg_resources()
+            self._semantic = self._resolve_semantic_version()
         return self._semantic
 
     def version_string(self):
@@ -486,6 +886,8 @@ class VersionInfo(object):
         prefix and then cached and returned.
         """
         if not self._cached_version:
-            self._cached_version = "%s%s" % (prefix,
-                                             self.version_string())
+            cached_version = "%s%s" % (prefix, self.version_string())
+            with _lock:
+                if not self._cached_version:
+                    self._cached_version = cached_version
         return self._cached_version